@@ -11,7 +11,40 @@ from datetime import datetime
 mqtt_server = os.getenv('MQTT_SERVER', 'localhost')
 mqtt_port = int(os.getenv('MQTT_PORT', 1883))
 mqtt_topic = os.getenv('MQTT_TOPIC', 'sensor/data')
-publish_interval = int(os.getenv('PUBLISH_INTERVAL', 1))
+mqtt_qos = int(os.getenv('MQTT_QOS', 0))
+publish_interval = float(os.getenv('PUBLISH_INTERVAL', 1))  # Seconds between samples
+
+# single: one record per message; batch: samples are buffered and sent as one framed message once there are
+# BATCH_SIZE of them, or before the oldest would wait longer than BATCH_INTERVAL_MS. Frames then arrive up to
+# min(BATCH_SIZE * PUBLISH_INTERVAL, BATCH_INTERVAL_MS) apart: unless that is well under the subscriber's
+# 10 s offline threshold, give the subscription a `batch_span` metadata entry with that many seconds.
+publish_mode = os.getenv('PUBLISH_MODE', 'single')
+batch_size = int(os.getenv('BATCH_SIZE', 5))
+batch_interval_ms = int(os.getenv('BATCH_INTERVAL_MS', 0))  # 0: only BATCH_SIZE flushes a batch
+delta_encoding = os.getenv('DELTA_ENCODING', 'false').lower() == 'true'
+
+# Report by exception: a sample is only sent when a channel moved by more than its deadband since the last sent
+# sample, or as a heartbeat so that nothing is published for at most MAX_SILENCE seconds. The subscriber's
+# offline threshold follows the `max_silence` metadata entry of the subscription, which must match.
+# A record always carries all three channels, so one channel leaving its band sends and stores the other two as
+# well: the tightest band sets the rate. The defaults sit near typical sensor accuracy and cut messages and rows
+# about 12x against 1 s sampling; 0.5 / 2 / 20 keeps finer changes at about 4x, 1.5 / 5 / 50 reaches about 20x.
+# MAX_SILENCE caps the cut at MAX_SILENCE / PUBLISH_INTERVAL.
+deadband_mode = os.getenv('DEADBAND_MODE', 'false').lower() == 'true'
+deadband_temperature = float(os.getenv('DEADBAND_TEMPERATURE', 1))  # Degrees
+deadband_humidity = float(os.getenv('DEADBAND_HUMIDITY', 4))  # Percent
+deadband_co2_concentration = float(os.getenv('DEADBAND_CO2', 40))  # ppm
+max_silence = float(os.getenv('MAX_SILENCE', 60))  # Seconds
+
+# Payload layouts, decoded by sdmm-backend/payload_formats.py
+RECORD_FORMAT = '!16sQiII'
+DELTA_FORMAT = '!ihhh'  # Differences to the previous sample: timestamp, temperature, humidity, co2
+FRAME_HEADER = '!2sBBBH'  # magic, frame version, flags, format version, sample count
+FRAME_MAGIC = b'SB'
+FRAME_VERSION = 1
+FORMAT_VERSION = 1  # combined_v1 in sdmm-backend/payload_formats.yaml, the RECORD_FORMAT layout
+FLAG_DELTA = 0x01
+MAX_BATCH_SIZE = 0xFFFF
 
 device_id = uuid.uuid4()
 
@@ -36,16 +69,67 @@ def generate_sensor_data():
 
 
 def serialize_data(device_id, timestamp, temperature, humidity, co2_concentration):
-    return struct.pack('!16sQiII', device_id.bytes, timestamp, temperature, humidity, co2_concentration)
+    return struct.pack(RECORD_FORMAT, device_id.bytes, timestamp, temperature, humidity, co2_concentration)
+
+
+def exceeds_deadband(sample, reported):
+    # Samples are (timestamp, temperature in hundredths, humidity, co2_concentration)
+    deadbands = (deadband_temperature * 100, deadband_humidity, deadband_co2_concentration)
+    return any(abs(value - reported_value) > deadband
+               for value, reported_value, deadband in zip(sample[1:], reported[1:], deadbands))
+
+
+def serialize_batch(device_id, samples, delta=False):
+    # samples: [(timestamp, temperature, humidity, co2_concentration)]
+    records = None
+    if delta:
+        try:
+            records = [struct.pack(DELTA_FORMAT, *(value - previous_value for value, previous_value in
+                                                   zip(sample, previous)))
+                       for previous, sample in zip(samples, samples[1:])]
+        except struct.error:
+            records = None  # A difference too large for its field: send the batch unencoded
+    flags = FLAG_DELTA if records is not None else 0
+    if records is None:
+        records = [serialize_data(device_id, *sample) for sample in samples[1:]]
+    header = struct.pack(FRAME_HEADER, FRAME_MAGIC, FRAME_VERSION, flags, FORMAT_VERSION, len(samples))
+    return header + serialize_data(device_id, *samples[0]) + b''.join(records)
 
 
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 client.connect(mqtt_server, mqtt_port, 60)
+client.loop_start()  # Network I/O, keepalives and QoS acknowledgements on paho's thread
 
+samples = []
+batch_started = None
+reported = None  # Last sample sent or buffered, the reference of the deadbands
+last_published = time.monotonic()
+next_sample = time.monotonic()
 while True:
     timestamp = int(time.time())
-    temperature_t, humidity_t, co2_concentration_t = generate_sensor_data()
-    payload = serialize_data(device_id, timestamp,
-                             temperature_t, humidity_t, co2_concentration_t)
-    client.publish(mqtt_topic, payload)
-    time.sleep(publish_interval)
+    sample = (timestamp, *generate_sensor_data())
+    now = time.monotonic()
+    # Sent with this sample rather than after the next one, which would be past MAX_SILENCE
+    heartbeat_due = deadband_mode and now - last_published + publish_interval > max_silence
+
+    if not deadband_mode or heartbeat_due or reported is None or exceeds_deadband(sample, reported):
+        reported = sample
+        if publish_mode == 'batch':
+            if not samples:
+                batch_started = now
+            samples.append(sample)
+        else:
+            client.publish(mqtt_topic, serialize_data(device_id, *sample), qos=mqtt_qos)
+            last_published = now
+
+    if samples:
+        batch_age_ms = (now - batch_started) * 1000
+        if (len(samples) >= min(batch_size, MAX_BATCH_SIZE) or heartbeat_due
+                or (batch_interval_ms and batch_age_ms + publish_interval * 1000 > batch_interval_ms)):
+            client.publish(mqtt_topic, serialize_batch(device_id, samples, delta_encoding), qos=mqtt_qos)
+            samples = []
+            last_published = now
+
+    # Sleep until the next sample is due rather than for a fixed time, so publishing does not drift
+    next_sample += publish_interval
+    time.sleep(max(next_sample - time.monotonic(), 0))
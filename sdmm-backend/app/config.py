@@ -1,5 +1,8 @@
 # app/config.py
 
+import os
+
+
 class Config:
     DB_HOST = 'sdmm_db'
     DB_PORT = 3306
@@ -9,3 +12,19 @@ class Config:
 
     SQLALCHEMY_DATABASE_URI = f'mysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Monthly RANGE partitioning of SensorData (see app/partitioning.py)
+    SENSOR_DATA_PARTITIONING = os.getenv('SENSOR_DATA_PARTITIONING', 'false').lower() == 'true'
+    SENSOR_DATA_PARTITIONS_AHEAD = int(os.getenv('SENSOR_DATA_PARTITIONS_AHEAD', 3))
+    SENSOR_DATA_RETENTION_MONTHS = int(os.getenv('SENSOR_DATA_RETENTION_MONTHS', 0))  # 0 keeps all months
+
+    # Keyset pages and streamed responses of the list endpoints (see app/pagination.py)
+    API_DEFAULT_PAGE_SIZE = int(os.getenv('API_DEFAULT_PAGE_SIZE', 100))
+    API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
+    API_STREAM_CHUNK_SIZE = int(os.getenv('API_STREAM_CHUNK_SIZE', 1000))
+
+    # A condition that repeats within this many seconds of its alert being resolved does not open a new alert
+    ALERT_COOLDOWN = int(os.getenv('ALERT_COOLDOWN', 300))
+
+    # Server-sent live feed (see app/live_feed.py): at most this many flushes per second per client
+    LIVE_FEED_MAX_RATE = float(os.getenv('LIVE_FEED_MAX_RATE', 2))
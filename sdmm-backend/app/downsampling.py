@@ -0,0 +1,72 @@
+# app/downsampling.py
+
+import numpy as np
+
+DOWNSAMPLING_METHODS = ('lttb', 'minmax')
+MIN_POINTS = 3  # Smallest useful max_points: both endpoints and one point in between
+
+
+def lttb_indices(x, y, threshold):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, for every bucket in between,
+    # the point forming the largest triangle with the previously kept point and the next bucket's average
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return endpoint_indices(n, threshold)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.append(np.linspace(1, n - 1, threshold - 1).astype(np.int64), n)
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end, next_end = edges[i], edges[i + 1], edges[i + 2]
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+        areas = np.abs((x[previous] - average_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (average_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        indices[i + 1] = previous
+    return indices
+
+
+def minmax_indices(y, threshold):
+    # Minimum and maximum of each of threshold / 2 equally sized buckets, in time order
+    n = len(y)
+    buckets = threshold // 2
+    if threshold >= n:
+        return np.arange(n)
+    if buckets < 1:
+        return endpoint_indices(n, threshold)
+
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+
+    # The padding lands in the last bucket only, so every row has at least one real value
+    rows = np.flatnonzero(~np.all(np.isnan(padded), axis=1))
+    offsets = rows * size
+    minimums = offsets + np.nanargmin(padded[rows], axis=1)
+    maximums = offsets + np.nanargmax(padded[rows], axis=1)
+    return np.unique(np.concatenate((minimums, maximums)))
+
+
+def endpoint_indices(n, threshold):
+    # Too few points for any bucket: the first and last points, or only the last one for a threshold of 1
+    return np.array([n - 1]) if threshold < 2 else np.array([0, n - 1])
+
+
+def downsample(timestamps, values, max_points, method='lttb'):
+    # timestamps: datetime64 array, values: float array; returns both reduced to at most max_points
+    if len(values) <= max_points:
+        return timestamps, values
+    if method == 'minmax':
+        indices = minmax_indices(values, max_points)
+    else:
+        indices = lttb_indices(timestamps.astype('datetime64[ms]').astype(np.int64), values, max_points)
+    return timestamps[indices], values[indices]
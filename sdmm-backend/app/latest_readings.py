@@ -0,0 +1,68 @@
+# app/latest_readings.py
+
+import threading
+
+from sqlalchemy import and_, func
+
+from app.models import db, SensorData
+from app.repository import parse_timestamp
+
+
+class LatestReadings:
+    # Most recent (timestamp, value) per sensor and type, kept current by the ingest routes so the
+    # sensor board never has to look up the last row of SensorData per sensor
+    def __init__(self):
+        self.readings = {}  # sensor_id -> {type_id: (timestamp, value)}
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()  # One cold-start load, which concurrent first requests wait for
+
+    def update(self, readings):
+        with self.lock:
+            for reading in readings:
+                try:
+                    timestamp = parse_timestamp(reading.get('timestamp'))
+                except ValueError:
+                    continue  # Only readings forwarded by /api/live/publish are not validated beforehand
+                value = reading.get('value')
+                if timestamp is None or value is None:
+                    continue
+                self._merge(reading['sensor_id'], reading['type_id'], timestamp, value)
+
+    def _merge(self, sensor_id, type_id, timestamp, value):
+        # Late or replayed readings never replace a newer value
+        by_type = self.readings.setdefault(sensor_id, {})
+        current = by_type.get(type_id)
+        if current is None or current[0] <= timestamp:
+            by_type[type_id] = (timestamp, value)
+
+    def load(self):
+        # Cold start: the last row per sensor and type, read from the covering index in one query
+        latest = db.session.query(
+            SensorData.sensor_id, SensorData.type_id, func.max(SensorData.timestamp).label('timestamp')
+        ).filter(SensorData.is_deleted == False).group_by(SensorData.sensor_id, SensorData.type_id).subquery()
+        rows = db.session.query(SensorData.sensor_id, SensorData.type_id, SensorData.timestamp, SensorData.value).join(
+            latest, and_(SensorData.sensor_id == latest.c.sensor_id, SensorData.type_id == latest.c.type_id,
+                         SensorData.timestamp == latest.c.timestamp)
+        ).filter(SensorData.is_deleted == False).all()
+
+        with self.lock:
+            for sensor_id, type_id, timestamp, value in rows:
+                self._merge(sensor_id, type_id, timestamp, value)
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self.load_lock:
+            if not self.loaded:
+                self.load()
+
+    def get_all(self):
+        self.ensure_loaded()
+        with self.lock:
+            return {sensor_id: dict(by_type) for sensor_id, by_type in self.readings.items()}
+
+
+# One cache per API process, shared by all request threads
+latest_readings = LatestReadings()
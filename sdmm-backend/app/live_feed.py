@@ -0,0 +1,97 @@
+# app/live_feed.py
+
+import threading
+import time
+
+LIVE_TOPICS = ('readings', 'status', 'alerts')
+
+
+class LiveFeedClient:
+    # Pending events are keyed per topic and entity (a sensor's reading of one type, a sensor's status, an alert),
+    # so a slow or rate-limited client only ever receives the latest state of each instead of a backlog
+    def __init__(self, topics, sensor_ids, max_rate):
+        self.topics = topics
+        self.sensor_ids = sensor_ids
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.last_flush = 0.0
+        self.coalesced = 0
+
+    def wants(self, topic, sensor_id):
+        return topic in self.topics and (not self.sensor_ids or sensor_id in self.sensor_ids)
+
+    def offer(self, topic, key, payload):
+        with self.condition:
+            if (topic, key) in self.pending:
+                self.coalesced += 1
+            self.pending[(topic, key)] = payload
+            self.condition.notify()
+
+    def next_events(self, timeout):
+        # Waits for events, then at most one flush per interval; returns [] on timeout (used for keep-alives)
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while not self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self.condition.wait(remaining)
+
+        delay = self.last_flush + self.interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)  # Events keep being merged into pending meanwhile
+
+        with self.condition:
+            events = [(topic, payload) for (topic, _), payload in self.pending.items()]
+            self.pending = {}
+        self.last_flush = time.monotonic()
+        return events
+
+
+class LiveFeed:
+    def __init__(self):
+        self.clients = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, topics, sensor_ids, max_rate):
+        client = LiveFeedClient(topics, sensor_ids, max_rate)
+        with self.lock:
+            self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def publish(self, topic, key, sensor_id, payload):
+        with self.lock:
+            clients = [client for client in self.clients if client.wants(topic, sensor_id)]
+        for client in clients:
+            client.offer(topic, key, payload)
+
+    def publish_readings(self, readings):
+        with self.lock:
+            clients = [client for client in self.clients if 'readings' in client.topics]
+        if not clients:
+            return
+        for reading in readings:
+            payload = {
+                'sensor_id': reading['sensor_id'],
+                'type_id': reading['type_id'],
+                'timestamp': reading.get('timestamp'),
+                'value': reading.get('value')
+            }
+            for client in clients:
+                if client.wants('readings', reading['sensor_id']):
+                    client.offer('readings', (reading['sensor_id'], reading['type_id']), payload)
+
+    def publish_status(self, sensor_id, status, timestamp):
+        self.publish('status', sensor_id, sensor_id, {'sensor_id': sensor_id, 'status': status, 'timestamp': timestamp})
+
+    def publish_alert(self, alert):
+        self.publish('alerts', alert['alert_id'], alert['sensor_id'], alert)
+
+
+# One feed per API process; the subscriber process forwards its events over HTTP when it writes to the database
+live_feed = LiveFeed()
@@ -0,0 +1,45 @@
+# app/migrations.py
+
+import os
+
+from sqlalchemy import text
+
+from app.models import db
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def split_statements(sql):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def run_migrations():
+    db.session.execute(text(
+        'CREATE TABLE IF NOT EXISTS SchemaMigrations ('
+        'version VARCHAR(255) PRIMARY KEY, '
+        'applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+    ))
+    db.session.commit()
+
+    applied = {version for (version,) in db.session.execute(text('SELECT version FROM SchemaMigrations'))}
+
+    newly_applied = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        version, extension = os.path.splitext(filename)
+        if extension != '.sql' or version in applied:
+            continue
+
+        with open(os.path.join(MIGRATIONS_DIR, filename), 'r') as file:
+            statements = split_statements(file.read())
+
+        # MySQL commits DDL implicitly, so a migration is recorded only after all of its statements ran.
+        # no_parameters keeps the driver from treating '%' in DATE_FORMAT patterns as placeholders.
+        connection = db.session.connection()
+        for statement in statements:
+            connection.exec_driver_sql(statement, execution_options={'no_parameters': True})
+        db.session.execute(text('INSERT INTO SchemaMigrations (version) VALUES (:version)'), {'version': version})
+        db.session.commit()
+        newly_applied.append(version)
+
+    return newly_applied
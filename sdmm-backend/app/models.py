@@ -34,6 +34,12 @@ class Sensor(db.Model):
 
 class Alert(db.Model):
     __tablename__ = 'Alerts'
+    __table_args__ = (
+        # Created by migrations/0003_alerts_created_at_index.sql
+        db.Index('idx_alerts_created_at', 'created_at', 'alert_id'),
+        # Created by migrations/0005_alert_deduplication.sql
+        db.Index('idx_alerts_dedup', 'sensor_id', 'alert_type', 'condition_key', 'is_deleted', 'status'),
+    )
 
     alert_id = db.Column(CHAR(36), primary_key=True)
     sensor_id = db.Column(CHAR(36), db.ForeignKey('Sensors.sensor_id'), nullable=False)
@@ -42,6 +48,11 @@ class Alert(db.Model):
     created_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
     is_deleted = db.Column(db.Boolean, default=False)
     status = db.Column(ENUM('new', 'acknowledged', 'resolved'), default='new')
+    # Deduplication: repeats of the same condition bump occurrences/last_seen_at of the open alert
+    condition_key = db.Column(db.String(255))
+    occurrences = db.Column(db.Integer, nullable=False, default=1)
+    last_seen_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
+    resolved_at = db.Column(db.TIMESTAMP, nullable=True)
 
     def to_dict(self):
         return {
@@ -51,7 +62,11 @@ class Alert(db.Model):
             'message': self.message,
             'created_at': self.created_at,
             'is_deleted': self.is_deleted,
-            'status': self.status
+            'status': self.status,
+            'condition': self.condition_key,
+            'occurrences': self.occurrences,
+            'last_seen_at': self.last_seen_at,
+            'resolved_at': self.resolved_at
         }
 
 
@@ -95,6 +110,10 @@ class SensorTypeMapping(db.Model):
 
 class SensorData(db.Model):
     __tablename__ = 'SensorData'
+    __table_args__ = (
+        # Created by migrations/0001_sensor_data_covering_index.sql
+        db.Index('idx_sensor_data_sensor_type_time', 'sensor_id', 'type_id', 'timestamp', 'is_deleted', 'value'),
+    )
 
     data_id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     sensor_id = db.Column(CHAR(36), db.ForeignKey('Sensors.sensor_id'))
@@ -120,6 +139,31 @@ class SensorData(db.Model):
         }
 
 
+class SensorDataRollup(db.Model):
+    __tablename__ = 'SensorDataRollups'
+
+    resolution = db.Column(ENUM('1m', '1h', '1d'), primary_key=True)
+    sensor_id = db.Column(CHAR(36), primary_key=True)
+    type_id = db.Column(CHAR(36), primary_key=True)
+    bucket_start = db.Column(db.TIMESTAMP, primary_key=True)
+    value_sum = db.Column(db.Float(precision=53), nullable=False, default=0)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+    value_min = db.Column(db.Float)
+    value_max = db.Column(db.Float)
+
+    def to_dict(self):
+        return {
+            'resolution': self.resolution,
+            'sensor_id': self.sensor_id,
+            'type_id': self.type_id,
+            'bucket_start': self.bucket_start,
+            'avg': self.value_sum / self.value_count if self.value_count else None,
+            'min': self.value_min,
+            'max': self.value_max,
+            'count': self.value_count
+        }
+
+
 class SensorMetadata(db.Model):
     __tablename__ = 'SensorMetadata'
 
@@ -166,3 +210,62 @@ class SensorStatusHistory(db.Model):
             'timestamp': self.timestamp,
             'created_at': self.created_at
         }
+
+
+class SensorCurrentStatus(db.Model):
+    __tablename__ = 'SensorCurrentStatus'
+    __table_args__ = (
+        # Created by migrations/0004_sensor_current_status.sql
+        db.Index('idx_sensor_current_status_status', 'status'),
+    )
+
+    sensor_id = db.Column(CHAR(36), db.ForeignKey('Sensors.sensor_id'), primary_key=True)
+    status = db.Column(ENUM('normal', 'warning', 'offline', 'disabled'))
+    status_id = db.Column(db.BigInteger, nullable=False)  # Latest SensorStatusHistory row
+    timestamp = db.Column(db.TIMESTAMP)
+    updated_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+    def to_dict(self):
+        return {
+            'sensor_id': self.sensor_id,
+            'status': self.status,
+            'status_id': self.status_id,
+            'timestamp': self.timestamp,
+            'updated_at': self.updated_at
+        }
+
+
+class Subscription(db.Model):
+    __tablename__ = 'Subscriptions'
+    __table_args__ = (
+        # Created by migrations/0006_subscriptions.sql
+        db.Index('idx_subscriptions_sensor_name', 'sensor_name'),
+        db.Index('idx_subscriptions_version', 'version'),
+    )
+
+    subscription_id = db.Column(CHAR(36), primary_key=True)
+    sensor_name = db.Column(db.String(255), nullable=False)
+    broker_address = db.Column(db.String(255), nullable=False)
+    broker_port = db.Column(db.Integer, nullable=False)
+    topic = db.Column(db.String(255), nullable=False)
+    username = db.Column(db.String(255))
+    password = db.Column(db.String(255))
+    sensor_types = db.Column(db.JSON)
+    metadata_ = db.Column('metadata', db.JSON)  # 'metadata' is reserved by declarative models
+    version = db.Column(db.BigInteger, nullable=False)  # Store version of the last write to this row
+    is_deleted = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp())
+    updated_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+    def to_dict(self):
+        # Same shape as an entry of subscriptions.yaml
+        return {
+            'broker_address': self.broker_address,
+            'broker_port': self.broker_port,
+            'topic': self.topic,
+            'username': self.username,
+            'password': self.password,
+            'sensor_types': self.sensor_types,
+            'sensor_name': self.sensor_name,
+            'metadata': self.metadata_
+        }
@@ -0,0 +1,117 @@
+# app/pagination.py
+
+import base64
+import json
+from datetime import datetime
+
+from flask import Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import and_, or_
+
+STREAM_FORMATS = ('ndjson', 'json')
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    # Opaque cursor holding the sort key of the last returned row
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise PaginationError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise PaginationError('Invalid cursor')
+
+    try:
+        return [datetime.fromisoformat(value) if column.type.python_type is datetime else value
+                for column, value in zip(columns, values)]
+    except (TypeError, ValueError):
+        raise PaginationError('Invalid cursor')
+
+
+def keyset_filter(columns, values, descending=False):
+    # (a, b) > (x, y) spelled out as a > x OR (a = x AND b > y) so MySQL can range-scan the index
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        bound = column < value if descending else column > value
+        conditions.append(and_(*[c == v for c, v in zip(columns[:i], values[:i])], bound))
+    return or_(*conditions)
+
+
+def wants_page():
+    return 'limit' in request.args or 'cursor' in request.args
+
+
+def wants_stream():
+    return 'stream' in request.args
+
+
+def page_limit():
+    max_page_size = current_app.config['API_MAX_PAGE_SIZE']
+    limit = request.args.get('limit', current_app.config['API_DEFAULT_PAGE_SIZE'], type=int)
+    if limit is None or limit <= 0:
+        raise PaginationError('limit must be a positive integer')
+    return min(limit, max_page_size)
+
+
+def paginate(query, columns, serialize, descending=False):
+    # Keyset page ordered by columns: {'items': [...], 'next_cursor': <cursor or None>}
+    limit = page_limit()
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(keyset_filter(columns, decode_cursor(cursor, columns), descending))
+
+    order = [column.desc() for column in columns] if descending else list(columns)
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+    return jsonify({'items': [serialize(row) for row in rows], 'next_cursor': next_cursor}), 200
+
+
+def stream(query, columns, serialize, descending=False):
+    # Streams every matching row from a server-side cursor, as NDJSON or as one chunked JSON array
+    stream_format = request.args.get('stream')
+    if stream_format not in STREAM_FORMATS:
+        raise PaginationError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+
+    order = [column.desc() for column in columns] if descending else list(columns)
+    rows = query.order_by(*order).yield_per(current_app.config['API_STREAM_CHUNK_SIZE'])
+    dumps = current_app.json.dumps
+
+    def generate_ndjson():
+        for row in rows:
+            yield dumps(serialize(row)) + '\n'
+
+    def generate_json():
+        yield '['
+        separator = ''
+        for row in rows:
+            yield separator + dumps(serialize(row))
+            separator = ','
+        yield ']\n'
+
+    if stream_format == 'ndjson':
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+    return Response(stream_with_context(generate_json()), mimetype='application/json')
+
+
+def list_response(query, columns, serialize, descending=False):
+    # Routes keep returning the full list unless a page (limit/cursor) or a stream is asked for
+    try:
+        if wants_stream():
+            return stream(query, columns, serialize, descending)
+        if wants_page():
+            return paginate(query, columns, serialize, descending)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return None
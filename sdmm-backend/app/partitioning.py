@@ -0,0 +1,110 @@
+# app/partitioning.py
+
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.models import db
+
+# Monthly RANGE partitioning of SensorData on timestamp, so that whole months can be dropped cheaply.
+# MySQL requires the partitioning column in every unique key and does not support foreign keys on
+# partitioned InnoDB tables, so enabling it widens the primary key to (data_id, timestamp) and drops
+# the SensorData foreign keys. Converting an existing table copies it once.
+
+TABLE_NAME = 'SensorData'
+
+
+def month_start(year, month):
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+
+def partition_name(start):
+    return start.strftime('p%Y%m')
+
+
+def partition_definition(start):
+    end = month_start(start.year, start.month + 1)
+    return (f"PARTITION {partition_name(start)} "
+            f"VALUES LESS THAN (UNIX_TIMESTAMP('{end.strftime('%Y-%m-%d %H:%M:%S')}'))")
+
+
+def get_partitions():
+    rows = db.session.execute(text(
+        'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL '
+        'ORDER BY PARTITION_ORDINAL_POSITION'
+    ), {'table': TABLE_NAME})
+    return [name for (name,) in rows]
+
+
+def enable_sensor_data_partitioning(months_ahead=3):
+    if get_partitions():
+        return False
+
+    connection = db.session.connection()
+
+    foreign_keys = db.session.execute(text(
+        'SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS '
+        'WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = :table'
+    ), {'table': TABLE_NAME})
+    for (constraint_name,) in foreign_keys.fetchall():
+        connection.exec_driver_sql(f'ALTER TABLE {TABLE_NAME} DROP FOREIGN KEY {constraint_name}')
+
+    # The partitioning column must be part of the primary key and therefore NOT NULL
+    connection.exec_driver_sql(f'UPDATE {TABLE_NAME} SET timestamp = created_at WHERE timestamp IS NULL')
+    connection.exec_driver_sql(f'ALTER TABLE {TABLE_NAME} '
+                               f'MODIFY timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP, '
+                               f'DROP PRIMARY KEY, ADD PRIMARY KEY (data_id, timestamp)')
+
+    oldest = db.session.execute(text(f'SELECT MIN(timestamp) FROM {TABLE_NAME}')).scalar() or datetime.now()
+    now = datetime.now()
+    months = []
+    start = month_start(oldest.year, oldest.month)
+    last = month_start(now.year, now.month + months_ahead)
+    while start <= last:
+        months.append(start)
+        start = month_start(start.year, start.month + 1)
+
+    definitions = [partition_definition(start) for start in months]
+    definitions.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+    connection.exec_driver_sql(f'ALTER TABLE {TABLE_NAME} PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) '
+                               f'({", ".join(definitions)})')
+    db.session.commit()
+    return True
+
+
+def ensure_sensor_data_partitions(months_ahead=3):
+    # Split the catch-all pmax partition so that upcoming months get their own partitions
+    existing = set(get_partitions())
+    if not existing:
+        return []
+
+    now = datetime.now()
+    missing = []
+    for offset in range(months_ahead + 1):
+        start = month_start(now.year, now.month + offset)
+        if partition_name(start) not in existing:
+            missing.append(start)
+    if not missing:
+        return []
+
+    definitions = [partition_definition(start) for start in missing]
+    definitions.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+    db.session.connection().exec_driver_sql(f'ALTER TABLE {TABLE_NAME} REORGANIZE PARTITION pmax INTO '
+                                            f'({", ".join(definitions)})')
+    db.session.commit()
+    return [partition_name(start) for start in missing]
+
+
+def drop_sensor_data_partitions(retention_months):
+    # Dropping a partition removes a whole month without a row-by-row DELETE
+    now = datetime.now()
+    cutoff = partition_name(month_start(now.year, now.month - retention_months))
+    expired = [name for name in get_partitions() if name != 'pmax' and name < cutoff]
+    if not expired:
+        return []
+
+    db.session.connection().exec_driver_sql(f'ALTER TABLE {TABLE_NAME} DROP PARTITION {", ".join(expired)}')
+    db.session.commit()
+    return expired
@@ -0,0 +1,309 @@
+# app/repository.py
+
+import math
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, literal_column
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.models import (db, Alert, Sensor, SensorType, SensorData, SensorDataRollup, SensorStatusHistory,
+                        SensorCurrentStatus)
+
+ROLLUP_RESOLUTIONS = {'1m': 60, '1h': 60 * 60, '1d': 24 * 60 * 60}
+
+MYSQL_DEADLOCK_ERRORS = (1205, 1213)  # Lock wait timeout, deadlock: the transaction was rolled back
+
+# Alerts whose condition has cleared when a sensor moves from the given status back to 'normal'
+RECOVERED_ALERT_TYPES = {'warning': 'threshold breach', 'offline': 'connection issue'}
+
+
+def find_missing_references(readings):
+    # Look up every distinct sensor and type once per batch instead of once per row
+    sensor_ids = {reading['sensor_id'] for reading in readings}
+    found_sensor_ids = {sensor_id for (sensor_id,) in
+                        db.session.query(Sensor.sensor_id).filter(Sensor.sensor_id.in_(sensor_ids))}
+
+    type_ids = {reading['type_id'] for reading in readings}
+    found_type_ids = {type_id for (type_id,) in
+                      db.session.query(SensorType.type_id).filter(SensorType.type_id.in_(type_ids))}
+
+    return sensor_ids - found_sensor_ids, type_ids - found_type_ids
+
+
+def split_valid_readings(readings):
+    return partition_readings(readings, *find_missing_references(readings))
+
+
+def partition_readings(readings, missing_sensor_ids, missing_type_ids):
+    # (valid, rejected) given the unknown sensor and type ids of the batch
+    if not missing_sensor_ids and not missing_type_ids:
+        return readings, []
+
+    valid, rejected = [], []
+    for reading in readings:
+        if reading['sensor_id'] in missing_sensor_ids or reading['type_id'] in missing_type_ids:
+            rejected.append(reading)
+        else:
+            valid.append(reading)
+    return valid, rejected
+
+
+def parse_timestamp(timestamp):
+    # Timestamps are stored, cached and compared as naive UTC datetimes. ISO 8601 strings are accepted with or
+    # without an offset or 'Z'; naive ones are taken as UTC. Raises ValueError for anything else.
+    if timestamp is None or (isinstance(timestamp, datetime) and timestamp.tzinfo is None):
+        return timestamp
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp[:-1] + '+00:00' if timestamp.endswith('Z') else timestamp)
+        except ValueError:
+            raise ValueError(f"Invalid timestamp {timestamp!r}, expected ISO 8601") from None
+    if not isinstance(timestamp, datetime):
+        raise ValueError(f"Invalid timestamp {timestamp!r}, expected ISO 8601")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def parse_value(value):
+    # Readings have always been accepted as numbers or numeric strings, which MySQL coerces on insert; the
+    # rollups add and compare them, so they are coerced here instead. Raises ValueError for anything else.
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"Invalid value {value!r}, expected a number")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid value {value!r}, expected a number") from None
+    if not math.isfinite(number):
+        raise ValueError(f"Invalid value {value!r}, expected a finite number")
+    return number
+
+
+def normalize_reading(reading):
+    # Validated copy of a posted reading, done before anything is stored so that the rollups and the
+    # latest-reading cache only ever see the stored values
+    return dict(reading, timestamp=parse_timestamp(reading.get('timestamp')), value=parse_value(reading.get('value')))
+
+
+def bulk_insert_sensor_data(readings):
+    # One multi-row INSERT in one transaction
+    if not readings:
+        return 0
+    try:
+        db.session.execute(insert(SensorData).values([{
+            'sensor_id': reading['sensor_id'],
+            'type_id': reading['type_id'],
+            'timestamp': reading.get('timestamp'),
+            'value': reading.get('value')
+        } for reading in readings]))
+        update_sensor_data_rollups(readings)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(readings)
+
+
+def insert_sensor_reading(reading):
+    # Single-row variant of bulk_insert_sensor_data that returns the row for its data_id; rollups are kept
+    # current the same way
+    row = SensorData(
+        sensor_id=reading['sensor_id'],
+        type_id=reading['type_id'],
+        timestamp=reading.get('timestamp'),
+        value=reading.get('value')
+    )
+    try:
+        db.session.add(row)
+        update_sensor_data_rollups([reading])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return row
+
+
+def rollup_bucket_start(timestamp, resolution):
+    if resolution == '1m':
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == '1h':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def update_sensor_data_rollups(readings):
+    # Pre-aggregate the batch per bucket, then merge into SensorDataRollups with one upsert
+    buckets = {}
+    for reading in readings:
+        timestamp, value = parse_timestamp(reading.get('timestamp')), reading.get('value')
+        if timestamp is None or value is None:
+            continue
+
+        for resolution in ROLLUP_RESOLUTIONS:
+            key = (resolution, reading['sensor_id'], reading['type_id'], rollup_bucket_start(timestamp, resolution))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [value, 1, value, value]
+            else:
+                bucket[0] += value
+                bucket[1] += 1
+                bucket[2] = min(bucket[2], value)
+                bucket[3] = max(bucket[3], value)
+
+    if not buckets:
+        return
+
+    statement = mysql_insert(SensorDataRollup).values([{
+        'resolution': resolution,
+        'sensor_id': sensor_id,
+        'type_id': type_id,
+        'bucket_start': bucket_start,
+        'value_sum': value_sum,
+        'value_count': value_count,
+        'value_min': value_min,
+        'value_max': value_max
+    } for (resolution, sensor_id, type_id, bucket_start), (value_sum, value_count, value_min, value_max)
+        in buckets.items()])
+    statement = statement.on_duplicate_key_update(
+        value_sum=SensorDataRollup.value_sum + statement.inserted.value_sum,
+        value_count=SensorDataRollup.value_count + statement.inserted.value_count,
+        value_min=func.least(SensorDataRollup.value_min, statement.inserted.value_min),
+        value_max=func.greatest(SensorDataRollup.value_max, statement.inserted.value_max)
+    )
+    db.session.execute(statement)
+
+
+def set_sensor_status(sensor_id, status):
+    # Appends to SensorStatusHistory and moves SensorCurrentStatus in the same transaction. A write that does not
+    # change the current status is collapsed: nothing is appended and the existing history row is returned.
+    # Returns (history, changed, resolved alerts); moving back to 'normal' resolves the open alerts of the
+    # condition that cleared, which ends their deduplication and starts their cooldown.
+    # A sensor's first status has no SensorCurrentStatus row to lock, so the subscriber and the alert process
+    # writing it at once both insert one: the loser's deadlock or duplicate key is retried once, and then
+    # finds and locks the winner's row.
+    try:
+        return write_sensor_status(sensor_id, status)
+    except IntegrityError:
+        return write_sensor_status(sensor_id, status)
+    except OperationalError as e:
+        if getattr(e.orig, 'args', (None,))[0] not in MYSQL_DEADLOCK_ERRORS:
+            raise
+        return write_sensor_status(sensor_id, status)
+
+
+def write_sensor_status(sensor_id, status):
+    try:
+        current = db.session.get(SensorCurrentStatus, sensor_id, with_for_update=True)
+        if current is not None and current.status == status:
+            history = db.session.get(SensorStatusHistory, current.status_id)
+            db.session.commit()
+            return history, False, []
+
+        resolved = []
+        if status == 'normal' and current is not None and current.status in RECOVERED_ALERT_TYPES:
+            resolved = resolve_open_alerts(sensor_id, RECOVERED_ALERT_TYPES[current.status])
+
+        history = SensorStatusHistory(sensor_id=sensor_id, status=status, timestamp=db.func.current_timestamp())
+        db.session.add(history)
+        db.session.flush()
+
+        if current is None:
+            current = SensorCurrentStatus(sensor_id=sensor_id)
+            db.session.add(current)
+        current.status = status
+        current.status_id = history.status_id
+        current.timestamp = history.timestamp
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return history, True, resolved
+
+
+def resolve_open_alerts(sensor_id, alert_type):
+    # Within the caller's transaction
+    alerts = Alert.query.filter_by(
+        sensor_id=sensor_id, alert_type=alert_type, is_deleted=False
+    ).filter(Alert.status != 'resolved').all()
+    for alert in alerts:
+        alert.status = 'resolved'
+        alert.resolved_at = db.func.current_timestamp()
+    return alerts
+
+
+def record_alert(sensor_id, alert_type, message, condition_key, cooldown):
+    # Returns (alert, outcome): 'created', 'updated' when an open alert for the same (sensor, alert_type, condition)
+    # absorbed it, or 'suppressed' when the same condition was resolved less than `cooldown` seconds ago
+    try:
+        alert = Alert.query.filter_by(
+            sensor_id=sensor_id, alert_type=alert_type, condition_key=condition_key, is_deleted=False
+        ).order_by(Alert.created_at.desc()).with_for_update().first()
+
+        outcome = 'created'
+        if alert is not None and alert.status != 'resolved':
+            outcome = 'updated'
+        elif (alert is not None and alert.resolved_at is not None and
+              alert.resolved_at > datetime.now() - timedelta(seconds=cooldown)):
+            outcome = 'suppressed'
+
+        if outcome == 'created':
+            alert = Alert(
+                alert_id=str(uuid.uuid4()),
+                sensor_id=sensor_id,
+                alert_type=alert_type,
+                message=message,
+                condition_key=condition_key
+            )
+            db.session.add(alert)
+        else:
+            alert.occurrences = Alert.occurrences + 1
+            alert.last_seen_at = db.func.current_timestamp()
+            if outcome == 'updated':
+                alert.message = message
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return alert, outcome
+
+
+def aggregate_sensor_data(sensor_ids, type_ids=None, start_time=None, end_time=None, bucket=None):
+    # avg/min/max/count/stddev per sensor and type, optionally split into buckets of `bucket` seconds
+    columns = [
+        SensorData.sensor_id,
+        SensorData.type_id,
+        func.avg(SensorData.value).label('avg'),
+        func.min(SensorData.value).label('min'),
+        func.max(SensorData.value).label('max'),
+        func.count(SensorData.value).label('count'),
+        func.stddev_pop(SensorData.value).label('stddev')
+    ]
+    group_by = [SensorData.sensor_id, SensorData.type_id]
+
+    if bucket:
+        bucket_seconds = literal_column(str(int(bucket)))
+        bucket_start = func.from_unixtime(
+            func.floor(func.unix_timestamp(SensorData.timestamp) / bucket_seconds) * bucket_seconds)
+        columns.insert(2, bucket_start.label('bucket_start'))
+        group_by.append(bucket_start)
+
+    query = db.session.query(*columns).filter(
+        SensorData.sensor_id.in_(sensor_ids),
+        SensorData.is_deleted == 0
+    )
+    if type_ids:
+        query = query.filter(SensorData.type_id.in_(type_ids))
+    if start_time:
+        query = query.filter(SensorData.timestamp >= start_time)
+    if end_time:
+        query = query.filter(SensorData.timestamp <= end_time)
+
+    query = query.group_by(*group_by)
+    if bucket:
+        query = query.order_by(SensorData.sensor_id, SensorData.type_id, 'bucket_start')
+
+    return query.all()
@@ -3,6 +3,8 @@
 from app.routes.alerts_routes import alerts_bp
 from app.routes.dashboard_routes import dashboard_bp
 from app.routes.data_routes import data_bp
+from app.routes.export_routes import export_bp
+from app.routes.live_routes import live_bp
 from app.routes.mapping_routes import mapping_bp
 from app.routes.metadata_routes import metadata_bp
 from app.routes.sensor_board_routes import sensor_board_bp
@@ -16,6 +18,7 @@ def register_routes(app):
     app.register_blueprint(sensor_bp)
     app.register_blueprint(subscription_bp)
     app.register_blueprint(data_bp)
+    app.register_blueprint(export_bp)
     app.register_blueprint(status_bp)
     app.register_blueprint(mapping_bp)
     app.register_blueprint(metadata_bp)
@@ -23,3 +26,4 @@ def register_routes(app):
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(sensor_board_bp)
     app.register_blueprint(alerts_bp)
+    app.register_blueprint(live_bp)
@@ -1,16 +1,22 @@
 # app/routes/alerts_routes.py
 
-import uuid
-
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 
+from app.live_feed import live_feed
 from app.models import db, Alert, Sensor
+from app.pagination import list_response
+from app.repository import record_alert
 
 alerts_bp = Blueprint('alerts_bp', __name__)
 
 
 @alerts_bp.route('/api/alerts', methods=['GET'])
 def get_alerts():
+    # ?limit=&cursor= pages newest first, ?stream=ndjson|json streams every alert
+    response = list_response(Alert.query, [Alert.created_at, Alert.alert_id], Alert.to_dict, descending=True)
+    if response is not None:
+        return response
+
     alerts = Alert.query.all()
     return jsonify([alert.to_dict() for alert in alerts])
 
@@ -30,17 +36,18 @@ def create_alert():
     if sensor is None:
         return jsonify({'error': 'Sensor not found'}), 404
 
-    new_alert = Alert(
-        alert_id=str(uuid.uuid4()),
-        sensor_id=sensor_id,
-        alert_type=alert_type,
-        message=message
-    )
+    # Alerts are deduplicated on (sensor, alert_type, condition); without a condition the message is the condition
+    condition = data.get('condition') or message
+    alert, outcome = record_alert(sensor_id, alert_type, message, condition, current_app.config['ALERT_COOLDOWN'])
 
-    db.session.add(new_alert)
-    db.session.commit()
+    if outcome != 'suppressed':
+        live_feed.publish_alert(alert.to_dict())
 
-    return jsonify({'message': 'Alert created', 'alert_id': new_alert.alert_id}), 201
+    if outcome == 'created':
+        return jsonify({'message': 'Alert created', 'alert_id': alert.alert_id}), 201
+    if outcome == 'updated':
+        return jsonify({'message': 'Open alert updated', 'alert_id': alert.alert_id}), 200
+    return jsonify({'message': 'Alert suppressed during cooldown', 'alert_id': alert.alert_id}), 200
 
 
 @alerts_bp.route('/api/alerts/<alert_id>', methods=['DELETE'])
@@ -51,6 +58,7 @@ def delete_alert(alert_id):
 
     alert.is_deleted = True
     db.session.commit()
+    live_feed.publish_alert(alert.to_dict())
 
     return jsonify({'message': 'Alert marked as deleted'}), 200
 
@@ -66,6 +74,7 @@ def mark_alert_acknowledged(alert_id):
 
     alert.status = 'acknowledged'
     db.session.commit()
+    live_feed.publish_alert(alert.to_dict())
 
     return jsonify({'message': 'Alert marked as acknowledged'}), 200
 
@@ -77,7 +86,9 @@ def mark_alert_resolved(alert_id):
         return jsonify({'error': 'Alert not found'}), 404
 
     alert.status = 'resolved'
+    alert.resolved_at = db.func.current_timestamp()
     db.session.commit()
+    live_feed.publish_alert(alert.to_dict())
 
     return jsonify({'message': 'Alert marked as resolved'}), 200
 
@@ -90,5 +101,7 @@ def clear_all_alerts():
         alert.is_deleted = True
 
     db.session.commit()
+    for alert in alerts:
+        live_feed.publish_alert(alert.to_dict())
 
     return jsonify({'message': 'All alerts cleared'}), 200
@@ -3,28 +3,18 @@
 from flask import Blueprint, jsonify
 from sqlalchemy import func
 
-from app.models import db, SensorStatusHistory
+from app.models import db, SensorCurrentStatus
 
 dashboard_bp = Blueprint('dashboard_bp', __name__)
 
 
 @dashboard_bp.route('/api/dashboard/sensor-status-summary', methods=['GET'])
 def get_sensor_status_summary():
-    subquery = db.session.query(
-        SensorStatusHistory.sensor_id,
-        func.max(SensorStatusHistory.timestamp).label('latest_timestamp'),
-        func.max(SensorStatusHistory.status_id).label('latest_status_id')
-    ).group_by(SensorStatusHistory.sensor_id).subquery()
-
+    # One row per sensor, counted from the status index
     latest_status_query = db.session.query(
-        SensorStatusHistory.status,
-        func.count(SensorStatusHistory.sensor_id).label('count')
-    ).join(
-        subquery,
-        (SensorStatusHistory.sensor_id == subquery.c.sensor_id) &
-        (SensorStatusHistory.timestamp == subquery.c.latest_timestamp) &
-        (SensorStatusHistory.status_id == subquery.c.latest_status_id)
-    ).group_by(SensorStatusHistory.status).all()
+        SensorCurrentStatus.status,
+        func.count(SensorCurrentStatus.sensor_id).label('count')
+    ).group_by(SensorCurrentStatus.status).all()
 
     status_summary = {
         'normal': 0,
@@ -2,7 +2,12 @@
 
 from flask import Blueprint, request, jsonify
 
+from app.latest_readings import latest_readings
+from app.live_feed import live_feed
 from app.models import db, SensorData, Sensor, SensorType
+from app.pagination import list_response
+from app.repository import (find_missing_references, partition_readings, bulk_insert_sensor_data,
+                            insert_sensor_reading, aggregate_sensor_data, normalize_reading)
 
 data_bp = Blueprint('data_bp', __name__)
 
@@ -28,17 +33,68 @@ def get_sensor_data():
     if end_time:
         query = query.filter(SensorData.timestamp <= end_time)
 
+    # ?limit=&cursor= returns one keyset page, ?stream=ndjson|json streams every matching row
+    response = list_response(query, [SensorData.data_id], serialize_sensor_data)
+    if response is not None:
+        return response
+
     data_records = query.all()
-    data_list = [{
+    data_list = [serialize_sensor_data(record) for record in data_records]
+
+    return jsonify(data_list), 200
+
+
+def serialize_sensor_data(record):
+    return {
         'data_id': record.data_id,
         'sensor_id': record.sensor_id,
         'type_id': record.type_id,
         'timestamp': record.timestamp,
         'value': record.value,
         'created_at': record.created_at
-    } for record in data_records]
-
-    return jsonify(data_list), 200
+    }
+
+
+@data_bp.route('/api/data/aggregate', methods=['GET', 'POST'])
+def get_sensor_data_aggregate():
+    # Many sensors can be requested at once: repeated or comma separated query args, or a JSON body
+    if request.method == 'POST':
+        params = request.json or {}
+        sensor_ids = params.get('sensor_ids') or []
+        type_ids = params.get('type_ids') or []
+    else:
+        params = request.args
+        sensor_ids = [i for arg in request.args.getlist('sensor_id') for i in arg.split(',') if i]
+        type_ids = [i for arg in request.args.getlist('type_id') for i in arg.split(',') if i]
+
+    if not sensor_ids:
+        return jsonify({'error': 'At least one sensor_id is required'}), 400
+
+    try:
+        bucket = int(params.get('bucket') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'bucket must be a number of seconds'}), 400
+    if bucket < 0:
+        return jsonify({'error': 'bucket must be a number of seconds'}), 400
+
+    records = aggregate_sensor_data(sensor_ids, type_ids, params.get('start_time'), params.get('end_time'), bucket)
+
+    aggregates = []
+    for record in records:
+        aggregate = {
+            'sensor_id': record.sensor_id,
+            'type_id': record.type_id,
+            'avg': float(record.avg) if record.avg is not None else None,
+            'min': record.min,
+            'max': record.max,
+            'count': record.count,
+            'stddev': float(record.stddev) if record.stddev is not None else None
+        }
+        if bucket:
+            aggregate['bucket_start'] = record.bucket_start
+        aggregates.append(aggregate)
+
+    return jsonify(aggregates), 200
 
 
 @data_bp.route('/api/data', methods=['POST'])
@@ -47,8 +103,6 @@ def insert_sensor_data():
 
     sensor_id = data.get('sensor_id')
     type_id = data.get('type_id')
-    timestamp = data.get('timestamp')
-    value = data.get('value')
 
     sensor = Sensor.query.get(sensor_id)
     if sensor is None:
@@ -58,19 +112,58 @@ def insert_sensor_data():
     if sensor_type is None:
         return jsonify({'error': 'Sensor type not found'}), 404
 
-    new_data = SensorData(
-        sensor_id=sensor_id,
-        type_id=type_id,
-        timestamp=timestamp,
-        value=value
-    )
+    try:
+        data = normalize_reading(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    db.session.add(new_data)
-    db.session.commit()
+    try:
+        new_data = insert_sensor_reading(data)
+    except Exception as e:
+        return jsonify({'error': f'Failed to insert data. {str(e)}'}), 500
+    latest_readings.update([data])
+    live_feed.publish_readings([data])
 
     return jsonify({'message': 'Data inserted', 'data_id': new_data.data_id}), 201
 
 
+@data_bp.route('/api/data/bulk', methods=['POST'])
+def insert_sensor_data_bulk():
+    readings = request.json
+
+    if not isinstance(readings, list):
+        return jsonify({'error': 'Expected a JSON array of readings'}), 400
+    if not readings:
+        return jsonify({'message': 'No data inserted', 'inserted': 0}), 201
+
+    for reading in readings:
+        if not isinstance(reading, dict) or not reading.get('sensor_id') or not reading.get('type_id'):
+            return jsonify({'error': 'Each reading requires sensor_id and type_id'}), 400
+    try:
+        readings = [normalize_reading(reading) for reading in readings]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Readings of an unknown sensor or type are rejected on their own, as by the database ingest mode, so that
+    # one deleted sensor does not cost the rest of the batch
+    missing_sensor_ids, missing_type_ids = find_missing_references(readings)
+    readings, rejected = partition_readings(readings, missing_sensor_ids, missing_type_ids)
+
+    try:
+        inserted = bulk_insert_sensor_data(readings)
+    except Exception as e:
+        return jsonify({'error': f'Failed to insert data. {str(e)}'}), 500
+    latest_readings.update(readings)
+    live_feed.publish_readings(readings)
+
+    result = {'message': 'Data inserted', 'inserted': inserted, 'rejected': len(rejected)}
+    if missing_sensor_ids:
+        result['unknown_sensor_ids'] = sorted(missing_sensor_ids)
+    if missing_type_ids:
+        result['unknown_type_ids'] = sorted(missing_type_ids)
+    return jsonify(result), 201
+
+
 @data_bp.route('/api/data/<data_id>', methods=['DELETE'])
 def delete_sensor_data(data_id):
     data_record = SensorData.query.get(data_id)
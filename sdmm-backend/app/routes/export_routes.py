@@ -0,0 +1,142 @@
+# app/routes/export_routes.py
+
+import csv
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import select
+
+from app.models import db, SensorData
+
+export_bp = Blueprint('export_bp', __name__)
+
+EXPORT_FORMATS = {
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'csv': ('text/csv', 'csv')
+}
+
+EXPORT_SCHEMA = pa.schema([
+    ('data_id', pa.int64()),
+    ('sensor_id', pa.string()),
+    ('type_id', pa.string()),
+    ('timestamp', pa.timestamp('ms')),
+    ('value', pa.float32())  # SensorData.value is a single precision FLOAT column
+])
+
+PARQUET_ROW_GROUP_ROWS = 128 * 1024
+
+
+class ChunkSink(io.RawIOBase):
+    # Write-only file handed to the Arrow/Parquet writers; drain() hands back what was written since the last call
+    # while tell() keeps counting from the start of the stream, which the Parquet footer offsets rely on
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+@export_bp.route('/api/data/export', methods=['GET'])
+def export_sensor_data():
+    export_format = request.args.get('format', 'arrow')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+
+    sensor_ids = [i for arg in request.args.getlist('sensor_id') for i in arg.split(',') if i]
+    type_ids = [i for arg in request.args.getlist('type_id') for i in arg.split(',') if i]
+    start_time = request.args.get('start_time')
+    end_time = request.args.get('end_time')
+
+    if not sensor_ids:
+        return jsonify({'error': 'At least one sensor_id is required'}), 400
+
+    # Plain column rows straight from a server-side cursor, no ORM objects
+    statement = select(SensorData.data_id, SensorData.sensor_id, SensorData.type_id, SensorData.timestamp,
+                       SensorData.value).where(SensorData.sensor_id.in_(sensor_ids), SensorData.is_deleted == 0)
+    if type_ids:
+        statement = statement.where(SensorData.type_id.in_(type_ids))
+    if start_time:
+        statement = statement.where(SensorData.timestamp >= start_time)
+    if end_time:
+        statement = statement.where(SensorData.timestamp <= end_time)
+    statement = statement.order_by(SensorData.sensor_id, SensorData.type_id, SensorData.timestamp)
+
+    chunk_size = current_app.config['API_STREAM_CHUNK_SIZE']
+    generators = {'arrow': generate_arrow, 'parquet': generate_parquet, 'csv': generate_csv}
+
+    def generate():
+        result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+        yield from generators[export_format](result.partitions())
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=sensor_data.{extension}'})
+
+
+def to_record_batch(rows):
+    columns = list(zip(*rows))
+    return pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, EXPORT_SCHEMA)],
+                           schema=EXPORT_SCHEMA)
+
+
+def generate_arrow(partitions):
+    sink = ChunkSink()
+    with pa.ipc.new_stream(sink, EXPORT_SCHEMA) as writer:
+        for rows in partitions:
+            writer.write_batch(to_record_batch(rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def generate_parquet(partitions):
+    # Chunks are gathered into row groups of PARQUET_ROW_GROUP_ROWS; the footer with the row group offsets
+    # is written when the writer closes
+    sink = ChunkSink()
+    batches = []
+    buffered_rows = 0
+    with pq.ParquetWriter(sink, EXPORT_SCHEMA, compression='zstd') as writer:
+        for rows in partitions:
+            batches.append(to_record_batch(rows))
+            buffered_rows += len(rows)
+            if buffered_rows >= PARQUET_ROW_GROUP_ROWS:
+                writer.write_table(pa.Table.from_batches(batches), row_group_size=buffered_rows)
+                batches = []
+                buffered_rows = 0
+                yield sink.drain()
+        if batches:
+            writer.write_table(pa.Table.from_batches(batches), row_group_size=buffered_rows)
+    yield sink.drain()
+
+
+def generate_csv(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_SCHEMA.names)
+    for rows in partitions:
+        # Rows without a timestamp keep an empty cell, like missing values in the Arrow formats
+        writer.writerows((data_id, sensor_id, type_id,
+                          timestamp.isoformat(timespec='milliseconds') if timestamp is not None else '', value)
+                         for data_id, sensor_id, type_id, timestamp, value in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,68 @@
+# app/routes/live_routes.py
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from app.latest_readings import latest_readings
+from app.live_feed import LIVE_TOPICS, live_feed
+from app.models import db, SensorCurrentStatus
+
+live_bp = Blueprint('live_bp', __name__)
+
+KEEP_ALIVE_INTERVAL = 15
+
+
+@live_bp.route('/api/live', methods=['GET'])
+def get_live_feed():
+    # Server-sent events: ?topics=readings,status,alerts&sensor_id=..&max_rate=<flushes per second>
+    topics = {topic for arg in request.args.getlist('topics') for topic in arg.split(',') if topic} or set(LIVE_TOPICS)
+    if not topics <= set(LIVE_TOPICS):
+        return jsonify({'error': f"topics must be among {', '.join(LIVE_TOPICS)}"}), 400
+    sensor_ids = {i for arg in request.args.getlist('sensor_id') for i in arg.split(',') if i}
+
+    # Clients may ask for fewer flushes per second than the server limit, never more
+    max_rate = current_app.config['LIVE_FEED_MAX_RATE']
+    requested_rate = request.args.get('max_rate', type=float)
+    if requested_rate is not None and 0 < requested_rate < max_rate:
+        max_rate = requested_rate
+    client = live_feed.subscribe(topics, sensor_ids, max_rate)
+
+    # Start status subscribers from the current state so they need no per-sensor status requests
+    if 'status' in topics:
+        query = SensorCurrentStatus.query
+        if sensor_ids:
+            query = query.filter(SensorCurrentStatus.sensor_id.in_(sensor_ids))
+        for current in query:
+            client.offer('status', current.sensor_id, {
+                'sensor_id': current.sensor_id, 'status': current.status, 'timestamp': current.timestamp})
+        db.session.remove()  # Do not hold a pooled connection for the lifetime of the stream
+
+    dumps = current_app.json.dumps
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events = client.next_events(KEEP_ALIVE_INTERVAL)
+                if not events:
+                    yield ': keep-alive\n\n'
+                for topic, payload in events:
+                    yield f'event: {topic}\ndata: {dumps(payload)}\n\n'
+        finally:
+            live_feed.unsubscribe(client)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@live_bp.route('/api/live/publish', methods=['POST'])
+def publish_live_events():
+    # Used by the MQTT subscriber when it stores readings directly in the database (INGEST_MODE=db),
+    # which also keeps this process' latest-reading cache current
+    events = request.json
+    if not isinstance(events, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+
+    readings = events.get('readings') or []
+    latest_readings.update(readings)
+    live_feed.publish_readings(readings)
+    return jsonify({'message': 'Published'}), 202
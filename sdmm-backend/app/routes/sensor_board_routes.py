@@ -3,28 +3,46 @@
 import json
 from datetime import datetime
 
+import numpy as np
 from flask import Blueprint, jsonify, request
+from sqlalchemy import func
 
-from app.models import db, Sensor, SensorMetadata, SensorData, SensorType, SensorStatusHistory
+from app.downsampling import DOWNSAMPLING_METHODS, MIN_POINTS, downsample
+from app.latest_readings import latest_readings
+from app.models import db, Sensor, SensorMetadata, SensorData, SensorDataRollup, SensorType, SensorCurrentStatus
+from app.repository import ROLLUP_RESOLUTIONS, rollup_bucket_start
 
 sensor_board_bp = Blueprint('sensor_board_bp', __name__)
 
 
+# Keys of the sensor board 'data' object per sensor type name
+BOARD_DATA_KEYS = {'Temperature': 'temperature', 'Humidity': 'humidity', 'CO2 Concentration': 'co2'}
+
+
 @sensor_board_bp.route('/api/sensor_board/sensors', methods=['GET'])
 def get_active_sensors():
     sensors = Sensor.query.filter_by(status='active').all()
-    sensors_list = [{
-        'sensor_id': sensor.sensor_id,
-        'name': sensor.name,
-        'location': sensor.location,
-        'updated_at': sensor.updated_at,
-        'data': {
-            'temperature': 23.5,
-            'humidity': 55.0,
-            'co2': 400.0
-        },
-        'status': sensor.status
-    } for sensor in sensors]
+    type_keys = {sensor_type.type_id: BOARD_DATA_KEYS[sensor_type.type_name]
+                 for sensor_type in SensorType.query.filter(SensorType.type_name.in_(BOARD_DATA_KEYS))}
+    latest = latest_readings.get_all()
+
+    sensors_list = []
+    for sensor in sensors:
+        data = dict.fromkeys(BOARD_DATA_KEYS.values())
+        data['timestamp'] = None
+        for type_id, (timestamp, value) in latest.get(sensor.sensor_id, {}).items():
+            if type_id in type_keys:
+                data[type_keys[type_id]] = value
+                data['timestamp'] = max(timestamp, data['timestamp']) if data['timestamp'] else timestamp
+
+        sensors_list.append({
+            'sensor_id': sensor.sensor_id,
+            'name': sensor.name,
+            'location': sensor.location,
+            'updated_at': sensor.updated_at,
+            'data': data,
+            'status': sensor.status
+        })
     return jsonify(sensors_list), 200
 
 
@@ -94,18 +112,27 @@ def get_historical_data(sensor_id):
     except ValueError:
         return jsonify({'error': 'Invalid time format, should be YYYY-MM-DDTHH:MM:SS.sssZ'}), 400
 
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None and max_points <= 0:
+        return jsonify({'error': 'max_points must be a positive integer'}), 400
+    if max_points is not None:
+        max_points = max(max_points, MIN_POINTS)  # Fewer points cannot show the shape of a series
+
     type_ids = {
         'temperature': get_type_id_by_name('Temperature'),
         'humidity': get_type_id_by_name('Humidity'),
         'co2': get_type_id_by_name('CO2 Concentration')
     }
+    keys_by_type_id = {type_id: key for key, type_id in type_ids.items()}
 
-    sensor_data_records = db.session.query(SensorData.timestamp, SensorData.value, SensorData.type_id).filter(
-        SensorData.sensor_id == sensor_id,
-        SensorData.timestamp >= start_time,
-        SensorData.timestamp <= end_time,
-        SensorData.is_deleted == 0
-    ).all()
+    downsample_method = request.args.get('downsample', 'rollup')
+    if downsample_method != 'rollup' and downsample_method not in DOWNSAMPLING_METHODS:
+        return jsonify({'error': f"downsample must be one of rollup, {', '.join(DOWNSAMPLING_METHODS)}"}), 400
+
+    # 'rollup' serves pre-aggregated buckets, 'lttb' and 'minmax' reduce the raw points instead
+    resolution = 'raw'
+    if max_points and downsample_method == 'rollup':
+        resolution = select_history_resolution(sensor_id, type_ids.values(), start_time, end_time, max_points)
 
     data_dict = {
         'temperature': [],
@@ -113,20 +140,91 @@ def get_historical_data(sensor_id):
         'co2': []
     }
 
-    for record in sensor_data_records:
-        if record.type_id == type_ids['temperature']:
-            data_dict['temperature'].append(
-                {'timestamp': record.timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z', 'value': record.value})
-        elif record.type_id == type_ids['humidity']:
-            data_dict['humidity'].append(
-                {'timestamp': record.timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z', 'value': record.value})
-        elif record.type_id == type_ids['co2']:
-            data_dict['co2'].append(
-                {'timestamp': record.timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z', 'value': record.value})
-
+    if resolution == 'raw':
+        sensor_data_records = db.session.query(SensorData.type_id, SensorData.timestamp, SensorData.value).filter(
+            SensorData.sensor_id == sensor_id,
+            SensorData.type_id.in_(type_ids.values()),
+            SensorData.timestamp >= start_time,
+            SensorData.timestamp <= end_time,
+            SensorData.value.isnot(None),
+            SensorData.is_deleted == 0
+        ).order_by(SensorData.type_id, SensorData.timestamp).all()
+
+        for type_id, timestamps, values in split_series(sensor_data_records):
+            if max_points:
+                timestamps, values = downsample(timestamps, values, max_points,
+                                                'minmax' if downsample_method == 'minmax' else 'lttb')
+            data_dict[keys_by_type_id[type_id]] = [
+                {'timestamp': timestamp, 'value': value}
+                for timestamp, value in zip(format_timestamps(timestamps), values.tolist())
+            ]
+    else:
+        rollup_records = db.session.query(SensorDataRollup).filter(
+            SensorDataRollup.resolution == resolution,
+            SensorDataRollup.sensor_id == sensor_id,
+            SensorDataRollup.type_id.in_(type_ids.values()),
+            SensorDataRollup.bucket_start >= rollup_bucket_start(start_time, resolution),
+            SensorDataRollup.bucket_start <= end_time
+        ).order_by(SensorDataRollup.bucket_start).all()
+
+        for record in rollup_records:
+            data_dict[keys_by_type_id[record.type_id]].append({
+                'timestamp': format_timestamp(record.bucket_start),
+                'value': record.value_sum / record.value_count if record.value_count else None,
+                'min': record.value_min,
+                'max': record.value_max,
+                'count': record.value_count
+            })
+
+    data_dict['resolution'] = resolution
     return jsonify(data_dict), 200
 
 
+def select_history_resolution(sensor_id, type_ids, start_time, end_time, max_points):
+    # Raw rows when the busiest series fits the budget, otherwise the finest rollup that does.
+    # The raw point count is estimated from the hourly rollups instead of counting SensorData rows.
+    raw_points = db.session.query(func.sum(SensorDataRollup.value_count)).filter(
+        SensorDataRollup.resolution == '1h',
+        SensorDataRollup.sensor_id == sensor_id,
+        SensorDataRollup.type_id.in_(type_ids),
+        SensorDataRollup.bucket_start >= rollup_bucket_start(start_time, '1h'),
+        SensorDataRollup.bucket_start <= end_time
+    ).group_by(SensorDataRollup.type_id).order_by(func.sum(SensorDataRollup.value_count).desc()).limit(1).scalar() or 0
+    if raw_points <= max_points:
+        return 'raw'
+
+    window = (end_time - start_time).total_seconds()
+    for resolution, seconds in ROLLUP_RESOLUTIONS.items():
+        if window / seconds <= max_points:
+            return resolution
+    return '1d'
+
+
+def format_timestamp(timestamp):
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def format_timestamps(timestamps):
+    # Vectorized equivalent of format_timestamp for a datetime64 array
+    return np.char.add(np.datetime_as_string(timestamps, unit='ms'), 'Z').tolist()
+
+
+def split_series(records):
+    # Records sorted by type_id then timestamp -> (type_id, datetime64 array, float array) per type
+    if not records:
+        return []
+    type_ids, timestamps, values = zip(*records)
+    type_ids = np.array(type_ids)
+    timestamps = np.array(timestamps, dtype='datetime64[ms]')
+    values = np.array(values, dtype=np.float64)
+
+    boundaries = np.concatenate(([0], np.flatnonzero(type_ids[1:] != type_ids[:-1]) + 1, [len(type_ids)]))
+    series = []
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        series.append((str(type_ids[start]), timestamps[start:end], values[start:end]))
+    return series
+
+
 def get_type_id_by_name(type_name):
     sensor_type = SensorType.query.filter_by(type_name=type_name).first()
     return sensor_type.type_id if sensor_type else None
@@ -135,18 +233,10 @@ def get_type_id_by_name(type_name):
 @sensor_board_bp.route('/api/sensor_board/<sensor_id>/status', methods=['GET'])
 def get_sensors_status(sensor_id):
     try:
-        latest_status = (
-            db.session.query(SensorStatusHistory.status)
-            .filter(SensorStatusHistory.sensor_id == sensor_id)
-            .order_by(SensorStatusHistory.timestamp.desc())
-            .limit(1)
-            .subquery()
-        )
-
-        sensor_status = db.session.query(latest_status.c.status).first()
+        sensor_status = db.session.get(SensorCurrentStatus, sensor_id)
 
         if sensor_status:
-            return jsonify({'status': sensor_status[0]})
+            return jsonify({'status': sensor_status.status})
         else:
             return jsonify({'error': 'Sensor not found or no status history exists'}), 404
 
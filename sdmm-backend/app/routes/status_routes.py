@@ -2,7 +2,10 @@
 
 from flask import Blueprint, request, jsonify
 
-from app.models import db, SensorStatusHistory, Sensor
+from app.live_feed import live_feed
+from app.models import db, SensorStatusHistory, SensorCurrentStatus, Sensor
+from app.pagination import list_response
+from app.repository import set_sensor_status
 
 status_bp = Blueprint('status_bp', __name__)
 
@@ -17,26 +20,27 @@ def update_sensor_status(sensor_id):
     if new_status not in ['normal', 'warning', 'offline', 'disabled']:
         return jsonify({'error': 'Invalid status value'}), 400
 
-    status_history = SensorStatusHistory(
-        sensor_id=sensor_id,
-        status=new_status,
-        timestamp=db.func.current_timestamp()
-    )
-    db.session.add(status_history)
-    db.session.commit()
+    # Repeating the current status does not append a history row
+    status_history, changed, resolved_alerts = set_sensor_status(sensor_id, new_status)
+    if changed:
+        live_feed.publish_status(sensor_id, new_status, status_history.timestamp)
+    for alert in resolved_alerts:
+        live_feed.publish_alert(alert.to_dict())
 
     return jsonify(status_history.to_dict()), 200
 
 
 @status_bp.route('/api/sensors/<sensor_id>/status', methods=['GET'])
 def get_sensor_status_history(sensor_id):
-    status_history = SensorStatusHistory.query.filter_by(sensor_id=sensor_id).all()
-    history_list = [{
-        'status_id': record.status_id,
-        'status': record.status,
-        'timestamp': record.timestamp,
-        'created_at': record.created_at
-    } for record in status_history]
+    query = SensorStatusHistory.query.filter_by(sensor_id=sensor_id)
+
+    # ?limit=&cursor= returns one keyset page, ?stream=ndjson|json streams the whole history
+    response = list_response(query, [SensorStatusHistory.status_id], serialize_status_history)
+    if response is not None:
+        return response
+
+    status_history = query.all()
+    history_list = [serialize_status_history(record) for record in status_history]
 
     if len(history_list) == 0:
         return jsonify({'error': 'No status history recorded.'}), 404
@@ -44,14 +48,22 @@ def get_sensor_status_history(sensor_id):
     return jsonify(history_list), 200
 
 
+def serialize_status_history(record):
+    return {
+        'status_id': record.status_id,
+        'status': record.status,
+        'timestamp': record.timestamp,
+        'created_at': record.created_at
+    }
+
+
 @status_bp.route('/api/sensors/<sensor_id>/latest_status', methods=['GET'])
 def get_latest_sensor_status(sensor_id):
     sensor = Sensor.query.get(sensor_id)
     if not sensor:
         return jsonify({'error': 'Sensor not found'}), 404
 
-    latest_status = db.session.query(SensorStatusHistory).filter_by(sensor_id=sensor_id).order_by(
-        SensorStatusHistory.timestamp.desc()).first()
+    latest_status = db.session.get(SensorCurrentStatus, sensor_id)
 
     if latest_status:
         return jsonify({
@@ -61,3 +73,18 @@ def get_latest_sensor_status(sensor_id):
         }), 200
     else:
         return jsonify({'error': 'No status history found for this sensor'}), 404
+
+
+@status_bp.route('/api/sensors/status/current', methods=['POST'])
+def get_current_sensor_statuses():
+    # Current status of many sensors in one request: {"sensor_ids": [...]}
+    sensor_ids = (request.json or {}).get('sensor_ids')
+    if not isinstance(sensor_ids, list):
+        return jsonify({'error': 'sensor_ids must be a list'}), 400
+    statuses = SensorCurrentStatus.query.filter(SensorCurrentStatus.sensor_id.in_(sensor_ids)).all() \
+        if sensor_ids else []
+    return jsonify([{
+        'sensor_id': current.sensor_id,
+        'status': current.status,
+        'timestamp': current.timestamp
+    } for current in statuses]), 200
@@ -0,0 +1,326 @@
+# app/subscription_store.py
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import yaml
+
+from app.models import db, Subscription
+
+SUBSCRIPTION_FILE_PATH = 'subscriptions.yaml'
+SUBSCRIPTION_FIELDS = ('broker_address', 'broker_port', 'topic', 'username', 'password', 'sensor_types',
+                       'sensor_name', 'metadata')
+REQUIRED_FIELDS = ('broker_address', 'broker_port', 'topic', 'sensor_types', 'sensor_name')
+EXPORT_DELAY = 0.5  # Seconds during which writes are coalesced into one export of the YAML file
+
+YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)  # libyaml when available
+
+
+class SubscriptionStoreError(ValueError):
+    status_code = 400
+
+
+class SubscriptionConflict(SubscriptionStoreError):
+    status_code = 409
+
+
+class SubscriptionNotFound(SubscriptionStoreError):
+    status_code = 404
+
+
+class SubscriptionStoreUnavailable(SubscriptionStoreError):
+    status_code = 503
+
+
+def check_required_fields(subscription):
+    missing = missing_fields(subscription)
+    if missing:
+        raise SubscriptionStoreError(f"Subscription is missing {', '.join(missing)}")
+
+
+def missing_fields(subscription):
+    return [field for field in REQUIRED_FIELDS if subscription.get(field) is None]
+
+
+def subscription_set_problems(subscriptions):
+    # Every invalid entry of an uploaded or imported set, so that all of them can be fixed at once.
+    # Returns (problems, conflicts_only).
+    problems, conflicts_only = [], True
+    names, endpoints = set(), set()
+    for position, subscription in enumerate(subscriptions, 1):
+        if not isinstance(subscription, dict):
+            problems.append(f"Entry {position} is not a mapping")
+            conflicts_only = False
+            continue
+        label = f"Entry {position} ({subscription.get('sensor_name') or 'no sensor_name'})"
+        missing = missing_fields(subscription)
+        if missing:
+            problems.append(f"{label} is missing {', '.join(missing)}")
+            conflicts_only = False
+            continue
+        if subscription['sensor_name'] in names:
+            problems.append(f"{label} uses a sensor name that is used more than once")
+        if subscription_endpoint(subscription) in endpoints:
+            problems.append(f"{label} uses a broker, port and topic that are used more than once")
+        names.add(subscription['sensor_name'])
+        endpoints.add(subscription_endpoint(subscription))
+    return problems, conflicts_only
+
+
+def subscription_endpoint(subscription):
+    return subscription['broker_address'], subscription['broker_port'], subscription['topic']
+
+
+class SubscriptionStore:
+    # Subscriptions live in the Subscriptions table, indexed in memory by sensor name and by (broker, port,
+    # topic) so that lookups and collision checks do not depend on the number of subscriptions. Every write is
+    # one transaction stamped with the next store version, and the indexes change only once it has committed.
+    # subscriptions.yaml is kept as an export, replaced atomically, for the subscriber processes that watch it.
+    def __init__(self, path=SUBSCRIPTION_FILE_PATH, export_delay=EXPORT_DELAY):
+        self.path = path
+        self.export_delay = export_delay
+        self.by_name = {}  # sensor_name -> subscription, in the subscriptions.yaml shape
+        self.by_endpoint = {}  # (broker_address, broker_port, topic) -> sensor_name
+        self.ids = {}  # sensor_name -> subscription_id
+        self.version = 0
+        self.loaded = False
+        self.import_error = None  # Why the first-start import of the file failed, while it has not succeeded
+        self.import_mtime = None  # Modification time of the file at that attempt
+        self.lock = threading.RLock()
+        self.export_requested = threading.Event()
+        self.exporter = None
+
+    def ensure_loaded(self):
+        if self.loaded and self.import_error is None:
+            return
+        with self.lock:
+            if not self.loaded:
+                rows = Subscription.query.all()
+                for row in rows:
+                    self.version = max(self.version, row.version)
+                    if not row.is_deleted:
+                        self.index(row.subscription_id, row.to_dict())
+                if not rows:
+                    self.import_file()
+                self.loaded = True  # Not when the database failed, which is retried with the next request
+            elif self.import_error is not None and file_mtime(self.path) != self.import_mtime:
+                self.import_file()  # Tried again once the file has been edited, not on every request
+
+            if self.import_error is not None:
+                raise SubscriptionStoreUnavailable(f"{self.import_error}. Fix the file or upload a complete set "
+                                                   f"of subscriptions")
+
+    def import_file(self):
+        # First start on this database: import the existing file. Until an import or an upload succeeds, every
+        # request but the upload reports the import error and nothing is exported: the file is never replaced by
+        # a partial set that the subscribers would apply as the removal of every other sensor.
+        self.import_mtime = file_mtime(self.path)
+        try:
+            self.replace_all(read_subscription_file(self.path))
+        except (OSError, yaml.YAMLError, SubscriptionStoreError) as e:
+            self.import_error = f"Failed to import {self.path}: {e}"
+            print_colored(self.import_error, "41")
+
+    def list(self):
+        self.ensure_loaded()
+        with self.lock:
+            return list(self.by_name.values()), self.version
+
+    def get(self, sensor_name):
+        self.ensure_loaded()
+        with self.lock:
+            subscription = self.by_name.get(sensor_name)
+            if subscription is None:
+                raise SubscriptionNotFound('Subscription not found')
+            return subscription
+
+    def create(self, subscription):
+        self.ensure_loaded()
+        check_required_fields(subscription)
+        subscription = {field: subscription.get(field) for field in SUBSCRIPTION_FIELDS}
+        with self.lock:
+            if subscription['sensor_name'] in self.by_name:
+                raise SubscriptionConflict('Sensor name already exists')
+            if subscription_endpoint(subscription) in self.by_endpoint:
+                raise SubscriptionConflict('Subscription with the same broker, port, and topic already exists')
+
+            version = self.version + 1
+            subscription_id = str(uuid.uuid4())
+            self.commit([self.new_row(subscription_id, subscription, version)])
+            self.index(subscription_id, subscription)
+            self.version = version
+        self.request_export()
+        return version
+
+    def update(self, sensor_name, changes):
+        # Fields present in changes replace the current ones, including explicit nulls
+        self.ensure_loaded()
+        with self.lock:
+            current = self.by_name.get(sensor_name)
+            if current is None:
+                raise SubscriptionNotFound('Subscription not found')
+            updated = dict(current)
+            updated.update({field: changes[field] for field in SUBSCRIPTION_FIELDS if field in changes})
+            updated['sensor_name'] = changes.get('sensor_name') or sensor_name
+            check_required_fields(updated)
+
+            if updated['sensor_name'] != sensor_name and updated['sensor_name'] in self.by_name:
+                raise SubscriptionConflict('Sensor name already exists')
+            endpoint = subscription_endpoint(updated)
+            if endpoint != subscription_endpoint(current) and endpoint in self.by_endpoint:
+                raise SubscriptionConflict('Subscription with the same broker, port, and topic already exists')
+
+            version = self.version + 1
+            subscription_id = self.ids[sensor_name]
+            row = db.session.get(Subscription, subscription_id)
+            self.assign(row, updated, version)
+            self.commit([row])
+            self.unindex(sensor_name)
+            self.index(subscription_id, updated)
+            self.version = version
+        self.request_export()
+        return version
+
+    def delete(self, sensor_name):
+        self.ensure_loaded()
+        with self.lock:
+            if sensor_name not in self.by_name:
+                raise SubscriptionNotFound('Subscription not found')
+            version = self.version + 1
+            row = db.session.get(Subscription, self.ids[sensor_name])
+            row.is_deleted = True
+            row.version = version
+            self.commit([row])
+            self.unindex(sensor_name)
+            self.version = version
+        self.request_export()
+        return version
+
+    def replace_all(self, subscriptions):
+        # Upload or import: the new set replaces every subscription in a single version. A complete set is also
+        # how writes are re-enabled after a failed import.
+        problems, conflicts_only = subscription_set_problems(subscriptions)
+        if problems:
+            error = SubscriptionConflict if conflicts_only else SubscriptionStoreError
+            raise error('; '.join(problems))
+        subscriptions = [{field: subscription.get(field) for field in SUBSCRIPTION_FIELDS}
+                         for subscription in subscriptions]
+
+        with self.lock:
+            version = self.version + 1
+            Subscription.query.filter_by(is_deleted=False).update({'is_deleted': True, 'version': version})
+            new_rows = {str(uuid.uuid4()): subscription for subscription in subscriptions}
+            self.commit([self.new_row(subscription_id, subscription, version)
+                         for subscription_id, subscription in new_rows.items()])
+
+            self.by_name, self.by_endpoint, self.ids = {}, {}, {}
+            for subscription_id, subscription in new_rows.items():
+                self.index(subscription_id, subscription)
+            self.version = version
+            self.import_error = None
+        self.request_export()
+        return version
+
+    def new_row(self, subscription_id, subscription, version):
+        row = Subscription(subscription_id=subscription_id)
+        self.assign(row, subscription, version)
+        db.session.add(row)
+        return row
+
+    @staticmethod
+    def assign(row, subscription, version):
+        for field in SUBSCRIPTION_FIELDS:
+            setattr(row, 'metadata_' if field == 'metadata' else field, subscription[field])
+        row.version = version
+        row.is_deleted = False
+
+    @staticmethod
+    def commit(rows):
+        try:
+            db.session.add_all(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def index(self, subscription_id, subscription):
+        self.by_name[subscription['sensor_name']] = subscription
+        self.by_endpoint[subscription_endpoint(subscription)] = subscription['sensor_name']
+        self.ids[subscription['sensor_name']] = subscription_id
+
+    def unindex(self, sensor_name):
+        subscription = self.by_name.pop(sensor_name)
+        del self.by_endpoint[subscription_endpoint(subscription)]
+        del self.ids[sensor_name]
+
+    # YAML export
+
+    def dump_yaml(self):
+        with self.lock:
+            config = {'subscriptions': list(self.by_name.values()), 'version': self.version}
+        return yaml.dump(config, Dumper=YamlDumper)
+
+    def request_export(self):
+        with self.lock:
+            if self.exporter is None:
+                self.exporter = threading.Thread(target=self.run_exporter, daemon=True)
+                self.exporter.start()
+        self.export_requested.set()
+
+    def run_exporter(self):
+        # Exports at most once per export_delay, off the request path
+        while True:
+            self.export_requested.wait()
+            time.sleep(self.export_delay)
+            self.export_requested.clear()
+            try:
+                self.export()
+            except OSError as e:
+                print_colored(f"Failed to export {self.path}: {e}", "41")
+
+    def export(self):
+        # Written next to the target and renamed over it: readers see the old or the new file, never a partial
+        # one, and watchers get a single move event instead of a delete and several modifications
+        if self.import_error is not None:
+            return  # The file is the only copy of the subscriptions that failed to import
+        content = self.dump_yaml()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.subscriptions-', suffix='.tmp',
+                                         delete=False) as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file.name, self.path)
+
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def read_subscription_file(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as file:
+        return parse_subscription_yaml(file)
+
+
+def parse_subscription_yaml(stream):
+    config = yaml.safe_load(stream) or {}
+    if not isinstance(config, dict) or not isinstance(config.get('subscriptions') or [], list):
+        raise SubscriptionStoreError("Expected a 'subscriptions' list")
+    return config.get('subscriptions') or []
+
+
+def print_colored(_text, color_code):
+    _text = "[SUBSCRIPTIONS] - " + _text
+    print(f"\033[{color_code}m{_text}\033[0m", flush=True)
+
+
+# One store per API process, which is the only writer of subscriptions
+subscription_store = SubscriptionStore()
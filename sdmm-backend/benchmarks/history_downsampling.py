@@ -0,0 +1,57 @@
+# benchmarks/history_downsampling.py
+#
+# Cost of building the /api/sensor_board/<id>/history payload for one series: the full per-row dump
+# against LTTB and min/max downsampling over NumPy arrays. Needs no database, e.g.
+#   python -m benchmarks.history_downsampling --points 2592000 --max-points 2000
+
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.downsampling import downsample
+from app.routes.sensor_board_routes import format_timestamp, format_timestamps
+
+
+def full_dump(records):
+    return json.dumps([{'timestamp': format_timestamp(timestamp), 'value': value} for timestamp, value in records])
+
+
+def downsampled(records, max_points, method):
+    timestamps, values = zip(*records)
+    timestamps = np.array(timestamps, dtype='datetime64[ms]')
+    values = np.array(values, dtype=np.float64)
+    timestamps, values = downsample(timestamps, values, max_points, method)
+    return json.dumps([{'timestamp': timestamp, 'value': value}
+                       for timestamp, value in zip(format_timestamps(timestamps), values.tolist())])
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    payload = function(*args)
+    return (time.perf_counter() - start) * 1000, len(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--points', type=int, default=30 * 24 * 60 * 60, help='raw 1 Hz points in the series')
+    parser.add_argument('--max-points', type=int, default=2000)
+    args = parser.parse_args()
+
+    start = datetime(2024, 1, 1)
+    rng = np.random.default_rng(0)
+    values = 22 + np.cumsum(rng.normal(0, 0.05, args.points))
+    records = [(start + timedelta(seconds=i), float(value)) for i, value in enumerate(values)]
+
+    print(f'{args.points} points, max_points={args.max_points}')
+    for label, function, extra in (('full dump', full_dump, ()),
+                                   ('lttb', downsampled, (args.max_points, 'lttb')),
+                                   ('minmax', downsampled, (args.max_points, 'minmax'))):
+        elapsed, size = timed(function, records, *extra)
+        print(f'{label:>10}: {elapsed:9.1f} ms, {size / 1024:9.1f} KiB payload')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/mqtt_connections.py
+#
+# Threads and resident memory for N subscriptions on one broker: one client and loop thread per
+# subscription (the former SubscriptionManager) against the shared ConnectionPool.
+# Run from sdmm-backend against a reachable broker, e.g.
+#   python -m benchmarks.mqtt_connections --sensors 1000 --broker localhost --mode pooled
+# After measuring, one message is published per topic to check that every subscription is live.
+
+import argparse
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from mqtt_pool import ConnectionPool, current_rss_bytes
+
+
+def per_subscription(subscriptions, on_message):
+    clients = []
+    for subscription in subscriptions:
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        client.on_connect = lambda _client, userdata, flags, rc, properties=None, topic=subscription['topic']: \
+            _client.subscribe(topic)
+        client.on_message = lambda _client, userdata, msg: on_message(msg.topic)
+        client.connect(subscription['broker_address'], subscription['broker_port'], 60)
+        threading.Thread(target=client.loop_forever, daemon=True).start()
+        clients.append(client)
+    return clients
+
+
+def pooled(subscriptions, on_message):
+    pool = ConnectionPool(lambda subscription, msg: on_message(msg.topic), stats_interval=0)
+    for subscription in subscriptions:
+        pool.subscribe(subscription)
+    return pool
+
+
+def check_delivery(subscriptions, received, timeout):
+    publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    publisher.connect(subscriptions[0]['broker_address'], subscriptions[0]['broker_port'], 60)
+    publisher.loop_start()
+    for subscription in subscriptions:
+        publisher.publish(subscription['topic'], b'1', qos=1)
+    deadline = time.monotonic() + timeout
+    while len(received) < len(subscriptions) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    publisher.loop_stop()
+    publisher.disconnect()
+    return len(received)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sensors', type=int, default=1000)
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--mode', choices=('per-subscription', 'pooled'), default='pooled')
+    parser.add_argument('--settle', type=float, default=5.0, help='Seconds to wait before measuring')
+    parser.add_argument('--delivery-timeout', type=float, default=30.0,
+                        help='Seconds to wait for the check message of every subscription')
+    args = parser.parse_args()
+
+    subscriptions = [{
+        'sensor_name': f'Benchmark Sensor {i}',
+        'broker_address': args.broker,
+        'broker_port': args.port,
+        'topic': f'benchmark/sensor_{i}',
+    } for i in range(args.sensors)]
+
+    received = set()
+    threads_before, rss_before = threading.active_count(), current_rss_bytes()
+    start = time.perf_counter()
+    setup_mode = per_subscription if args.mode == 'per-subscription' else pooled
+    handle = setup_mode(subscriptions, received.add)
+    setup = time.perf_counter() - start
+    time.sleep(args.settle)
+
+    threads = threading.active_count() - threads_before
+    rss_mb = (current_rss_bytes() - rss_before) / (1024 * 1024)
+    print(f'{args.mode}: {args.sensors} subscriptions set up in {setup:.2f} s, '
+          f'+{threads} threads, +{rss_mb:.1f} MB RSS; per 1,000 sensors '
+          f'{threads * 1000 / args.sensors:.1f} threads, {rss_mb * 1000 / args.sensors:.1f} MB')
+    delivered = check_delivery(subscriptions, received, args.delivery_timeout)
+    print(f'{args.mode}: {delivered}/{args.sensors} subscriptions received their check message')
+    del handle
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/payload_decoding.py
+#
+# Per-record decode cost of the sensor board payload: struct.unpack of one record at a time, as the subscriber
+# did before payload_formats.py, against one np.frombuffer pass over payloads of 1 to N packed records and over
+# the framed batches of mqtt_publisher.py's batch mode, with and without delta encoding. All produce the same
+# (sensor_id, timestamp, values) tuples. Run from sdmm-backend, e.g.
+#   python -m benchmarks.payload_decoding --records 100000
+
+import argparse
+import random
+import struct
+import time
+import uuid
+from datetime import datetime
+
+from payload_formats import COMBINED, FLAG_DELTA, FRAME_HEADER, FRAME_MAGIC, FRAME_VERSION, load_registry
+
+STRUCT_FORMAT = '!16sQiII'
+DELTA_FORMAT = '!ihhh'
+FORMAT_VERSION = 1  # combined_v1 in payload_formats.yaml
+SENSOR_TYPES = ['Temperature', 'Humidity', 'CO2 Concentration']
+
+
+def make_samples(count):
+    # Random walks like mqtt_publisher.py, so that delta encoding sees realistic differences
+    device_id = uuid.uuid4().bytes
+    start = int(time.time())
+    temperature, humidity, co2_concentration = 2000, 50, 400
+    samples = []
+    for i in range(count):
+        temperature = max(-1000, min(4000, temperature + random.randint(-50, 50)))
+        humidity = max(20, min(80, humidity + random.randint(-1, 1)))
+        co2_concentration = max(300, min(500, co2_concentration + random.randint(-10, 10)))
+        samples.append((device_id, start + i, temperature, humidity, co2_concentration))
+    return samples
+
+
+def make_frame(samples, delta):
+    body = [struct.pack(STRUCT_FORMAT, *samples[0])]
+    if delta:
+        body += [struct.pack(DELTA_FORMAT, *(value - previous_value for value, previous_value in
+                                             zip(sample[1:], previous[1:])))
+                 for previous, sample in zip(samples, samples[1:])]
+    else:
+        body += [struct.pack(STRUCT_FORMAT, *sample) for sample in samples[1:]]
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, FLAG_DELTA if delta else 0, FORMAT_VERSION,
+                               len(samples))
+    return header + b''.join(body)
+
+
+def decode_struct(records):
+    readings = []
+    for record in records:
+        device_id, timestamp, temperature, humidity, co2_concentration = struct.unpack(STRUCT_FORMAT, record)
+        readings.append((str(uuid.UUID(bytes=device_id)),
+                         datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+                         {'Temperature': temperature / 100.0, 'Humidity': float(humidity),
+                          'CO2 Concentration': float(co2_concentration)}))
+    return readings
+
+
+def decode_numpy(payloads, registry, subscription):
+    readings = []
+    for payload in payloads:
+        readings.extend(registry.readings(payload, subscription))
+    return readings
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--batch-sizes', default='1,10,100,1000')
+    args = parser.parse_args()
+
+    samples = make_samples(args.records)
+    records = [struct.pack(STRUCT_FORMAT, *sample) for sample in samples]
+    registry = load_registry()
+    subscription = {'sensor_types': SENSOR_TYPES}
+
+    expected, elapsed = timed(decode_struct, records)
+    print(f'struct, 1 record per payload: {elapsed / len(records) * 1e6:.2f} us/record, '
+          f'{len(records[0])} bytes/record')
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    for batch_size in batch_sizes:
+        payloads = [b''.join(records[start:start + batch_size]) for start in range(0, len(records), batch_size)]
+        readings, elapsed = timed(decode_numpy, payloads, registry, subscription)
+        assert readings == expected
+        print(f'numpy, {batch_size} records per payload: {elapsed / len(records) * 1e6:.2f} us/record')
+
+    for delta in (False, True):
+        for batch_size in batch_sizes:
+            payloads = [make_frame(samples[start:start + batch_size], delta)
+                        for start in range(0, len(samples), batch_size)]
+            readings, elapsed = timed(decode_numpy, payloads, registry, subscription)
+            assert readings == expected
+            size = sum(len(payload) for payload in payloads) / len(samples)
+            print(f"{'delta frame' if delta else 'frame'}, {batch_size} records per payload: "
+                  f"{elapsed / len(records) * 1e6:.2f} us/record, {size:.1f} bytes/record")
+
+    # Emitting only some of the mapped types skips the other columns entirely
+    payloads = [b''.join(records[start:start + 1000]) for start in range(0, len(records), 1000)]
+    _, elapsed = timed(decode_numpy, payloads, registry, {'sensor_types': ['Temperature']})
+    print(f'numpy, 1000 records per payload, Temperature only: {elapsed / len(records) * 1e6:.2f} us/record '
+          f'({COMBINED.dtype.itemsize} bytes per record)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/sensor_data_export.py
+#
+# Time and size of reading the same SensorData rows as JSON from /api/data and from /api/data/export in each
+# format, through the app's WSGI stack so that only the database and the encoding are compared.
+# Run from sdmm-backend against the configured database, e.g.
+#   python -m benchmarks.sensor_data_export --seed 1000000 --sensors 10 --runs 3
+
+import argparse
+import io
+import statistics
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from app import create_app
+from app.models import db
+from benchmarks.sensor_data_range_query import seed
+
+
+def count_rows(export_format, body):
+    if export_format == 'json':
+        return body.count(b'"data_id"')
+    if export_format == 'arrow':
+        return pa.ipc.open_stream(body).read_all().num_rows
+    if export_format == 'parquet':
+        return pq.read_metadata(io.BytesIO(body)).num_rows
+    return body.count(b'\n') - 1  # CSV header
+
+
+def fetch(client, export_format, sensor_id):
+    if export_format == 'json':
+        return client.get(f'/api/data?sensor_id={sensor_id}').get_data()
+    return client.get(f'/api/data/export?sensor_id={sensor_id}&format={export_format}').get_data()
+
+
+def measure(client, export_format, sensor_ids, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        bodies = [fetch(client, export_format, sensor_id) for sensor_id in sensor_ids]
+        timings.append(time.perf_counter() - start)
+    rows = sum(count_rows(export_format, body) for body in bodies)
+    return statistics.median(timings), rows, sum(len(body) for body in bodies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0, help='number of synthetic rows to insert first')
+    parser.add_argument('--sensors', type=int, default=10, help='sensors read per run')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    with app.app_context():
+        if args.seed:
+            seed(args.seed, args.sensors)
+        sensor_ids = [sensor_id for (sensor_id,) in db.session.execute(
+            text('SELECT DISTINCT sensor_id FROM SensorData LIMIT :limit'), {'limit': args.sensors})]
+        db.session.remove()
+    if not sensor_ids:
+        print('SensorData is empty, use --seed to insert synthetic rows.')
+        return
+
+    baseline = None
+    for export_format in ('json', 'arrow', 'parquet', 'csv'):
+        elapsed, rows, size = measure(client, export_format, sensor_ids, args.runs)
+        baseline = baseline or elapsed
+        print(f'{export_format:>8}: {rows} rows in {elapsed:.2f} s ({rows / elapsed:.0f} rows/s), '
+              f'{size / (1024 * 1024):.1f} MiB, {baseline / elapsed:.1f}x JSON')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# benchmarks/sensor_data_range_query.py
+#
+# Range-query latency on SensorData with and without idx_sensor_data_sensor_type_time.
+# Run from sdmm-backend against the configured database, e.g.
+#   python -m benchmarks.sensor_data_range_query --seed 100000000 --sensors 1000 --runs 200
+# Without the index every query scans the table, so at that size the baseline takes --baseline-runs queries only.
+
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app import create_app
+from app.models import db, Sensor, SensorType
+from app.repository import bulk_insert_sensor_data
+
+INDEX_NAME = 'idx_sensor_data_sensor_type_time'
+
+RANGE_QUERY = (
+    'SELECT timestamp, value FROM SensorData {hint}'
+    'WHERE sensor_id = :sensor_id AND type_id = :type_id AND is_deleted = 0 '
+    'AND timestamp >= :start_time AND timestamp <= :end_time'
+)
+
+
+def seed(rows, sensor_count, chunk_size=10000):
+    sensor_ids = [str(uuid.uuid4()) for _ in range(sensor_count)]
+    for sensor_id in sensor_ids:
+        db.session.add(Sensor(sensor_id=sensor_id, name=f'Benchmark {sensor_id[:8]}', status='inactive'))
+    db.session.commit()
+
+    type_ids = [type_id for (type_id,) in db.session.query(SensorType.type_id)]
+    start = datetime.now() - timedelta(seconds=rows // (sensor_count * len(type_ids)))
+    inserted = 0
+    seed_start = time.perf_counter()
+    while inserted < rows:
+        chunk = []
+        for i in range(inserted, min(rows, inserted + chunk_size)):
+            tick, position = divmod(i, sensor_count * len(type_ids))
+            sensor_index, type_index = divmod(position, len(type_ids))
+            chunk.append({
+                'sensor_id': sensor_ids[sensor_index],
+                'type_id': type_ids[type_index],
+                'timestamp': start + timedelta(seconds=tick),
+                'value': random.uniform(0, 500)
+            })
+        inserted += bulk_insert_sensor_data(chunk)
+        rate = inserted / (time.perf_counter() - seed_start)
+        print(f'Seeded {inserted}/{rows} rows ({rate:.0f} rows/s, {(rows - inserted) / rate / 60:.0f} min left)',
+              end='\r', flush=True)
+    print()
+
+
+def measure(statement, samples):
+    timings = []
+    for params in samples:
+        start = time.perf_counter()
+        db.session.execute(statement, params).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'p50': statistics.median(timings),
+        'p95': timings[int(len(timings) * 0.95) - 1],
+        'max': timings[-1]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed', type=int, default=0, help='number of synthetic rows to insert first')
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--baseline-runs', type=int, default=20, help='queries measured without the index')
+    parser.add_argument('--window', type=int, default=3600, help='queried time range in seconds')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.seed:
+            seed(args.seed, args.sensors)
+
+        total = db.session.execute(text('SELECT COUNT(*) FROM SensorData')).scalar()
+        pairs = db.session.execute(text('SELECT DISTINCT sensor_id, type_id FROM SensorData LIMIT 10000')).fetchall()
+        bounds = db.session.execute(text('SELECT MIN(timestamp), MAX(timestamp) FROM SensorData')).fetchone()
+        if not pairs:
+            print('SensorData is empty, use --seed to insert synthetic rows.')
+            return
+
+        span = max(int((bounds[1] - bounds[0]).total_seconds()) - args.window, 1)
+        samples = []
+        for _ in range(args.runs):
+            sensor_id, type_id = random.choice(pairs)
+            start_time = bounds[0] + timedelta(seconds=random.randrange(span))
+            samples.append({'sensor_id': sensor_id, 'type_id': type_id,
+                            'start_time': start_time, 'end_time': start_time + timedelta(seconds=args.window)})
+
+        print(f'SensorData rows: {total}, queries over {args.window} s windows')
+        for label, hint, runs in (('without index', f'IGNORE INDEX ({INDEX_NAME}) ', args.baseline_runs),
+                                  ('with index', '', args.runs)):
+            result = measure(text(RANGE_QUERY.format(hint=hint)), samples[:runs])
+            plan = db.session.execute(text('EXPLAIN ' + RANGE_QUERY.format(hint=hint)), samples[0]).mappings().first()
+            print(f"{label:>14}: {min(runs, len(samples))} queries, p50 {result['p50']:.2f} ms, "
+                  f"p95 {result['p95']:.2f} ms, max {result['max']:.2f} ms "
+                  f"(key={plan['key']}, rows={plan['rows']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# benchmarks/subscriber_runtimes.py
+#
+# Receive-and-decode throughput and resident memory of the subscriber runtimes for N sensors on one broker:
+# one paho client and thread per subscription (the original mqtt_subscription.py), the pooled paho
+# clients, and the asyncio runtime (one aiomqtt client on one event loop). Storage is left out so that
+# only the MQTT side is compared. Subscriptions use QoS 0 as in the subscriber, so a saturated runtime shows
+# up as messages not received. The publisher runs in its own process and the subscriber's CPU time is reported
+# next to the rate, which a broker slower than the subscriber caps for every runtime alike.
+# Run from sdmm-backend against a reachable broker, once per mode, e.g.
+#   python -m benchmarks.subscriber_runtimes --sensors 1000 --messages 100000 --mode asyncio
+
+import argparse
+import asyncio
+import multiprocessing
+import struct
+import threading
+import time
+import uuid
+
+import aiomqtt
+import paho.mqtt.client as mqtt
+
+from benchmarks.mqtt_connections import per_subscription
+from mqtt_pool import ConnectionPool, TopicTrie, current_rss_bytes
+
+PAYLOAD_FORMAT = '!16sQiII'
+
+
+class Counter:
+    def __init__(self, expected):
+        self.expected = expected
+        self.received = 0
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def handle(self, payload):
+        struct.unpack(PAYLOAD_FORMAT, payload)
+        with self.lock:
+            self.received += 1
+            if self.received >= self.expected:
+                self.done.set()
+
+
+def publish(args, topics):
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+    payload = struct.pack(PAYLOAD_FORMAT, uuid.uuid4().bytes, int(time.time()), 2000, 50, 400)
+    for i in range(args.messages):
+        info = client.publish(topics[i % len(topics)], payload, qos=1)
+    info.wait_for_publish()
+    client.loop_stop()
+    client.disconnect()
+
+
+def run_threads(args, subscriptions, counter):
+    if args.mode == 'threads':
+        clients = per_subscription(subscriptions)
+        for client in clients:
+            client.on_message = lambda _client, userdata, msg: counter.handle(msg.payload)
+    else:
+        pool = ConnectionPool(lambda subscription, msg: counter.handle(msg.payload), stats_interval=0)
+        for subscription in subscriptions:
+            pool.subscribe(subscription)
+    time.sleep(args.settle)
+    return measure(args, subscriptions, counter, lambda: counter.done.wait(args.timeout))
+
+
+async def run_asyncio(args, subscriptions, counter):
+    trie = TopicTrie()
+    for subscription in subscriptions:
+        trie.add(subscription['topic'], subscription['sensor_name'], subscription)
+    queues = {subscription['sensor_name']: asyncio.Queue() for subscription in subscriptions}
+
+    async def consume(queue):
+        while True:
+            counter.handle(await queue.get())
+
+    async with aiomqtt.Client(args.broker, port=args.port) as client, asyncio.TaskGroup() as tasks:
+        consumers = [tasks.create_task(consume(queue)) for queue in queues.values()]
+        for start in range(0, len(subscriptions), 100):
+            await client.subscribe([(subscription['topic'], 0) for subscription in subscriptions[start:start + 100]])
+
+        async def route():
+            async for message in client.messages:
+                for subscription in trie.match(message.topic.value):
+                    queues[subscription['sensor_name']].put_nowait(message.payload)
+
+        router = tasks.create_task(route())
+        await asyncio.sleep(args.settle)
+        result = await asyncio.to_thread(measure, args, subscriptions, counter,
+                                         lambda: counter.done.wait(args.timeout))
+        router.cancel()
+        for consumer in consumers:
+            consumer.cancel()
+    return result
+
+
+def measure(args, subscriptions, counter, wait):
+    publisher = multiprocessing.get_context('spawn').Process(
+        target=publish, args=(args, [subscription['topic'] for subscription in subscriptions]))
+    start, cpu_start = time.perf_counter(), time.process_time()
+    publisher.start()
+    wait()
+    elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    # Measured before teardown, while every client and task is still running
+    threads, rss = threading.active_count(), current_rss_bytes()
+    publisher.join()
+    return counter.received, elapsed, cpu, threads, rss
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sensors', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--mode', choices=('threads', 'pooled', 'asyncio'), default='asyncio')
+    parser.add_argument('--settle', type=float, default=5.0, help='Seconds to wait before publishing')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds to wait for the last messages')
+    args = parser.parse_args()
+
+    subscriptions = [{
+        'sensor_name': f'Benchmark Sensor {i}',
+        'broker_address': args.broker,
+        'broker_port': args.port,
+        'topic': f'benchmark/sensor_{i}',
+    } for i in range(args.sensors)]
+    counter = Counter(args.messages)
+
+    threads_before, rss_before = threading.active_count(), current_rss_bytes()
+    if args.mode == 'asyncio':
+        received, elapsed, cpu, threads, rss = asyncio.run(run_asyncio(args, subscriptions, counter))
+    else:
+        received, elapsed, cpu, threads, rss = run_threads(args, subscriptions, counter)
+    threads -= threads_before
+    rss_mb = (rss - rss_before) / (1024 * 1024)
+
+    print(f'{args.mode}: {received}/{args.messages} messages in {elapsed:.2f} s ({received / elapsed:.0f} msg/s), '
+          f'{cpu * 1000 / max(received, 1) * 1000:.0f} ms CPU per 1,000 messages, '
+          f'{args.sensors} subscriptions, +{threads} threads, +{rss_mb:.1f} MB RSS '
+          f'({rss_mb * 1000 / args.sensors:.1f} MB per 1,000 sensors)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# config_watcher.py
+
+import hashlib
+import os
+import threading
+
+import yaml
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+CONFIG_RELOAD_DEBOUNCE = float(os.getenv('CONFIG_RELOAD_DEBOUNCE', 0.5))  # Seconds of quiet before a reload
+# Seconds before a configuration change that failed to apply is retried
+CONFIG_RELOAD_RETRY = float(os.getenv('CONFIG_RELOAD_RETRY', 30))
+
+# Fields whose change needs the MQTT subscription and the sensor registration redone; anything else that
+# differs (metadata) is applied in place
+RESUBSCRIBE_FIELDS = {'broker_address', 'broker_port', 'topic', 'username', 'password', 'sensor_types'}
+
+OFFLINE_THRESHOLD = 10  # Seconds without a message before a sensor is marked offline
+
+
+def parse_subscriptions(content):
+    # subscriptions.yaml content -> {sensor_name: subscription}
+    config = yaml.safe_load(content) or {}
+    return {subscription['sensor_name']: subscription for subscription in config.get('subscriptions') or []}
+
+
+def offline_threshold(subscription):
+    # Publishers may stay silent longer than OFFLINE_THRESHOLD by design, declared in the subscription metadata:
+    # - batch_span: seconds between two framed batches (mqtt_publisher.py PUBLISH_MODE=batch)
+    # - max_silence: seconds between heartbeats of a publisher in deadband mode
+    # Such a sensor is only offline once its next message is OFFLINE_THRESHOLD seconds late.
+    silence = 0
+    for item in subscription.get('metadata') or []:
+        if not isinstance(item, dict):
+            continue
+        for key in ('batch_span', 'max_silence'):
+            if item.get(key):
+                try:
+                    silence = max(silence, float(item[key]))
+                except (TypeError, ValueError):
+                    print_colored(f"Ignoring invalid {key} of {subscription.get('sensor_name')}", "41")
+    return silence + OFFLINE_THRESHOLD
+
+
+def changed_fields(old, new):
+    # Empty metadata or sensor types are the same whether written as null, [] or {}
+    return {field for field in old.keys() | new.keys() if (old.get(field) or None) != (new.get(field) or None)}
+
+
+def diff_subscriptions(old, new):
+    # Returns the added and removed sensor names and {sensor_name: changed fields} for the ones in both
+    added = [sensor_name for sensor_name in new if sensor_name not in old]
+    removed = [sensor_name for sensor_name in old if sensor_name not in new]
+    changed = {}
+    for sensor_name in new:
+        if sensor_name in old and new[sensor_name] != old[sensor_name]:
+            fields = changed_fields(old[sensor_name], new[sensor_name])
+            if fields:
+                changed[sensor_name] = fields
+    return added, removed, changed
+
+
+class ConfigWatcher(FileSystemEventHandler):
+    # Coalesces the bursts of filesystem events a single save produces into one reload after `debounce` seconds
+    # of quiet, skips reloads whose content hash did not change, and hands the consumer a per-subscription
+    # diff instead of the whole file
+    def __init__(self, path, on_change, debounce=CONFIG_RELOAD_DEBOUNCE):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change  # on_change(subscriptions, added, removed, changed)
+        self.debounce = debounce
+        self.subscriptions = {}
+        self.digest = None
+        self.timer = None
+        self.lock = threading.Lock()
+        self.reload_lock = threading.Lock()  # One reload at a time even if one outlasts the debounce delay
+        self.observer = None
+
+    def load(self):
+        # Initial read, returns {sensor_name: subscription}
+        with open(self.path, 'rb') as file:
+            content = file.read()
+        self.subscriptions = parse_subscriptions(content)
+        self.digest = hashlib.sha256(content).hexdigest()
+        return self.subscriptions
+
+    def start(self):
+        self.observer = Observer()
+        self.observer.schedule(self, path=os.path.dirname(self.path), recursive=False)
+        self.observer.start()
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+
+    def on_any_event(self, event):
+        # Editors modify in place, the API renames a temporary file over the target
+        if event.event_type not in ('modified', 'created', 'moved'):
+            return
+        paths = (event.src_path, getattr(event, 'dest_path', None))
+        if any(path and os.path.abspath(path) == self.path for path in paths):
+            self.schedule_reload()
+
+    def schedule_reload(self, delay=None):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.debounce if delay is None else delay, self.reload)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def reload(self):
+        with self.reload_lock:
+            try:
+                with open(self.path, 'rb') as file:
+                    content = file.read()
+            except FileNotFoundError:
+                return
+            digest = hashlib.sha256(content).hexdigest()
+            if digest == self.digest:
+                return
+            try:
+                subscriptions = parse_subscriptions(content)
+            except (yaml.YAMLError, KeyError, TypeError, AttributeError) as e:
+                print_colored(f"Ignoring invalid {os.path.basename(self.path)}: {e}", "41")
+                return
+
+            added, removed, changed = diff_subscriptions(self.subscriptions, subscriptions)
+            if added or removed or changed:
+                print_colored(f"{os.path.basename(self.path)} changed: {len(added)} added, {len(removed)} removed, "
+                              f"{len(changed)} changed", "44")
+                try:
+                    self.on_change(subscriptions, added, removed, changed)
+                except Exception as e:
+                    # The previous state is kept so that the retry diffs against what was last applied in full
+                    print_colored(f"Failed to apply configuration changes, retrying in {CONFIG_RELOAD_RETRY:g}s: "
+                                  f"{e}", "41")
+                    self.schedule_reload(CONFIG_RELOAD_RETRY)
+                    return
+            self.subscriptions, self.digest = subscriptions, digest
+
+
+def print_colored(_text, color_code):
+    _text = "[CONFIG] - " + _text
+    print(f"\033[{color_code}m{_text}\033[0m", flush=True)
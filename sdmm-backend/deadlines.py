@@ -0,0 +1,56 @@
+# deadlines.py
+
+import heapq
+import threading
+import time
+
+
+# Min-heap of per-key deadlines with lazy re-checking: touch() only records the new deadline, and a heap entry
+# that turns out to be stale when it reaches the top is pushed back with the key's current deadline. Keeping
+# a sensor alive is therefore O(1) and the heap never holds more than one entry per key.
+class DeadlineHeap:
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+        self.scheduled = set()  # Keys that have an entry in the heap
+        self.condition = threading.Condition()
+
+    def touch(self, key, deadline):
+        with self.condition:
+            self.deadlines[key] = deadline
+            if key not in self.scheduled:
+                self.scheduled.add(key)
+                heapq.heappush(self.heap, (deadline, key))
+                if self.heap[0][1] == key:
+                    self.condition.notify()  # New earliest deadline, wake the waiter up
+
+    def remove(self, key):
+        with self.condition:
+            self.deadlines.pop(key, None)
+
+    def pop_expired(self, now=None):
+        # Removes and returns the keys whose current deadline has passed
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self.condition:
+            while self.heap and self.heap[0][0] <= now:
+                _, key = heapq.heappop(self.heap)
+                deadline = self.deadlines.get(key)
+                if deadline is None:
+                    self.scheduled.discard(key)  # Removed since it was scheduled
+                elif deadline > now:
+                    heapq.heappush(self.heap, (deadline, key))  # Touched since it was scheduled
+                else:
+                    self.scheduled.discard(key)
+                    del self.deadlines[key]
+                    expired.append(key)
+        return expired
+
+    def wait_expired(self):
+        # Blocks until at least one key expires and returns the expired keys
+        with self.condition:
+            while True:
+                expired = self.pop_expired()
+                if expired:
+                    return expired
+                self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
@@ -0,0 +1,206 @@
+# ingest.py
+
+import os
+import queue
+import threading
+import time
+
+import requests
+
+API_BASE_URL = 'http://localhost:5000/api'
+
+INGEST_MODE = os.getenv('INGEST_MODE', 'http')  # 'http' (loopback REST API) or 'db' (direct SQLAlchemy)
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 10000))
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 500))  # Rows per bulk write
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv('INGEST_FLUSH_INTERVAL_MS', 200))  # Max time a batch is held back
+INGEST_STATS_INTERVAL = int(os.getenv('INGEST_STATS_INTERVAL', 30))
+# Seconds a bulk POST may take in the HTTP mode; a stalled API would otherwise hold the worker and, once the
+# queue is full, the MQTT network threads
+INGEST_HTTP_TIMEOUT = float(os.getenv('INGEST_HTTP_TIMEOUT', 10))
+
+
+class HttpSink:
+    name = 'http'
+
+    def __init__(self):
+        self.session = requests.Session()
+
+    def write(self, readings):
+        response = self.session.post(f'{API_BASE_URL}/data/bulk', json=readings, timeout=INGEST_HTTP_TIMEOUT)
+        if response.status_code != 201:
+            raise Exception(f'Bulk insert failed with status {response.status_code}: {response.text}')
+        result = response.json()
+        if result.get('rejected'):
+            print_colored(f"Dropped {result['rejected']} readings with unknown sensor or type", "43")
+        return result['inserted']
+
+
+class DatabaseSink:
+    name = 'db'
+
+    def __init__(self):
+        # Imported lazily so that the HTTP mode does not need a database driver
+        from app import create_app
+
+        self.app = create_app()
+        self.session = requests.Session()
+
+    def write(self, readings):
+        from app.repository import split_valid_readings, bulk_insert_sensor_data
+
+        with self.app.app_context():
+            valid, rejected = split_valid_readings(readings)
+            if rejected:
+                print_colored(f"Dropped {len(rejected)} readings with unknown sensor or type", "43")
+            inserted = bulk_insert_sensor_data(valid)
+
+        # The live feed lives in the API process: forward the stored batch in one request
+        if valid:
+            try:
+                self.session.post(f'{API_BASE_URL}/live/publish', json={'readings': valid}, timeout=2)
+            except requests.RequestException as e:
+                print_colored(f"Failed to forward readings to the live feed: {e}", "43")
+        return inserted
+
+
+def create_sink(mode=INGEST_MODE):
+    if mode == 'db':
+        return DatabaseSink()
+    if mode == 'http':
+        return HttpSink()
+    raise ValueError(f'Unknown ingest mode: {mode}')
+
+
+class IngestWorker:
+    def __init__(self, sink, prepare=None, maxsize=INGEST_QUEUE_SIZE, batch_size=INGEST_BATCH_SIZE,
+                 flush_interval=INGEST_FLUSH_INTERVAL_MS / 1000.0, stats_interval=INGEST_STATS_INTERVAL):
+        self.sink = sink
+        # Turns a batch of queued items into readings for the sink; by default items are lists of readings
+        self.prepare = prepare or (lambda items: [reading for item in items for reading in item])
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats_interval = stats_interval
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.messages = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.blocked = 0
+        self.max_batch_rows = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+        self.max_queue_wait = 0.0
+        self.max_queue_depth = 0
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        if self.stats_interval > 0:
+            threading.Thread(target=self.report_stats, daemon=True).start()
+
+    def submit(self, item, rows=1):
+        # Blocks when the queue is full so that a slow sink applies backpressure
+        entry = (item, rows, time.monotonic())
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            with self.stats_lock:
+                self.blocked += 1
+            self.queue.put(entry)
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                self.flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def next_batch(self):
+        # Group queued items until the batch holds batch_size rows or flush_interval has passed
+        item, rows, enqueued_at = self.queue.get()
+        batch, batch_rows = [item], rows
+        oldest = enqueued_at
+        deadline = time.monotonic() + self.flush_interval
+        while batch_rows < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item, rows, enqueued_at = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            batch_rows += rows
+
+        with self.stats_lock:
+            self.max_queue_wait = max(self.max_queue_wait, time.monotonic() - oldest)
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize() + len(batch))
+        return batch
+
+    def flush(self, batch):
+        start = time.perf_counter()
+        try:
+            readings = self.prepare(batch)
+            rows = self.sink.write(readings) if readings else 0
+        except Exception as e:
+            with self.stats_lock:
+                self.errors += 1
+            print_colored(f"Failed to store {len(batch)} queued messages: {e}", "41")
+            return
+        elapsed = time.perf_counter() - start
+
+        with self.stats_lock:
+            self.messages += len(batch)
+            self.rows += rows
+            self.batches += 1
+            self.max_batch_rows = max(self.max_batch_rows, rows)
+            self.flush_time += elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    def stats(self):
+        with self.stats_lock:
+            return self.collect_stats()
+
+    def collect_stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'blocked_submits': self.blocked,
+            'messages': self.messages,
+            'rows': self.rows,
+            'batches': self.batches,
+            'errors': self.errors,
+            'avg_batch_rows': self.rows / self.batches if self.batches else 0.0,
+            'max_batch_rows': self.max_batch_rows,
+            'avg_flush_ms': self.flush_time / self.batches * 1000 if self.batches else 0.0,
+            'max_flush_ms': self.max_flush_time * 1000,
+            'max_queue_wait_ms': self.max_queue_wait * 1000
+        }
+
+    def report_stats(self):
+        last_time = time.time()
+        while True:
+            time.sleep(self.stats_interval)
+            now = time.time()
+            with self.stats_lock:
+                stats = self.collect_stats()
+                self.reset_stats()
+            elapsed = now - last_time
+            last_time = now
+            print_colored(f"Ingest ({self.sink.name}): {stats['messages'] / elapsed:.1f} msg/s, "
+                          f"{stats['rows'] / elapsed:.1f} rows/s, {stats['batches']} batches "
+                          f"(avg {stats['avg_batch_rows']:.0f} / max {stats['max_batch_rows']} rows), "
+                          f"flush avg {stats['avg_flush_ms']:.1f} ms / max {stats['max_flush_ms']:.1f} ms, "
+                          f"queue depth {stats['queue_depth']} (max {stats['max_queue_depth']}, "
+                          f"max wait {stats['max_queue_wait_ms']:.0f} ms, {stats['blocked_submits']} blocked), "
+                          f"{stats['errors']} errors", "42")
+
+
+def print_colored(_text, color_code):
+    _text = "[INGEST] - " + _text
+    print(f"\033[{color_code}m{_text}\033[0m", flush=True)
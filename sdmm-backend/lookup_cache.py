@@ -0,0 +1,95 @@
+# lookup_cache.py
+
+import os
+import threading
+import time
+
+import requests
+
+API_BASE_URL = 'http://localhost:5000/api'
+
+LOOKUP_CACHE_TTL = int(os.getenv('LOOKUP_CACHE_TTL', 300))  # Seconds before a cached lookup is refreshed
+
+
+class LookupCache:
+    def __init__(self, ttl=LOOKUP_CACHE_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+
+        value = loader()
+        # Misses are not cached so that newly created sensors and types are picked up immediately
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def peek(self, key):
+        # Cached value, expired or not, without loading it
+        with self.lock:
+            entry = self.entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+# Cached type-id, sensor name<->id and sensor existence lookups against the REST API
+class SensorLookup:
+    def __init__(self, ttl=LOOKUP_CACHE_TTL):
+        self.cache = LookupCache(ttl)
+
+    def get_type_id(self, type_name):
+        return self.cache.get(('type_id', type_name), lambda: self._fetch_type_id(type_name))
+
+    def get_sensor_id(self, sensor_name):
+        return self.cache.get(('sensor_id', sensor_name), lambda: self._fetch_sensor_id(sensor_name))
+
+    def sensor_exists(self, sensor_id, cached=True):
+        # Only active sensors are reported as existing, as by GET /api/sensors/<sensor_id>. Processes that do not
+        # delete sensors themselves pass cached=False: they would not see another process' deletion until the
+        # entry expires.
+        if not cached:
+            return self._fetch_sensor_exists(sensor_id) or False
+        return self.cache.get(('sensor', sensor_id), lambda: self._fetch_sensor_exists(sensor_id)) or False
+
+    def set_sensor(self, sensor_id, sensor_name):
+        self.cache.set(('sensor', sensor_id), True)
+        self.cache.set(('sensor_id', sensor_name), sensor_id)
+
+    def invalidate_sensor(self, sensor_id=None, sensor_name=None):
+        if sensor_name:
+            # The sensor id last cached for the name goes with it
+            sensor_id = sensor_id or self.cache.peek(('sensor_id', sensor_name))
+            self.cache.invalidate(('sensor_id', sensor_name))
+        if sensor_id:
+            self.cache.invalidate(('sensor', sensor_id))
+
+    def _fetch_type_id(self, type_name):
+        response = requests.get(f'{API_BASE_URL}/types/name/{type_name}')
+        if response.status_code == 200:
+            return response.json()['type_id']
+        return None
+
+    def _fetch_sensor_id(self, sensor_name):
+        response = requests.get(f'{API_BASE_URL}/sensors/sensor_id', params={'sensor_name': sensor_name})
+        if response.status_code == 200 and response.json():
+            return response.json()['sensor_id']
+        return None
+
+    def _fetch_sensor_exists(self, sensor_id):
+        response = requests.get(f'{API_BASE_URL}/sensors/{sensor_id}')
+        if response.status_code == 200:
+            return True
+        return None
@@ -0,0 +1,4 @@
+-- 0001_sensor_data_covering_index.sql
+-- Serves the per-sensor, per-type time range scans of /api/data and /api/sensor_board/<id>/history
+-- from the index alone: is_deleted and value are carried as trailing columns.
+CREATE INDEX idx_sensor_data_sensor_type_time ON SensorData (sensor_id, type_id, timestamp, is_deleted, value);
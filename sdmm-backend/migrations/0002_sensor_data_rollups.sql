@@ -0,0 +1,32 @@
+-- 0002_sensor_data_rollups.sql
+-- 1-minute, 1-hour and 1-day rollups of SensorData, maintained incrementally at ingest time.
+CREATE TABLE IF NOT EXISTS SensorDataRollups (
+    resolution ENUM ('1m', '1h', '1d') NOT NULL,
+    sensor_id CHAR(36) NOT NULL,
+    type_id CHAR(36) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    value_sum DOUBLE NOT NULL DEFAULT 0,
+    value_count INT NOT NULL DEFAULT 0,
+    value_min FLOAT,
+    value_max FLOAT,
+    PRIMARY KEY (resolution, sensor_id, type_id, bucket_start)
+);
+
+-- Backfill from the rows stored before the rollups existed
+INSERT INTO SensorDataRollups (resolution, sensor_id, type_id, bucket_start, value_sum, value_count, value_min, value_max)
+SELECT '1m', sensor_id, type_id, DATE_FORMAT(timestamp, '%Y-%m-%d %H:%i:00'), SUM(value), COUNT(value), MIN(value), MAX(value)
+FROM SensorData
+WHERE is_deleted = 0 AND timestamp IS NOT NULL AND value IS NOT NULL
+GROUP BY sensor_id, type_id, DATE_FORMAT(timestamp, '%Y-%m-%d %H:%i:00');
+
+INSERT INTO SensorDataRollups (resolution, sensor_id, type_id, bucket_start, value_sum, value_count, value_min, value_max)
+SELECT '1h', sensor_id, type_id, DATE_FORMAT(bucket_start, '%Y-%m-%d %H:00:00'), SUM(value_sum), SUM(value_count), MIN(value_min), MAX(value_max)
+FROM SensorDataRollups
+WHERE resolution = '1m'
+GROUP BY sensor_id, type_id, DATE_FORMAT(bucket_start, '%Y-%m-%d %H:00:00');
+
+INSERT INTO SensorDataRollups (resolution, sensor_id, type_id, bucket_start, value_sum, value_count, value_min, value_max)
+SELECT '1d', sensor_id, type_id, DATE(bucket_start), SUM(value_sum), SUM(value_count), MIN(value_min), MAX(value_max)
+FROM SensorDataRollups
+WHERE resolution = '1h'
+GROUP BY sensor_id, type_id, DATE(bucket_start);
@@ -0,0 +1,3 @@
+-- 0003_alerts_created_at_index.sql
+-- Keyset pages of /api/alerts walk (created_at, alert_id) newest first.
+CREATE INDEX idx_alerts_created_at ON Alerts (created_at, alert_id);
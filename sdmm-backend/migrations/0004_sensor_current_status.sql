@@ -0,0 +1,20 @@
+-- 0004_sensor_current_status.sql
+-- Latest status per sensor, moved in the same transaction as each SensorStatusHistory append, so the dashboard
+-- summary and latest-status reads no longer scan or sort the history.
+CREATE TABLE IF NOT EXISTS SensorCurrentStatus (
+    sensor_id CHAR(36) PRIMARY KEY,
+    status ENUM ('normal', 'warning', 'offline', 'disabled'),
+    status_id BIGINT NOT NULL,
+    timestamp TIMESTAMP NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_sensor_current_status_status (status),
+    FOREIGN KEY (sensor_id) REFERENCES Sensors (sensor_id)
+);
+
+-- Backfill from the newest history row of every sensor
+INSERT INTO SensorCurrentStatus (sensor_id, status, status_id, timestamp)
+SELECT history.sensor_id, history.status, history.status_id, history.timestamp
+FROM SensorStatusHistory history
+JOIN (SELECT sensor_id, MAX(status_id) AS status_id FROM SensorStatusHistory GROUP BY sensor_id) latest
+    ON history.status_id = latest.status_id
+WHERE history.sensor_id IS NOT NULL;
@@ -0,0 +1,12 @@
+-- 0005_alert_deduplication.sql
+-- Repeated alerts for the same (sensor, alert_type, condition) update the open alert instead of inserting rows.
+-- CONDITION is a reserved word in MySQL, hence condition_key.
+ALTER TABLE Alerts
+    ADD COLUMN condition_key VARCHAR(255) NULL,
+    ADD COLUMN occurrences INT NOT NULL DEFAULT 1,
+    ADD COLUMN last_seen_at TIMESTAMP NULL,
+    ADD COLUMN resolved_at TIMESTAMP NULL;
+
+UPDATE Alerts SET condition_key = message, last_seen_at = created_at;
+
+CREATE INDEX idx_alerts_dedup ON Alerts (sensor_id, alert_type, condition_key, is_deleted, status);
@@ -0,0 +1,21 @@
+-- 0006_subscriptions.sql
+-- MQTT subscriptions, previously only kept in subscriptions.yaml. Every write stamps the rows it touches with the
+-- next store version; deleted subscriptions stay as tombstones so that changes since any version can be listed.
+-- The store imports subscriptions.yaml on first use and keeps exporting it for the subscriber processes.
+CREATE TABLE IF NOT EXISTS Subscriptions (
+    subscription_id CHAR(36) PRIMARY KEY,
+    sensor_name VARCHAR(255) NOT NULL,
+    broker_address VARCHAR(255) NOT NULL,
+    broker_port INT NOT NULL,
+    topic VARCHAR(255) NOT NULL,
+    username VARCHAR(255),
+    password VARCHAR(255),
+    sensor_types JSON,
+    metadata JSON,
+    version BIGINT NOT NULL,
+    is_deleted BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_subscriptions_sensor_name (sensor_name),
+    INDEX idx_subscriptions_version (version)
+);
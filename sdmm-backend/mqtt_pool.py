@@ -0,0 +1,247 @@
+# mqtt_pool.py
+
+import os
+import random
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+MQTT_POOL_STATS_INTERVAL = int(os.getenv('MQTT_POOL_STATS_INTERVAL', 60))  # Seconds, 0 disables the report
+SUBSCRIBE_CHUNK_SIZE = 100  # Topic filters per SUBSCRIBE packet when (re)subscribing a whole connection
+MQTT_CONNECT_BACKOFF_BASE = float(os.getenv('MQTT_CONNECT_BACKOFF_BASE', 1))  # Seconds
+MQTT_CONNECT_BACKOFF_MAX = float(os.getenv('MQTT_CONNECT_BACKOFF_MAX', 60))  # Seconds
+
+
+# Topic filters ('+' one level, '#' all remaining levels) -> subscriptions, matched level by level so a message
+# costs one walk of its topic instead of a comparison with every subscribed filter
+class TopicTrie:
+    def __init__(self):
+        self.root = {}  # level -> node, a node is {'children': {...}, 'values': {key: value}}
+
+    def add(self, topic_filter, key, value):
+        children = self.root
+        node = None
+        for level in topic_filter.split('/'):
+            node = children.setdefault(level, {'children': {}, 'values': {}})
+            children = node['children']
+        node['values'][key] = value
+
+    def remove(self, topic_filter, key):
+        path = []
+        children = self.root
+        for level in topic_filter.split('/'):
+            node = children.get(level)
+            if node is None:
+                return
+            path.append((children, level, node))
+            children = node['children']
+        path[-1][2]['values'].pop(key, None)
+        # Prune the branches left empty
+        for children, level, node in reversed(path):
+            if node['values'] or node['children']:
+                break
+            del children[level]
+
+    def match(self, topic):
+        levels = topic.split('/')
+        matches = []
+        nodes = [self.root]
+        for index, level in enumerate(levels):
+            next_nodes = []
+            for children in nodes:
+                if '#' in children:
+                    matches.extend(children['#']['values'].values())
+                for name in (level, '+'):
+                    node = children.get(name)
+                    if node is not None:
+                        if index == len(levels) - 1:
+                            matches.extend(node['values'].values())
+                            # 'a/#' also matches 'a'
+                            if '#' in node['children']:
+                                matches.extend(node['children']['#']['values'].values())
+                        else:
+                            next_nodes.append(node['children'])
+            nodes = next_nodes
+        return matches
+
+
+class BrokerConnection:
+    # One MQTT client and network thread shared by every subscription on the same broker and credentials.
+    # Connecting and disconnecting happen on background threads so that callers never wait for the broker.
+    def __init__(self, broker_address, broker_port, username, password, on_message):
+        self.broker_address = broker_address
+        self.broker_port = broker_port
+        self.on_message = on_message
+        self.trie = TopicTrie()
+        self.filters = {}  # topic filter -> number of subscriptions using it
+        self.members = {}  # sensor_name -> topic filter of each subscription added
+        self.lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.closed = threading.Event()
+        self.running = False  # Network thread started
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        if username and password:
+            self.client.username_pw_set(username, password)
+        self.client.on_connect = self.handle_connect
+        self.client.on_message = self.handle_message
+
+    def start(self):
+        threading.Thread(target=self.connect, daemon=True).start()
+
+    def connect(self):
+        # Retries until the broker accepts the connection or the connection is closed, with exponential
+        # backoff and full jitter so that clients of a broker that comes back do not reconnect in lockstep
+        attempt = 0
+        while not self.closed.is_set():
+            try:
+                self.client.connect(self.broker_address, self.broker_port, 60)
+                break
+            except OSError as e:
+                delay = random.uniform(0, min(MQTT_CONNECT_BACKOFF_MAX, MQTT_CONNECT_BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+                print_colored(f"Connection to {self.broker_address}:{self.broker_port} failed ({e}). "
+                              f"Retrying in {delay:.1f} seconds (attempt {attempt})...", "43")
+                self.closed.wait(delay)
+
+        with self.state_lock:
+            if self.closed.is_set():
+                self.client.disconnect()  # Closed while connecting
+                return
+            self.client.loop_start()  # paho reconnects by itself from now on
+            self.running = True
+
+    def close(self):
+        with self.state_lock:
+            self.closed.set()  # Also ends a connect() still retrying
+            running = self.running
+        if running:
+            threading.Thread(target=self.disconnect, daemon=True).start()
+
+    def disconnect(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+        print_colored(f'Disconnected from {self.broker_address}', "42")
+
+    def add(self, subscription):
+        # Returns False when the subscription was already added, which only replaces what messages are routed to
+        topic = subscription['topic']
+        with self.lock:
+            self.trie.add(topic, subscription['sensor_name'], subscription)
+            if self.members.get(subscription['sensor_name']) == topic:
+                return False
+            self.members[subscription['sensor_name']] = topic
+            self.filters[topic] = self.filters.get(topic, 0) + 1
+            first = self.filters[topic] == 1
+        if first and self.client.is_connected():
+            self.client.subscribe(topic)  # Otherwise subscribed by handle_connect
+        return True
+
+    def remove(self, subscription):
+        # Returns (removed, empty): removed is False when the subscription was already removed, which config
+        # reloads that failed part way and are retried run into; empty when no subscriptions are left
+        topic = subscription['topic']
+        with self.lock:
+            if self.members.get(subscription['sensor_name']) != topic:
+                return False, not self.filters
+            del self.members[subscription['sensor_name']]
+            self.trie.remove(topic, subscription['sensor_name'])
+            self.filters[topic] -= 1
+            last = self.filters[topic] == 0
+            if last:
+                del self.filters[topic]
+            empty = not self.filters
+        if last and not empty and self.client.is_connected():
+            self.client.unsubscribe(topic)
+        return True, empty
+
+    def handle_connect(self, _client, userdata, flags, reason_code, properties=None):
+        if reason_code.is_failure:
+            print_colored(f"Connection to {self.broker_address}:{self.broker_port} failed: {reason_code}", "41")
+            return
+        # Also runs on reconnects, which need every filter subscribed again
+        with self.lock:
+            topics = list(self.filters)
+        for start in range(0, len(topics), SUBSCRIBE_CHUNK_SIZE):
+            self.client.subscribe([(topic, 0) for topic in topics[start:start + SUBSCRIBE_CHUNK_SIZE]])
+
+    def handle_message(self, _client, userdata, msg):
+        with self.lock:
+            subscriptions = self.trie.match(msg.topic)
+        for subscription in subscriptions:
+            self.on_message(subscription, msg)
+
+
+class ConnectionPool:
+    def __init__(self, on_message, stats_interval=MQTT_POOL_STATS_INTERVAL):
+        self.on_message = on_message
+        self.stats_interval = stats_interval
+        self.connections = {}  # (broker_address, broker_port, username, password) -> BrokerConnection
+        self.subscriptions = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.stats_interval > 0:
+            threading.Thread(target=self.report_stats, daemon=True).start()
+
+    @staticmethod
+    def connection_key(subscription):
+        return (subscription['broker_address'], subscription['broker_port'],
+                subscription.get('username'), subscription.get('password'))
+
+    def subscribe(self, subscription):
+        # Returns at once: a new connection is established in the background and subscribes on connect
+        key = self.connection_key(subscription)
+        with self.lock:
+            connection = self.connections.get(key)
+            if connection is None:
+                connection = self.connections[key] = BrokerConnection(*key, on_message=self.on_message)
+                connection.start()
+            if connection.add(subscription):
+                self.subscriptions += 1
+
+    def unsubscribe(self, subscription):
+        key = self.connection_key(subscription)
+        with self.lock:
+            connection = self.connections.get(key)
+            if connection is None:
+                return
+            removed, empty = connection.remove(subscription)
+            if removed:
+                self.subscriptions -= 1
+            if empty:
+                del self.connections[key]
+                connection.close()
+
+    def report_stats(self):
+        while True:
+            time.sleep(self.stats_interval)
+            with self.lock:
+                subscriptions, connections = self.subscriptions, len(self.connections)
+                connected = sum(connection.client.is_connected() for connection in self.connections.values())
+            if not subscriptions:
+                continue
+            threads = threading.active_count()
+            rss_mb = current_rss_bytes() / (1024 * 1024)
+            print_colored(f"{subscriptions} subscriptions over {connections} broker connections "
+                          f"({connected} connected): {threads} threads, "
+                          f"RSS {rss_mb:.1f} MB; per 1,000 sensors {threads * 1000 / subscriptions:.1f} threads, "
+                          f"{rss_mb * 1000 / subscriptions:.1f} MB", "42")
+
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Peak, not current, outside Linux
+
+
+def print_colored(_text, color_code):
+    _text = "[MQTT_POOL] - " + _text
+    print(f"\033[{color_code}m{_text}\033[0m", flush=True)
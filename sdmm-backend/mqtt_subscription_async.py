@@ -0,0 +1,450 @@
+# mqtt_subscription_async.py
+#
+# asyncio runtime of the MQTT subscriber, selected with SUBSCRIBER_RUNTIME=asyncio (see run.py). Every broker
+# connection and every subscription is a task on one event loop: a subscription task owns its sensor's state,
+# so there is no shared-dict locking, and its offline detection is the timeout of its own queue wait.
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+import aiohttp
+import aiomqtt
+
+from config_watcher import (CONFIG_RELOAD_RETRY, RESUBSCRIBE_FIELDS, diff_subscriptions, offline_threshold,
+                            parse_subscriptions)
+from ingest import (INGEST_MODE, INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL_MS,
+                    INGEST_STATS_INTERVAL, INGEST_HTTP_TIMEOUT)
+from lookup_cache import LookupCache
+from mqtt_pool import (MQTT_CONNECT_BACKOFF_BASE, MQTT_CONNECT_BACKOFF_MAX, SUBSCRIBE_CHUNK_SIZE, TopicTrie,
+                       current_rss_bytes)
+from payload_formats import load_registry
+from streaming_alerts import STREAMING_ALERTS, StreamingThresholdEvaluator
+
+SUBSCRIPTION_FILE_PATH = 'subscriptions.yaml'
+API_BASE_URL = 'http://localhost:5000/api'
+
+CONFIG_POLL_INTERVAL = 1  # Seconds between checks of the subscription file
+SUBSCRIPTION_QUEUE_SIZE = 100  # Messages buffered per subscription before the broker task waits
+
+
+class AsyncBrokerConnection:
+    # One aiomqtt client per broker and credentials; incoming messages are routed with a topic trie
+    def __init__(self, manager, key):
+        self.manager = manager
+        self.broker_address, self.broker_port, self.username, self.password = key
+        self.trie = TopicTrie()
+        self.filters = {}  # topic filter -> number of subscriptions using it
+        self.client = None  # Set while connected
+        self.task = None
+
+    async def run(self):
+        attempt = 0
+        while True:
+            try:
+                async with aiomqtt.Client(self.broker_address, port=self.broker_port, username=self.username,
+                                          password=self.password, keepalive=60) as client:
+                    attempt = 0
+                    # Set before the initial subscribe so that a subscription added during its awaits subscribes
+                    # itself instead of waiting for the next reconnect
+                    self.client = client
+                    topics = list(self.filters)
+                    for start in range(0, len(topics), SUBSCRIBE_CHUNK_SIZE):
+                        await client.subscribe([(topic, 0) for topic in topics[start:start + SUBSCRIBE_CHUNK_SIZE]])
+                    async for message in client.messages:
+                        for subscription in self.trie.match(message.topic.value):
+                            await self.manager.route(subscription, message.payload)
+            except aiomqtt.MqttError as e:
+                # Same jittered exponential backoff as the threaded runtime's BrokerConnection.connect
+                self.client = None
+                delay = random.uniform(0, min(MQTT_CONNECT_BACKOFF_MAX, MQTT_CONNECT_BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+                print_colored(f"Connection to {self.broker_address}:{self.broker_port} failed ({e}). "
+                              f"Retrying in {delay:.1f} seconds (attempt {attempt})...", "43")
+                await asyncio.sleep(delay)
+            finally:
+                self.client = None
+
+    async def add(self, subscription):
+        topic = subscription['topic']
+        self.trie.add(topic, subscription['sensor_name'], subscription)
+        self.filters[topic] = self.filters.get(topic, 0) + 1
+        if self.filters[topic] == 1 and self.client is not None:
+            try:
+                await self.client.subscribe(topic)
+            except aiomqtt.MqttError:
+                pass  # Subscribed again with every filter on reconnect
+
+    async def remove(self, subscription):
+        # Returns True when the connection has no subscriptions left
+        topic = subscription['topic']
+        self.trie.remove(topic, subscription['sensor_name'])
+        self.filters[topic] -= 1
+        if self.filters[topic] == 0:
+            del self.filters[topic]
+            if self.filters and self.client is not None:
+                try:
+                    await self.client.unsubscribe(topic)
+                except aiomqtt.MqttError:
+                    pass
+        return not self.filters
+
+
+class AsyncSubscription:
+    def __init__(self, subscription):
+        self.subscription = subscription
+        self.sensor_name = subscription['sensor_name']
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+        self.threshold = offline_threshold(subscription)
+        self.sensor_id = None
+        self.status = None  # Unknown until the first message, then only transitions are written
+        self.task = None
+
+
+class AsyncSubscriptionManager:
+    def __init__(self):
+        self.subscriptions = {}  # sensor name -> AsyncSubscription
+        self.connections = {}  # (broker_address, broker_port, username, password) -> AsyncBrokerConnection
+        self.cache = LookupCache()
+        self.ingest = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+        self.evaluator = StreamingThresholdEvaluator() if STREAMING_ALERTS else None
+        self.payload_formats = load_registry()
+        self.db_sink = None
+        self.config_mtime = None
+        self.config_digest = None
+        self.config = {}  # sensor_name -> subscription, as last read from the file
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.messages = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+
+    async def run(self):
+        async with aiohttp.ClientSession() as self.session, asyncio.TaskGroup() as self.tasks:
+            if INGEST_MODE == 'db':
+                from ingest import DatabaseSink
+                self.db_sink = await asyncio.to_thread(DatabaseSink)
+            if self.evaluator:
+                self.evaluator.start()
+            self.tasks.create_task(self.run_ingest())
+            self.tasks.create_task(self.watch_config())
+            if INGEST_STATS_INTERVAL > 0:
+                self.tasks.create_task(self.report_stats())
+
+    # Subscriptions
+
+    async def add_subscription(self, subscription):
+        state = AsyncSubscription(subscription)
+        self.subscriptions[state.sensor_name] = state
+        if self.evaluator:
+            self.evaluator.set_subscription(subscription)
+
+        key = (subscription['broker_address'], subscription['broker_port'],
+               subscription.get('username'), subscription.get('password'))
+        connection = self.connections.get(key)
+        if connection is None:
+            connection = self.connections[key] = AsyncBrokerConnection(self, key)
+            connection.task = self.tasks.create_task(connection.run())
+        await connection.add(subscription)
+        state.task = self.tasks.create_task(self.run_subscription(state))
+
+    async def remove_subscription(self, sensor_name):
+        state = self.subscriptions.pop(sensor_name, None)
+        if state is None:
+            return
+
+        # Stop routing first, then cancel the subscription task and wait until it has stopped
+        key = (state.subscription['broker_address'], state.subscription['broker_port'],
+               state.subscription.get('username'), state.subscription.get('password'))
+        connection = self.connections[key]
+        if await connection.remove(state.subscription):
+            del self.connections[key]
+            connection.task.cancel()
+            print_colored(f'Disconnected from {connection.broker_address}', "42")
+        state.task.cancel()
+        try:
+            await state.task
+        except asyncio.CancelledError:
+            pass
+
+        if self.evaluator:
+            self.evaluator.remove_subscription(sensor_name)
+        self.cache.invalidate(('sensor_id', sensor_name))
+        if state.sensor_id:
+            await self.remove_sensor_from_db(state.sensor_id)
+
+    async def route(self, subscription, payload):
+        state = self.subscriptions.get(subscription['sensor_name'])
+        if state is not None and state.subscription is subscription:
+            await state.queue.put((payload, time.monotonic()))
+
+    async def run_subscription(self, state):
+        while True:
+            try:
+                async with asyncio.timeout(state.threshold):
+                    payload, received_at = await state.queue.get()
+            except TimeoutError:
+                if state.sensor_id and state.status != 'offline':
+                    try:
+                        await self.mark_offline(state)
+                    except Exception as e:
+                        print_colored(f"Failed to mark sensor {state.sensor_name} as offline: {e}", "41")
+                continue
+
+            try:
+                await self.handle_message(state, payload, received_at)
+            except Exception as e:
+                print_colored(f"Failed to handle message: {e}", "41")
+
+    async def handle_message(self, state, payload, received_at):
+        try:
+            decoded = self.payload_formats.readings(payload, state.subscription)
+        except ValueError as e:
+            print_colored(f"Failed to decode MQTT message: {e}", "41")
+            return
+
+        readings = []
+        for sensor_id, timestamp, values in decoded:
+            if self.evaluator:
+                self.evaluator.evaluate(state.sensor_name, sensor_id, values, received_at)
+            await self.register_sensor(state, sensor_id)
+            for type_name, value in values.items():
+                readings.append({
+                    'sensor_id': sensor_id,
+                    'type_id': await self.get_type_id(type_name),
+                    'timestamp': timestamp,
+                    'value': value
+                })
+        if readings:
+            await self.ingest.put(readings)
+
+    # Sensor registration and status, same REST calls as mqtt_subscription.py
+
+    async def register_sensor(self, state, sensor_id):
+        if not await self.sensor_exists(sensor_id):
+            if state.sensor_id:
+                await self.remove_sensor_from_db(state.sensor_id)
+            state.sensor_id = sensor_id
+            await self.add_sensor_to_db(sensor_id, state.subscription)
+            state.status = 'normal'
+
+        if state.status != 'normal':
+            if state.status == 'offline':
+                print_colored(f"Sensor {state.sensor_name} (ID: {sensor_id}) has received new data. "
+                              f"Marking as normal.", "44")
+            state.sensor_id = sensor_id
+            state.status = 'normal'
+            await self.update_sensor_status(sensor_id, 'normal')
+            if self.evaluator:
+                self.evaluator.reset(state.sensor_name)
+
+    async def add_sensor_to_db(self, sensor_id, subscription):
+        await self.request('post', '/sensors', json={
+            'sensor_id': sensor_id,
+            'name': subscription['sensor_name'],
+            'location': subscription['topic'],
+            'status': 'active'
+        })
+        for sensor_type in subscription['sensor_types']:
+            await self.request('post', '/mappings', json={
+                'sensor_id': sensor_id,
+                'type_id': await self.get_type_id(sensor_type)
+            })
+        await self.add_sensor_metadata(sensor_id, subscription)
+        await self.update_sensor_status(sensor_id, 'normal')
+        self.cache.set(('sensor', sensor_id), True)
+        self.cache.set(('sensor_id', subscription['sensor_name']), sensor_id)
+
+    async def remove_sensor_from_db(self, sensor_id):
+        self.cache.invalidate(('sensor', sensor_id))
+        await self.request('delete', f'/sensors/{sensor_id}/delete')
+        await self.remove_sensor_metadata(sensor_id)
+        await self.update_sensor_status(sensor_id, 'disabled')
+
+    async def add_sensor_metadata(self, sensor_id, subscription):
+        for item in subscription.get('metadata') or []:
+            key, value = list(item.items())[0]
+            await self.request('post', '/metadata', json={'sensor_id': sensor_id, 'key': key, 'value': value})
+
+    async def remove_sensor_metadata(self, sensor_id):
+        status, metadata_list = await self.request('get', f'/metadata/sensor/{sensor_id}')
+        if status == 200:
+            for metadata in metadata_list:
+                await self.request('delete', f'/metadata/{metadata["metadata_id"]}')
+
+    async def update_metadata(self, subscription):
+        # Metadata-only change: the MQTT subscription and the registered sensor are kept
+        state = self.subscriptions[subscription['sensor_name']]
+        state.subscription['metadata'] = subscription.get('metadata')  # In place, the trie routes with it
+        state.threshold = offline_threshold(state.subscription)  # Used from the next queue wait on
+        if self.evaluator:
+            self.evaluator.set_subscription(state.subscription)
+        if state.sensor_id:
+            await self.remove_sensor_metadata(state.sensor_id)
+            await self.add_sensor_metadata(state.sensor_id, state.subscription)
+
+    async def mark_offline(self, state):
+        print_colored(f"Sensor {state.sensor_name} (ID: {state.sensor_id}) has not received data within the "
+                      f"threshold. Marking as offline.", "44")
+        status, _ = await self.request('post', '/alerts', json={
+            'sensor_id': state.sensor_id,
+            'alert_type': 'connection issue',
+            'message': f'Sensor {state.sensor_name} has not received data within the threshold.',
+            'condition': 'offline',
+        })
+        if status not in [200, 201]:
+            raise Exception('Failed to send alerts')
+        state.status = 'offline'
+        await self.update_sensor_status(state.sensor_id, 'offline')
+        if self.evaluator:
+            self.evaluator.reset(state.sensor_name)
+
+    async def update_sensor_status(self, sensor_id, status):
+        await self.request('put', f'/sensors/{sensor_id}/status', json={'status': status})
+
+    async def get_type_id(self, type_name):
+        type_id = self.cache.get(('type_id', type_name), lambda: None)
+        if type_id is None:
+            status, body = await self.request('get', f'/types/name/{type_name}')
+            if status == 200:
+                type_id = body['type_id']
+                self.cache.set(('type_id', type_name), type_id)
+        return type_id
+
+    async def sensor_exists(self, sensor_id):
+        if self.cache.get(('sensor', sensor_id), lambda: None):
+            return True
+        status, _ = await self.request('get', f'/sensors/{sensor_id}')
+        if status == 200:
+            self.cache.set(('sensor', sensor_id), True)
+            return True
+        return False
+
+    async def request(self, method, path, **kwargs):
+        async with self.session.request(method, f'{API_BASE_URL}{path}', **kwargs) as response:
+            body = await response.json() if response.content_type == 'application/json' else None
+            return response.status, body
+
+    # Ingest: readings are batched like IngestWorker does on its thread
+
+    async def run_ingest(self):
+        flush_interval = INGEST_FLUSH_INTERVAL_MS / 1000.0
+        while True:
+            batch = await self.ingest.get()
+            messages = 1
+            deadline = time.monotonic() + flush_interval
+            while len(batch) < INGEST_BATCH_SIZE:
+                try:
+                    async with asyncio.timeout(max(deadline - time.monotonic(), 0)):
+                        batch = batch + await self.ingest.get()
+                except TimeoutError:
+                    break
+                messages += 1
+
+            try:
+                if self.db_sink is not None:
+                    rows = await asyncio.to_thread(self.db_sink.write, batch)
+                else:
+                    status, body = await self.request('post', '/data/bulk', json=batch,
+                                                      timeout=aiohttp.ClientTimeout(total=INGEST_HTTP_TIMEOUT))
+                    if status != 201:
+                        raise Exception(f'Bulk insert failed with status {status}: {body}')
+                    if body.get('rejected'):
+                        print_colored(f"Dropped {body['rejected']} readings with unknown sensor or type", "43")
+                    rows = body['inserted']
+            except Exception as e:
+                self.errors += 1
+                print_colored(f"Failed to store {messages} queued messages: {e}", "41")
+                continue
+            self.messages += messages
+            self.rows += rows
+            self.batches += 1
+
+    async def report_stats(self):
+        last_time = time.time()
+        while True:
+            await asyncio.sleep(INGEST_STATS_INTERVAL)
+            now = time.time()
+            elapsed, last_time = now - last_time, now
+            print_colored(f"Ingest ({INGEST_MODE}): {self.messages / elapsed:.1f} msg/s, {self.rows / elapsed:.1f} "
+                          f"rows/s, {self.batches} batches, {self.errors} errors, queue depth {self.ingest.qsize()}; "
+                          f"{len(self.subscriptions)} subscriptions over {len(self.connections)} broker "
+                          f"connections, {len(asyncio.all_tasks())} tasks, "
+                          f"RSS {current_rss_bytes() / (1024 * 1024):.1f} MB", "42")
+            self.reset_stats()
+
+    # Configuration
+
+    async def watch_config(self):
+        # Polled: a cheap stat every CONFIG_POLL_INTERVAL, a hash only when the mtime moved, and a reload only
+        # when the content differs. Applying the diff also waits for the previous one, so saves are coalesced.
+        retry_at = None
+        while True:
+            try:
+                mtime = os.stat(SUBSCRIPTION_FILE_PATH).st_mtime
+            except OSError:
+                mtime = None
+            now = time.monotonic()
+            if mtime is not None and (mtime != self.config_mtime or (retry_at is not None and now >= retry_at)):
+                self.config_mtime = mtime
+                retry_at = None
+                try:
+                    await self.reload_config()
+                except Exception as e:
+                    retry_at = now + CONFIG_RELOAD_RETRY
+                    print_colored(f"Failed to reload subscriptions, retrying in {CONFIG_RELOAD_RETRY:g}s: {e}", "41")
+            await asyncio.sleep(CONFIG_POLL_INTERVAL)
+
+    async def reload_config(self):
+        with open(SUBSCRIPTION_FILE_PATH, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == self.config_digest:
+            return
+        subscriptions = parse_subscriptions(content)
+        added, removed, changed = diff_subscriptions(self.config, subscriptions)
+        initial = self.config_digest is None
+        if not initial and (added or removed or changed):
+            print_colored(f"Config file changed: {len(added)} added, {len(removed)} removed, "
+                          f"{len(changed)} changed", "44")
+
+        for sensor_name in removed:
+            print_colored(f"Removing subscription for {sensor_name}", "44")
+            await self.remove_subscription(sensor_name)
+
+        for sensor_name, fields in changed.items():
+            if sensor_name not in self.subscriptions:
+                print_colored(f"Adding new subscription for {sensor_name}", "44")
+                await self.add_subscription(subscriptions[sensor_name])
+            elif fields & RESUBSCRIBE_FIELDS:
+                print_colored(f"Updating subscription for {sensor_name} ({', '.join(sorted(fields))})", "44")
+                await self.remove_subscription(sensor_name)
+                await self.add_subscription(subscriptions[sensor_name])
+            else:
+                print_colored(f"Updating {', '.join(sorted(fields))} of {sensor_name}", "44")
+                await self.update_metadata(subscriptions[sensor_name])
+
+        for sensor_name in added:
+            if sensor_name in self.subscriptions:
+                continue  # Added by an earlier attempt that failed part way and is being retried
+            print_colored(f"Adding new subscription for {sensor_name}", "44")
+            await self.add_subscription(subscriptions[sensor_name])
+
+        # Only once the whole diff is applied, so that a failed reload is diffed and applied again
+        self.config, self.config_digest = subscriptions, digest
+
+
+def print_colored(_text, color_code):
+    _text = "[MQTT_SYS] - " + _text
+    print(f"\033[{color_code}m{_text}\033[0m", flush=True)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(AsyncSubscriptionManager().run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,249 @@
+# payload_formats.py
+#
+# Binary layouts of the sensor board payloads. A format is a fixed-size record described as a NumPy structured
+# dtype plus the sensor types it carries; a payload is one record or several packed back to back, optionally
+# preceded by the format's version byte, and is decoded in a single np.frombuffer call. Formats other than the
+# built-in one are read from payload_formats.yaml, so a new board layout needs no code change. A subscription
+# picks its format with a `payload_format` metadata entry, otherwise it is recognised from the payload.
+#
+# Batching publishers (mqtt-sensors/mqtt_publisher.py, PUBLISH_MODE=batch) send framed payloads instead:
+#   header '!2sBBBH': magic b'SB', frame version, flags, format version (a `version` of this registry), count
+#   body: `count` records of the format, or with FLAG_DELTA the first record followed by `count - 1` records of
+#         the differences to the previous one, each field but device_id as a signed integer of half its width
+
+import os
+import struct
+import uuid
+from datetime import datetime
+
+import numpy as np
+import yaml
+
+PAYLOAD_FORMATS_FILE = os.getenv('PAYLOAD_FORMATS_FILE', 'payload_formats.yaml')
+
+FRAME_MAGIC = b'SB'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('!2sBBBH')
+FLAG_DELTA = 0x01
+
+STRUCT_CODES = {('u', 1): 'B', ('u', 2): 'H', ('u', 4): 'I', ('u', 8): 'Q', ('i', 1): 'b', ('i', 2): 'h',
+                ('i', 4): 'i', ('i', 8): 'q', ('f', 4): 'f', ('f', 8): 'd'}
+
+
+class PayloadFormatError(ValueError):
+    pass
+
+
+class PayloadFormat:
+    def __init__(self, name, fields, types, version=None):
+        self.name = name
+        self.version = version
+        self.dtype = np.dtype([(field, dtype) for field, dtype in fields])
+        # type_name -> (record field, divisor), e.g. Temperature is sent in hundredths of a degree
+        self.types = {type_name: (mapping['field'], float(mapping.get('divisor', 1)))
+                      for type_name, mapping in types.items()}
+        self.header_size = 0 if version is None else 1
+        self.record = record_struct(self.dtype)
+        self.delta_dtype = delta_dtype(self.dtype)
+
+        missing = {'device_id', 'timestamp'} - set(self.dtype.names)
+        missing |= {field for field, _ in self.types.values() if field not in self.dtype.names}
+        if missing:
+            raise PayloadFormatError(f"Payload format {name} has no {', '.join(sorted(missing))} field")
+        if self.dtype['device_id'].itemsize != 16:
+            raise PayloadFormatError(f"Payload format {name}: device_id must be 16 bytes")
+
+    @classmethod
+    def from_config(cls, config):
+        try:
+            return cls(config['name'], [tuple(field) for field in config['fields']], config['types'],
+                       config.get('version'))
+        except (KeyError, TypeError) as e:
+            raise PayloadFormatError(f"Invalid payload format {config.get('name')}: {e}")
+
+    def matches(self, payload):
+        body = len(payload) - self.header_size
+        return body > 0 and body % self.dtype.itemsize == 0
+
+    def decode(self, payload):
+        if not self.matches(payload):
+            raise PayloadFormatError(f"{len(payload)} bytes is not a whole number of {self.name} records")
+        return np.frombuffer(payload, dtype=self.dtype, offset=self.header_size)
+
+    def decode_frame(self, body, count, flags):
+        if not flags & FLAG_DELTA or count == 1:
+            if len(body) != count * self.dtype.itemsize:
+                raise PayloadFormatError(f"Frame of {count} {self.name} records has {len(body)} bytes")
+            return np.frombuffer(body, dtype=self.dtype)
+
+        if self.delta_dtype is None:
+            raise PayloadFormatError(f"Payload format {self.name} has non-integer fields, it cannot be delta encoded")
+        if len(body) != self.dtype.itemsize + (count - 1) * self.delta_dtype.itemsize:
+            raise PayloadFormatError(f"Delta frame of {count} {self.name} records has {len(body)} bytes")
+        first = np.frombuffer(body, dtype=self.dtype, count=1)
+        deltas = np.frombuffer(body, dtype=self.delta_dtype, offset=self.dtype.itemsize)
+        records = np.empty(count, dtype=self.dtype)
+        records['device_id'] = first['device_id'][0]
+        for field in self.delta_dtype.names:
+            column = np.empty(count, dtype=np.int64)
+            column[0] = first[field][0]
+            column[1:] = deltas[field]
+            records[field] = np.cumsum(column)
+        return records
+
+    def readings(self, payload, sensor_types):
+        # [(sensor_id, timestamp, {type_name: value})] per record, with only the types mapped to the sensor
+        if self.record is not None and len(payload) == self.header_size + self.dtype.itemsize:
+            # A single record is cheaper to unpack with struct than to set up NumPy views for
+            record = dict(zip(self.dtype.names, self.record.unpack_from(payload, self.header_size)))
+            values = {type_name: record[self.types[type_name][0]] / self.types[type_name][1]
+                      for type_name in sensor_types if type_name in self.types}
+            return [(str(uuid.UUID(bytes=record['device_id'])),
+                     datetime.fromtimestamp(record['timestamp']).strftime('%Y-%m-%d %H:%M:%S'), values)]
+        return self.record_readings(self.decode(payload), sensor_types)
+
+    def record_readings(self, records, sensor_types):
+        columns = {}
+        for type_name in sensor_types:
+            if type_name in self.types:
+                field, divisor = self.types[type_name]
+                column = records[field].astype(np.float64)
+                columns[type_name] = (column / divisor if divisor != 1 else column).tolist()
+
+        # Batches usually repeat the same device and few distinct seconds: convert each once
+        sensor_ids, timestamps = {}, {}
+        readings = []
+        for i, (device_id, timestamp) in enumerate(zip(records['device_id'].tolist(),
+                                                       records['timestamp'].tolist())):
+            sensor_id = sensor_ids.get(device_id)
+            if sensor_id is None:
+                sensor_id = sensor_ids[device_id] = str(uuid.UUID(bytes=device_id))
+            formatted = timestamps.get(timestamp)
+            if formatted is None:
+                formatted = timestamps[timestamp] = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+            readings.append((sensor_id, formatted, {type_name: column[i] for type_name, column in columns.items()}))
+        return readings
+
+
+def record_struct(dtype):
+    # Equivalent struct layout when the dtype has no padding and a single byte order, otherwise None
+    order, codes = None, []
+    for name in dtype.names:
+        field = dtype.fields[name][0]
+        if field.kind in 'VS':
+            codes.append(f'{field.itemsize}s')
+            continue
+        code = STRUCT_CODES.get((field.kind, field.itemsize))
+        if code is None:
+            return None
+        if field.itemsize > 1:
+            if order not in (None, field.byteorder):
+                return None
+            order = field.byteorder
+        codes.append(code)
+    layout = struct.Struct({'>': '>', '<': '<', '=': '='}.get(order, '>') + ''.join(codes))
+    return layout if layout.size == dtype.itemsize else None
+
+
+def delta_dtype(dtype):
+    # Layout of a delta-encoded record: every field but device_id as a big-endian signed integer of half its
+    # width, or None when the format has fields that cannot be delta encoded
+    fields = []
+    for name in dtype.names:
+        if name == 'device_id':
+            continue
+        field = dtype.fields[name][0]
+        if field.kind not in 'iu':
+            return None
+        fields.append((name, f'>i{max(field.itemsize // 2, 1)}'))
+    return np.dtype(fields)
+
+
+# Layout sent by mqtt-sensors/mqtt_publisher.py ('!16sQiII'), without a version byte
+COMBINED = PayloadFormat('combined', [
+    ('device_id', 'V16'),
+    ('timestamp', '>u8'),
+    ('temperature', '>i4'),
+    ('humidity', '>u4'),
+    ('co2_concentration', '>u4'),
+], {
+    'Temperature': {'field': 'temperature', 'divisor': 100},
+    'Humidity': {'field': 'humidity'},
+    'CO2 Concentration': {'field': 'co2_concentration'},
+})
+
+
+def subscription_payload_format(subscription):
+    for item in subscription.get('metadata') or []:
+        if isinstance(item, dict) and item.get('payload_format'):
+            return item['payload_format']
+    return None
+
+
+class PayloadRegistry:
+    def __init__(self, formats=(COMBINED,)):
+        self.by_name = {}
+        self.by_version = {}
+        for payload_format in formats:
+            self.register(payload_format)
+
+    def register(self, payload_format):
+        if payload_format.version is not None:
+            self.by_version[payload_format.version] = payload_format
+        self.by_name[payload_format.name] = payload_format
+
+    def load(self, path):
+        with open(path, 'r') as file:
+            config = yaml.safe_load(file) or {}
+        for format_config in config.get('formats') or []:
+            self.register(PayloadFormat.from_config(format_config))
+
+    def for_payload(self, payload, subscription):
+        # The subscription's format, then the unversioned built-in layout, then the leading version byte
+        name = subscription_payload_format(subscription)
+        if name is not None:
+            if name not in self.by_name:
+                raise PayloadFormatError(f"Unknown payload format {name}")
+            return self.by_name[name]
+        if COMBINED.matches(payload):
+            return COMBINED
+        payload_format = self.by_version.get(payload[0]) if payload else None
+        if payload_format is None or not payload_format.matches(payload):
+            raise PayloadFormatError(f"Unrecognised {len(payload)} byte payload")
+        return payload_format
+
+    def decode_frame(self, payload):
+        # (format, records) of a framed batch, None when the payload is not one
+        if len(payload) < FRAME_HEADER.size or not payload.startswith(FRAME_MAGIC):
+            return None
+        _, frame_version, flags, format_version, count = FRAME_HEADER.unpack_from(payload)
+        payload_format = self.by_version.get(format_version)
+        if count == 0 or frame_version != FRAME_VERSION or payload_format is None:
+            # Most likely an unversioned record whose device id starts with the magic
+            return None
+        return payload_format, payload_format.decode_frame(payload[FRAME_HEADER.size:], count, flags)
+
+    def readings(self, payload, subscription):
+        sensor_types = subscription.get('sensor_types') or []
+        if not COMBINED.matches(payload):
+            frame = self.decode_frame(payload)
+            if frame is not None:
+                payload_format, records = frame
+                return payload_format.record_readings(records, sensor_types)
+        payload_format = self.for_payload(payload, subscription)
+        return payload_format.readings(payload, sensor_types)
+
+
+def load_registry(path=PAYLOAD_FORMATS_FILE):
+    registry = PayloadRegistry()
+    if os.path.exists(path):
+        try:
+            registry.load(path)
+        except (yaml.YAMLError, PayloadFormatError, TypeError, ValueError) as e:
+            print_colored(f"Ignoring {path}: {e}", "41")
+    return registry
+
+
+def print_colored(_text, color_code):
+    _text = "[PAYLOAD] - " + _text
+    print(f"\033[{color_code}m{_text}\033[0m", flush=True)
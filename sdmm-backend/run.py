@@ -1,17 +1,25 @@
 # run.py
 
+import os
 import subprocess
 import threading
 import time
 
 import pyfiglet
 from sqlalchemy import text
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 
 from app import create_app, db
+from app.latest_readings import latest_readings
+from app.migrations import run_migrations
+from app.partitioning import (enable_sensor_data_partitioning, ensure_sensor_data_partitions,
+                              drop_sensor_data_partitions)
+from streaming_alerts import STREAMING_ALERTS
 
 app = create_app()
 
+SUBSCRIBER_RUNTIME = os.getenv('SUBSCRIBER_RUNTIME', 'threads')  # 'threads' or 'asyncio'
+
 
 def wait_for_db():
     retries = 10
@@ -30,9 +38,53 @@ def wait_for_db():
     exit(1)
 
 
+def migrate_db():
+    with app.app_context():
+        applied = run_migrations()
+        for version in applied:
+            print_colored(f"[DB_MIGRATE] - Applied migration {version}", 42)
+        if not applied:
+            print_colored("[DB_MIGRATE] - Database schema is up to date.", 42)
+
+        if app.config['SENSOR_DATA_PARTITIONING']:
+            print_colored("[DB_MIGRATE] - Checking SensorData partitioning...", 44)
+            if enable_sensor_data_partitioning(app.config['SENSOR_DATA_PARTITIONS_AHEAD']):
+                print_colored("[DB_MIGRATE] - SensorData is now partitioned by month.", 42)
+
+
+def maintain_partitions():
+    # Keep future monthly partitions available and drop the ones past the retention period
+    while True:
+        with app.app_context():
+            try:
+                created = ensure_sensor_data_partitions(app.config['SENSOR_DATA_PARTITIONS_AHEAD'])
+                if created:
+                    print_colored(f"[DB_PARTITION] - Created partitions {', '.join(created)}", 42)
+                if app.config['SENSOR_DATA_RETENTION_MONTHS'] > 0:
+                    dropped = drop_sensor_data_partitions(app.config['SENSOR_DATA_RETENTION_MONTHS'])
+                    if dropped:
+                        print_colored(f"[DB_PARTITION] - Dropped partitions {', '.join(dropped)}", 42)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                print_colored(f"[DB_PARTITION] - Partition maintenance failed: {e}", 41)
+        time.sleep(24 * 60 * 60)
+
+
+def warm_latest_readings():
+    # Loaded before the first sensor board request instead of by it
+    with app.app_context():
+        try:
+            latest_readings.ensure_loaded()
+        except SQLAlchemyError as e:
+            print_colored(f"[LATEST] - Loading the latest readings failed, retried on first use: {e}", 41)
+
+
 def run_mqtt_subscription():
     time.sleep(3)
-    subprocess.call(['python', 'mqtt_subscription.py'])
+    if SUBSCRIBER_RUNTIME == 'asyncio':
+        subprocess.call(['python', 'mqtt_subscription_async.py'])
+    else:
+        subprocess.call(['python', 'mqtt_subscription.py'])
 
 
 def run_sensor_threshold_alert():
@@ -54,7 +106,16 @@ if __name__ == '__main__':
     print_ascii_logo(logo_text, font="standard")
 
     wait_for_db()
+    migrate_db()
+
+    if app.config['SENSOR_DATA_PARTITIONING']:
+        threading.Thread(target=maintain_partitions, daemon=True).start()
+    threading.Thread(target=warm_latest_readings, daemon=True).start()
 
     threading.Thread(target=run_mqtt_subscription).start()
-    threading.Thread(target=run_sensor_threshold_alert).start()
+    if STREAMING_ALERTS:
+        # Thresholds are evaluated by the MQTT subscriber as readings arrive
+        print_colored("[ALERT_SYS] - Streaming alerts enabled, polling threshold evaluator not started.", 44)
+    else:
+        threading.Thread(target=run_sensor_threshold_alert).start()
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -1,13 +1,15 @@
 # sensor_threshold_alert.py
 
+import os
 import threading
 import time
 from datetime import datetime, timedelta
 
+import numpy as np
 import requests
-import yaml
-from watchdog.events import FileSystemEventHandler
-from watchdog.observers import Observer
+
+from config_watcher import RESUBSCRIBE_FIELDS, ConfigWatcher
+from lookup_cache import SensorLookup
 
 SUBSCRIPTION_FILE_PATH = 'subscriptions.yaml'
 API_BASE_URL = 'http://localhost:5000/api'
@@ -16,24 +18,61 @@ AVE_TIME_RANGE_THRESHOLD = 60
 CHECK_INTERVAL = 60
 TIME_LAG = 0
 
+SENSOR_TYPES = ['Temperature', 'Humidity', 'CO2 Concentration']
 
-def load_subscription_config():
-    with open(SUBSCRIPTION_FILE_PATH, 'r') as file:
-        return yaml.safe_load(file)
+# A breached limit clears only once the average is back inside by this fraction of the min..max span
+# (or of the limit itself when only one side is configured), so values hovering at a limit do not flap
+ALERT_HYSTERESIS = float(os.getenv('ALERT_HYSTERESIS', 0.05))
 
 
 class SensorThresholdAlert:
     def __init__(self):
         self.subscriptions = {}
         self.lock = threading.Lock()
-        self.load_config()
-
-    def load_config(self):
-        config = load_subscription_config()
-        for subscription in config['subscriptions']:
+        self.lookup = SensorLookup()
+        self.sensor_names = []
+        self.threshold_matrix = np.empty((0, len(SENSOR_TYPES), 2))
+        self.band_matrix = np.empty((0, len(SENSOR_TYPES), 2))
+        self.breached = np.zeros((0, len(SENSOR_TYPES), 2), dtype=bool)  # Limits currently breached
+        self.statuses = {}  # Last status sent per sensor name, used when the stored ones cannot be read
+        self.watcher = ConfigWatcher(SUBSCRIPTION_FILE_PATH, self.apply_config_changes)
+        self.load_config(self.watcher.load())
+
+    def load_config(self, subscriptions):
+        for subscription in subscriptions.values():
             self.subscriptions[subscription['sensor_name']] = {
-                'thresholds': self.extract_thresholds(subscription.get('metadata', {}))
+                'thresholds': self.extract_thresholds(subscription.get('metadata') or [])
             }
+        self.sensor_names, self.threshold_matrix, self.band_matrix = self.build_threshold_matrix(self.subscriptions)
+        self.breached = np.zeros(self.threshold_matrix.shape, dtype=bool)
+
+    @staticmethod
+    def build_threshold_matrix(subscriptions):
+        # sensors x SENSOR_TYPES x (min, max) limits and hysteresis bands, NaN where no limit is configured
+        sensor_names = list(subscriptions.keys())
+        matrix = np.full((len(sensor_names), len(SENSOR_TYPES), 2), np.nan)
+        bands = np.full((len(sensor_names), len(SENSOR_TYPES), 2), np.nan)
+        for row, sensor_name in enumerate(sensor_names):
+            thresholds = subscriptions[sensor_name]['thresholds']
+            hysteresis = SensorThresholdAlert.hysteresis_bands(thresholds)
+            for column, sensor_type in enumerate(SENSOR_TYPES):
+                for index, limit_key in enumerate(('min', 'max')):
+                    limit = thresholds.get(f"{sensor_type}_{limit_key}")
+                    if limit is not None:
+                        matrix[row, column, index] = limit
+                        bands[row, column, index] = hysteresis[f"{sensor_type}_{limit_key}"]
+        return sensor_names, matrix, bands
+
+    @staticmethod
+    def hysteresis_bands(thresholds):
+        # "Temperature_max" -> distance the average has to come back inside before the breach clears
+        bands = {}
+        for threshold_key, limit in thresholds.items():
+            sensor_type, limit_key = threshold_key.rsplit('_', 1)
+            low, high = thresholds.get(f"{sensor_type}_min"), thresholds.get(f"{sensor_type}_max")
+            span = high - low if low is not None and high is not None else abs(limit)
+            bands[threshold_key] = ALERT_HYSTERESIS * span
+        return bands
 
     @staticmethod
     def extract_thresholds(metadata):
@@ -51,111 +90,218 @@ class SensorThresholdAlert:
 
     def monitor_sensors(self):
         while True:
-            with self.lock:
-                for sensor_name, data in self.subscriptions.items():
-                    sensor_data = self.get_sensor_data(sensor_name, AVE_TIME_RANGE_THRESHOLD)
-                    if sensor_data:
-                        self.evaluate_thresholds(sensor_name, sensor_data, data['thresholds'])
-            time.sleep(CHECK_INTERVAL)  # Check every 60 seconds
-
-    def get_sensor_data(self, sensor_name, time_range):
+            start = time.perf_counter()
+            try:
+                self.evaluate_cycle()
+            except Exception as e:
+                print_colored(f"Threshold evaluation failed: {e}", '41')
+            time.sleep(max(0.0, CHECK_INTERVAL - (time.perf_counter() - start)))  # Check every 60 seconds
+
+    def evaluate_cycle(self):
+        with self.lock:
+            sensor_names, threshold_matrix, band_matrix = self.sensor_names, self.threshold_matrix, self.band_matrix
+            breached = self.breached
+        if not sensor_names:
+            return
+
+        start = time.perf_counter()
+        # One aggregate request per cycle for all sensors, laid out as a sensors x types matrix
+        sensors_data = self.get_sensors_data(sensor_names, AVE_TIME_RANGE_THRESHOLD)
+        averages = np.full((len(sensor_names), len(SENSOR_TYPES)), np.nan)
+        for row, sensor_name in enumerate(sensor_names):
+            for column, sensor_type in enumerate(SENSOR_TYPES):
+                average_value = sensors_data.get(sensor_name, {}).get(sensor_type)
+                if average_value is not None:
+                    averages[row, column] = average_value
+        fetched = time.perf_counter()
+
+        # NaN compares false, so missing limits never breach. A breached limit stays breached until the average
+        # is back inside by its hysteresis band, and keeps its state while a sensor reports no data.
+        was_below, was_above = breached[:, :, 0], breached[:, :, 1]
+        with np.errstate(invalid='ignore'):
+            below = ((averages < threshold_matrix[:, :, 0]) |
+                     (was_below & (averages < threshold_matrix[:, :, 0] + band_matrix[:, :, 0])))
+            above = ((averages > threshold_matrix[:, :, 1]) |
+                     (was_above & (averages > threshold_matrix[:, :, 1] - band_matrix[:, :, 1])))
+        missing = np.isnan(averages)
+        below = np.where(missing, was_below, below)
+        above = np.where(missing, was_above, above)
+        new_below, new_above = below & ~was_below, above & ~was_above
+        has_data = ~missing.all(axis=1)
+        warning = (below | above).any(axis=1)
+        evaluated = time.perf_counter()
+
+        alert_count = 0
+        status_changes = 0
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rows = np.flatnonzero(has_data)
+        stored_statuses = self.get_stored_statuses([sensor_names[row] for row in rows])
+        for row in rows:
+            sensor_name = sensor_names[row]
+            # Only limits that were not breached in the previous cycle raise an alert
+            if new_below[row].any() or new_above[row].any():
+                alerts = self.describe_breaches(averages[row], threshold_matrix[row], new_below[row], new_above[row])
+                failed = self.trigger_alert(timestamp, sensor_name, "threshold breach", alerts)
+                # Undelivered alerts are not recorded as breached, so the next cycle raises them again
+                for condition in failed:
+                    sensor_type, limit_key = condition.rsplit('_', 1)
+                    (below if limit_key == 'min' else above)[row, SENSOR_TYPES.index(sensor_type)] = False
+                alert_count += len(alerts) - len(failed)
+
+            # The subscriber writes normal and offline to the same status: compare with the stored one, not only
+            # with what this process sent last. Offline and disabled are left to the subscriber and the operator.
+            status = 'warning' if warning[row] else 'normal'
+            current = stored_statuses.get(sensor_name, self.statuses.get(sensor_name))
+            if current in ('offline', 'disabled') or current == status:
+                continue
+            try:
+                self.update_sensor_status(sensor_name, status)
+                self.statuses[sensor_name] = status
+                status_changes += 1
+            except requests.RequestException as e:
+                print_colored(f"Failed to update the status of {sensor_name}: {e}", "41")
+
+        with self.lock:
+            if self.sensor_names is sensor_names:  # Not reloaded meanwhile
+                self.breached = np.stack((below, above), axis=2)
+
+        print_colored(f"Evaluated {len(sensor_names)} sensors ({int(has_data.sum())} with data) in "
+                      f"{(time.perf_counter() - start) * 1000:.1f} ms (fetch {(fetched - start) * 1000:.1f} ms, "
+                      f"evaluate {(evaluated - fetched) * 1000:.2f} ms): {status_changes} status changes, "
+                      f"{alert_count} alerts", '42')
+
+    @staticmethod
+    def describe_breaches(averages, thresholds, below, above):
+        alerts = []
+        for column in np.flatnonzero(below | above):
+            sensor_type, average_value = SENSOR_TYPES[column], averages[column]
+            if below[column]:
+                alerts.append((f"{sensor_type}_min", f"{sensor_type} below minimum threshold: "
+                                                     f"{average_value:.2f} < {thresholds[column, 0]:g}"))
+            if above[column]:
+                alerts.append((f"{sensor_type}_max", f"{sensor_type} above maximum threshold: "
+                                                     f"{average_value:.2f} > {thresholds[column, 1]:g}"))
+        return alerts
+
+    def get_sensors_data(self, sensor_names, time_range):
         now = datetime.now()
         start_time = (now - timedelta(seconds=time_range) + timedelta(hours=TIME_LAG)).strftime('%Y-%m-%d %H:%M:%S')
         end_time = (now + timedelta(hours=TIME_LAG)).strftime('%Y-%m-%d %H:%M:%S')
-        sensor_id = self.get_sensor_id(sensor_name)
-        if sensor_id is None:
-            return None
-
-        type_ids = {
-            'Temperature': self.get_type_id('Temperature'),
-            'Humidity': self.get_type_id('Humidity'),
-            'CO2 Concentration': self.get_type_id('CO2 Concentration')
-        }
-
-        sensor_data = {}
-        for sensor_type, type_id in type_ids.items():
-            response = requests.get(f'{API_BASE_URL}/data', params={
-                'sensor_id': sensor_id,
-                'type_id': type_id,
-                'start_time': start_time,
-                'end_time': end_time
-            })
-            if response.status_code == 200:
-                data = response.json()
-                if data:
-                    sensor_data[sensor_type] = sum(d['value'] for d in data) / len(data)
-
-        return sensor_data
-
-    @staticmethod
-    def get_type_id(type_name):
-        response = requests.get(f'{API_BASE_URL}/types/name/{type_name}')
-        if response.status_code == 200:
-            return response.json()['type_id']
-        return None
 
-    def evaluate_thresholds(self, sensor_name, sensor_data, thresholds):
-        alerts = []
-        alert_type = "threshold breach"  # This is a descriptive alert type
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Get the current timestamp
-
-        for sensor_type, average_value in sensor_data.items():
-            min_key = f"{sensor_type}_min"
-            max_key = f"{sensor_type}_max"
-            if min_key in thresholds and average_value < thresholds[min_key]:
-                alerts.append(f"{sensor_type} below minimum threshold: {average_value:.2f} < {thresholds[min_key]}")
-            if max_key in thresholds and average_value > thresholds[max_key]:
-                alerts.append(f"{sensor_type} above maximum threshold: {average_value:.2f} > {thresholds[max_key]}")
-
-        if alerts:
-            self.trigger_alert(timestamp, sensor_name, alert_type, alerts)
-            self.update_sensor_status(sensor_name, 'warning')
-        else:
-            self.update_sensor_status(sensor_name, 'normal')
+        sensor_names_by_id = {}
+        for sensor_name in sensor_names:
+            sensor_id = self.get_sensor_id(sensor_name)
+            if sensor_id is not None:
+                sensor_names_by_id[sensor_id] = sensor_name
+        if not sensor_names_by_id:
+            return {}
+
+        type_names_by_id = {self.get_type_id(sensor_type): sensor_type for sensor_type in SENSOR_TYPES}
+
+        response = requests.post(f'{API_BASE_URL}/data/aggregate', json={
+            'sensor_ids': list(sensor_names_by_id.keys()),
+            'type_ids': [type_id for type_id in type_names_by_id if type_id is not None],
+            'start_time': start_time,
+            'end_time': end_time
+        })
+        if response.status_code != 200:
+            return {}
+
+        sensors_data = {}
+        for aggregate in response.json():
+            sensor_name = sensor_names_by_id.get(aggregate['sensor_id'])
+            sensor_type = type_names_by_id.get(aggregate['type_id'])
+            if sensor_name and sensor_type and aggregate['count']:
+                sensors_data.setdefault(sensor_name, {})[sensor_type] = aggregate['avg']
+
+        return sensors_data
+
+    def get_type_id(self, type_name):
+        return self.lookup.get_type_id(type_name)
 
     def trigger_alert(self, timestamp, sensor_name, alert_type, alerts):
-        # Placeholder for alert triggering logic, e.g., sending an email or push notification
-        for alert in alerts:
+        # Sends each alert on its own so that one failure does not hold back the others; returns the conditions
+        # whose alert could not be delivered
+        failed = []
+        for condition, alert in alerts:
             print_colored(f'[{timestamp}] ALERT: {sensor_name} - {alert_type} - {alert}', '43')
             alert_payload = {
                 'sensor_id': self.get_sensor_id(sensor_name),
                 'alert_type': alert_type,
                 'message': alert,
+                'condition': condition,  # The API updates the open alert for the same condition
             }
-            response = requests.post(f'{API_BASE_URL}/alerts', json=alert_payload)
-            if response.status_code not in [201]:
-                raise (Exception('Alert send failed'))
+            try:
+                response = requests.post(f'{API_BASE_URL}/alerts', json=alert_payload)
+                if response.status_code not in [200, 201]:
+                    raise Exception(f'status {response.status_code}')
+            except Exception as e:
+                print_colored(f"Alert send failed for {sensor_name} ({condition}): {e}", "41")
+                failed.append(condition)
+        return failed
+
+    def get_stored_statuses(self, sensor_names):
+        # Current status per sensor name, read in one request; empty when it fails, the last sent ones are used then
+        sensor_names_by_id = {}
+        for sensor_name in sensor_names:
+            sensor_id = self.get_sensor_id(sensor_name)
+            if sensor_id is not None:
+                sensor_names_by_id[sensor_id] = sensor_name
+        if not sensor_names_by_id:
+            return {}
+        try:
+            response = requests.post(f'{API_BASE_URL}/sensors/status/current',
+                                     json={'sensor_ids': list(sensor_names_by_id)})
+        except requests.RequestException:
+            return {}
+        if response.status_code != 200:
+            return {}
+        return {sensor_names_by_id[current['sensor_id']]: current['status'] for current in response.json()
+                if current['sensor_id'] in sensor_names_by_id}
 
     def update_sensor_status(self, sensor_name, status):
         sensor_id = self.get_sensor_id(sensor_name)
         if sensor_id:
-            sensor = requests.get(f'{API_BASE_URL}/sensors/{sensor_id}').json()
-            if sensor['status'] != 'deleted':
+            # The subscriber deletes sensors, so existence is not taken from this process' cache
+            if self.lookup.sensor_exists(sensor_id, cached=False):
                 status_data = {'status': status}
                 requests.put(f'{API_BASE_URL}/sensors/{sensor_id}/status', json=status_data)
+            else:
+                # Deleted or replaced by a new device id: look the name up again next cycle
+                self.lookup.invalidate_sensor(sensor_id=sensor_id, sensor_name=sensor_name)
 
-    @staticmethod
-    def get_sensor_id(sensor_name):
-        response = requests.get(f'{API_BASE_URL}/sensors/sensor_id', params={'sensor_name': sensor_name})
-        if response.status_code == 200 and response.json():
-            return response.json()['sensor_id']
-        return None
+    def get_sensor_id(self, sensor_name):
+        return self.lookup.get_sensor_id(sensor_name)
 
-    def reload_config(self):
+    def apply_config_changes(self, subscriptions, added, removed, changed):
+        # Called by the config watcher with the per-subscription diff of subscriptions.yaml. Only sensors whose
+        # thresholds changed lose their breach state and last status; the others keep them.
         with self.lock:
-            self.subscriptions = {}
-            self.load_config()
-            print_colored("Config reloaded.", '42')
-
-
-class ConfigFileEventHandler(FileSystemEventHandler):
-    def __init__(self, _monitor):
-        self.monitor = _monitor
-
-    def on_modified(self, event):
-        if event.src_path.endswith(SUBSCRIPTION_FILE_PATH):
-            print_colored("Subscription file changed, reloading thresholds...", '44')
-            self.monitor.reload_config()
+            updated = set()
+            for sensor_name in removed:
+                self.subscriptions.pop(sensor_name, None)
+                self.statuses.pop(sensor_name, None)
+                self.lookup.invalidate_sensor(sensor_name=sensor_name)
+            for sensor_name in list(added) + list(changed):
+                thresholds = self.extract_thresholds(subscriptions[sensor_name].get('metadata') or [])
+                if self.subscriptions.get(sensor_name, {}).get('thresholds') != thresholds:
+                    self.subscriptions[sensor_name] = {'thresholds': thresholds}
+                    self.statuses.pop(sensor_name, None)
+                    updated.add(sensor_name)
+                if changed.get(sensor_name, set()) & RESUBSCRIBE_FIELDS:
+                    self.lookup.invalidate_sensor(sensor_name=sensor_name)  # Registered again by the subscriber
+            if not removed and not updated:
+                return
+
+            previous_rows = {sensor_name: row for row, sensor_name in enumerate(self.sensor_names)}
+            sensor_names, threshold_matrix, band_matrix = self.build_threshold_matrix(self.subscriptions)
+            breached = np.zeros(threshold_matrix.shape, dtype=bool)
+            for row, sensor_name in enumerate(sensor_names):
+                if sensor_name not in updated and sensor_name in previous_rows:
+                    breached[row] = self.breached[previous_rows[sensor_name]]
+            self.sensor_names, self.threshold_matrix, self.band_matrix = sensor_names, threshold_matrix, band_matrix
+            self.breached = breached
+            print_colored(f"Thresholds reloaded: {len(updated)} updated, {len(removed)} removed.", '42')
 
 
 def print_colored(_text, color_code):
@@ -167,15 +313,10 @@ if __name__ == '__main__':
     monitor = SensorThresholdAlert()
     threading.Thread(target=monitor.monitor_sensors).start()
 
-    # Set up file system event handler to monitor the config file
-    event_handler = ConfigFileEventHandler(monitor)
-    observer = Observer()
-    observer.schedule(event_handler, path='.', recursive=False)
-    observer.start()
+    monitor.watcher.start()
 
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        observer.stop()
-    observer.join()
+        monitor.watcher.stop()
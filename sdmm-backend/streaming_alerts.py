@@ -0,0 +1,187 @@
+# streaming_alerts.py
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import requests
+
+from sensor_threshold_alert import AVE_TIME_RANGE_THRESHOLD, SensorThresholdAlert
+
+API_BASE_URL = 'http://localhost:5000/api'
+
+# Evaluate thresholds in the subscriber as readings arrive instead of polling the database in
+# sensor_threshold_alert.py, which run.py then does not start
+STREAMING_ALERTS = os.getenv('STREAMING_ALERTS', 'false').lower() == 'true'
+STREAMING_ALERTS_STATS_INTERVAL = int(os.getenv('STREAMING_ALERTS_STATS_INTERVAL', 60))
+SEND_RETRIES = 5
+
+
+class RollingWindow:
+    # Sum and count of the values received in the last `window` seconds, updated in O(1) amortized
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.sum = 0.0
+
+    def add(self, received_at, value):
+        self.values.append((received_at, value))
+        self.sum += value
+        horizon = received_at - self.window
+        while self.values[0][0] < horizon:
+            self.sum -= self.values.popleft()[1]
+
+    def average(self):
+        return self.sum / len(self.values) if self.values else None
+
+
+class StreamingThresholdEvaluator:
+    def __init__(self, window=AVE_TIME_RANGE_THRESHOLD, stats_interval=STREAMING_ALERTS_STATS_INTERVAL):
+        self.window = window
+        self.stats_interval = stats_interval
+        self.thresholds = {}  # sensor name -> {"Temperature_max": 29.0, ...}
+        self.bands = {}  # sensor name -> hysteresis band per threshold key
+        self.windows = {}  # (sensor name, type name) -> RollingWindow
+        self.breaches = {}  # sensor name -> set of breached "Type_min"/"Type_max" keys
+        self.statuses = {}  # sensor name -> last status sent
+        self.lock = threading.RLock()
+        self.actions = queue.Queue()
+        self.session = requests.Session()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.alerts = 0
+        self.status_changes = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        if self.stats_interval > 0:
+            threading.Thread(target=self.report_stats, daemon=True).start()
+
+    def set_subscription(self, subscription):
+        with self.lock:
+            thresholds = SensorThresholdAlert.extract_thresholds(subscription.get('metadata') or [])
+            self.thresholds[subscription['sensor_name']] = thresholds
+            self.bands[subscription['sensor_name']] = SensorThresholdAlert.hysteresis_bands(thresholds)
+            self.breaches.pop(subscription['sensor_name'], None)
+            self.statuses.pop(subscription['sensor_name'], None)
+
+    def remove_subscription(self, sensor_name):
+        with self.lock:
+            self.thresholds.pop(sensor_name, None)
+            self.bands.pop(sensor_name, None)
+            self.breaches.pop(sensor_name, None)
+            self.statuses.pop(sensor_name, None)
+            for key in [key for key in self.windows if key[0] == sensor_name]:
+                del self.windows[key]
+
+    def reset(self, sensor_name):
+        # Another status was written for the sensor (offline, reconnected): the next reading sends its status again
+        with self.lock:
+            self.statuses.pop(sensor_name, None)
+
+    def evaluate(self, sensor_name, sensor_id, values, received_at):
+        # Runs on the MQTT network thread for every decoded message: no I/O here, actions go to the worker
+        with self.lock:
+            thresholds = self.thresholds.get(sensor_name)
+            if not thresholds:
+                return
+            bands = self.bands[sensor_name]
+            previous = self.breaches.get(sensor_name, set())
+
+            # A breached limit clears only once the average is back inside by its hysteresis band
+            breached = set()
+            averages = {}
+            for type_name, value in values.items():
+                window = self.windows.get((sensor_name, type_name))
+                if window is None:
+                    window = self.windows[(sensor_name, type_name)] = RollingWindow(self.window)
+                window.add(received_at, value)
+                average_value = averages[type_name] = window.average()
+
+                min_key, max_key = f"{type_name}_min", f"{type_name}_max"
+                if min_key in thresholds and (average_value < thresholds[min_key] or (
+                        min_key in previous and average_value < thresholds[min_key] + bands[min_key])):
+                    breached.add(min_key)
+                if max_key in thresholds and (average_value > thresholds[max_key] or (
+                        max_key in previous and average_value > thresholds[max_key] - bands[max_key])):
+                    breached.add(max_key)
+
+            self.breaches[sensor_name] = breached
+            status = 'warning' if breached else 'normal'
+            status_changed = self.statuses.get(sensor_name) != status
+            self.statuses[sensor_name] = status
+
+        # Alert once when a limit starts being breached, write the status only when it changes
+        for key in sorted(breached - previous):
+            type_name, limit_key = key.rsplit('_', 1)
+            if limit_key == 'min':
+                message = f"{type_name} below minimum threshold: {averages[type_name]:.2f} < {thresholds[key]}"
+            else:
+                message = f"{type_name} above maximum threshold: {averages[type_name]:.2f} > {thresholds[key]}"
+            self.actions.put(('alert', sensor_name, sensor_id, (key, message), received_at))
+        if status_changed:
+            self.actions.put(('status', sensor_name, sensor_id, status, received_at))
+
+    def run(self):
+        while True:
+            action, sensor_name, sensor_id, detail, received_at = self.actions.get()
+            try:
+                if action == 'alert':
+                    condition, message = detail
+                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    print_colored(f'[{timestamp}] ALERT: {sensor_name} - threshold breach - {message}', '43')
+                    # 200 when the API folded it into the open alert for the same condition
+                    self.send('post', '/alerts', (200, 201), {
+                        'sensor_id': sensor_id,
+                        'alert_type': 'threshold breach',
+                        'message': message,
+                        'condition': condition,
+                    })
+                else:
+                    self.send('put', f'/sensors/{sensor_id}/status', (200,), {'status': detail})
+            except Exception as e:
+                print_colored(f"Failed to send {action} for {sensor_name}: {e}", "41")
+                if action == 'status':
+                    self.reset(sensor_name)  # Retried with the next reading
+                continue
+
+            latency = time.monotonic() - received_at
+            with self.lock:
+                if action == 'alert':
+                    self.alerts += 1
+                else:
+                    self.status_changes += 1
+                self.latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+    def send(self, method, path, expected_statuses, payload):
+        # A brand-new sensor may not be registered yet when its first reading is evaluated
+        for _ in range(SEND_RETRIES):
+            response = self.session.request(method, f'{API_BASE_URL}{path}', json=payload)
+            if response.status_code != 404:
+                break
+            time.sleep(0.5)
+        if response.status_code not in expected_statuses:
+            raise Exception(f'{method.upper()} {path} failed with status {response.status_code}')
+
+    def report_stats(self):
+        while True:
+            time.sleep(self.stats_interval)
+            with self.lock:
+                sent = self.alerts + self.status_changes
+                if sent:
+                    print_colored(f"{self.alerts} alerts, {self.status_changes} status changes, reading to API "
+                                  f"latency avg {self.latency / sent * 1000:.1f} ms / "
+                                  f"max {self.max_latency * 1000:.1f} ms", "42")
+                self.reset_stats()
+
+
+def print_colored(_text, color_code):
+    _text = "[STREAM_ALERT] - " + _text
+    print(f"\033[{color_code}m{_text}\033[0m", flush=True)
@@ -0,0 +1,38 @@
+# tests/test_config_watcher.py
+
+from config_watcher import OFFLINE_THRESHOLD, diff_subscriptions, offline_threshold, parse_subscriptions
+
+
+def subscription(sensor_name, **fields):
+    return dict({'sensor_name': sensor_name, 'broker_address': 'localhost', 'broker_port': 1883,
+                 'topic': f'sensor/{sensor_name}', 'sensor_types': ['Temperature'], 'metadata': None}, **fields)
+
+
+def test_added_removed_and_changed():
+    old = {name: subscription(name) for name in ('a', 'b', 'c')}
+    new = {'a': subscription('a'), 'b': subscription('b', topic='sensor/other'), 'd': subscription('d')}
+    assert diff_subscriptions(old, new) == (['d'], ['c'], {'b': {'topic'}})
+
+
+def test_empty_values_are_unchanged():
+    old = {'a': subscription('a', metadata=None, username=None)}
+    new = {'a': subscription('a', metadata=[])}
+    assert diff_subscriptions(old, new) == ([], [], {})
+
+
+def test_metadata_change():
+    old = {'a': subscription('a')}
+    new = {'a': subscription('a', metadata=[{'max_silence': 60}])}
+    assert diff_subscriptions(old, new) == ([], [], {'a': {'metadata'}})
+
+
+def test_parse_subscriptions_by_sensor_name():
+    content = b'subscriptions:\n  - sensor_name: a\n    topic: sensor/a\n  - sensor_name: b\n    topic: sensor/b\n'
+    assert list(parse_subscriptions(content)) == ['a', 'b']
+    assert parse_subscriptions(b'') == {}
+
+
+def test_offline_threshold_follows_metadata():
+    assert offline_threshold(subscription('a')) == OFFLINE_THRESHOLD
+    metadata = [{'batch_span': 5}, {'max_silence': '60'}, 'ignored', {'max_silence': 'invalid'}]
+    assert offline_threshold(subscription('a', metadata=metadata)) == 60 + OFFLINE_THRESHOLD
@@ -0,0 +1,62 @@
+# tests/test_deadlines.py
+
+from deadlines import DeadlineHeap
+
+
+def test_keys_expire_in_deadline_order():
+    deadlines = DeadlineHeap()
+    deadlines.touch('b', 20)
+    deadlines.touch('a', 10)
+    assert deadlines.pop_expired(5) == []
+    assert deadlines.pop_expired(10) == ['a']
+    assert deadlines.pop_expired(25) == ['b']
+    assert deadlines.pop_expired(100) == []
+
+
+def test_touch_postpones_expiry():
+    deadlines = DeadlineHeap()
+    deadlines.touch('a', 10)
+    deadlines.touch('a', 30)
+    assert deadlines.pop_expired(15) == []
+    assert deadlines.pop_expired(30) == ['a']
+
+
+def test_touch_keeps_one_heap_entry_per_key():
+    deadlines = DeadlineHeap()
+    for deadline in range(100):
+        deadlines.touch('a', deadline)
+    assert len(deadlines.heap) == 1
+    assert deadlines.pop_expired(99) == ['a']
+
+
+def test_removed_key_does_not_expire():
+    deadlines = DeadlineHeap()
+    deadlines.touch('a', 10)
+    deadlines.touch('b', 10)
+    deadlines.remove('a')
+    assert deadlines.pop_expired(20) == ['b']
+    assert deadlines.heap == [] and deadlines.scheduled == set()
+    deadlines.remove('a')  # Already removed
+
+
+def test_touch_after_remove_uses_new_deadline():
+    deadlines = DeadlineHeap()
+    deadlines.touch('a', 10)
+    deadlines.remove('a')
+    deadlines.touch('a', 50)
+    assert deadlines.pop_expired(20) == []
+    assert deadlines.pop_expired(50) == ['a']
+
+
+def test_expired_key_can_be_touched_again():
+    deadlines = DeadlineHeap()
+    deadlines.touch('a', 10)
+    assert deadlines.pop_expired(10) == ['a']
+    deadlines.touch('a', 40)
+    assert deadlines.pop_expired(40) == ['a']
+
+
+def test_wait_expired_returns_passed_deadlines():
+    deadlines = DeadlineHeap()
+    deadlines.touch('a', 0)
+    assert deadlines.wait_expired() == ['a']
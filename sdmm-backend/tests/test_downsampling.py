@@ -0,0 +1,45 @@
+# tests/test_downsampling.py
+
+import numpy as np
+import pytest
+
+from app.downsampling import DOWNSAMPLING_METHODS, downsample
+
+
+def series(n, seed=0):
+    timestamps = np.datetime64('2024-01-01T00:00:00') + np.arange(n).astype('timedelta64[s]')
+    values = np.random.default_rng(seed).normal(20, 5, n).cumsum()
+    return timestamps, values
+
+
+@pytest.mark.parametrize('method', DOWNSAMPLING_METHODS)
+@pytest.mark.parametrize('n', [1, 2, 5, 100, 1001])
+@pytest.mark.parametrize('max_points', [1, 2, 3, 4, 7, 50, 1000])
+def test_never_exceeds_max_points(method, n, max_points):
+    timestamps, values = series(n)
+    sampled_timestamps, sampled_values = downsample(timestamps, values, max_points, method)
+    assert len(sampled_timestamps) == len(sampled_values) <= max_points
+    # A subset of the input, in time order
+    assert np.all(np.diff(sampled_timestamps.astype(np.int64)) > 0)
+    positions = np.searchsorted(timestamps, sampled_timestamps)
+    assert np.array_equal(values[positions], sampled_values)
+
+
+def test_short_series_is_returned_unchanged():
+    timestamps, values = series(10)
+    sampled_timestamps, sampled_values = downsample(timestamps, values, 10)
+    assert sampled_timestamps is timestamps and sampled_values is values
+
+
+@pytest.mark.parametrize('max_points', [3, 10, 100])
+def test_lttb_keeps_endpoints(max_points):
+    timestamps, values = series(1000)
+    sampled_timestamps, _ = downsample(timestamps, values, max_points, 'lttb')
+    assert len(sampled_timestamps) == max_points
+    assert sampled_timestamps[0] == timestamps[0] and sampled_timestamps[-1] == timestamps[-1]
+
+
+def test_minmax_keeps_extremes():
+    timestamps, values = series(1000)
+    _, sampled_values = downsample(timestamps, values, 20, 'minmax')
+    assert sampled_values.min() == values.min() and sampled_values.max() == values.max()
@@ -0,0 +1,66 @@
+# tests/test_mqtt_pool.py
+
+import pytest
+
+from mqtt_pool import BrokerConnection, TopicTrie
+
+
+def matches(trie, topic):
+    return sorted(trie.match(topic))
+
+
+@pytest.fixture
+def trie():
+    trie = TopicTrie()
+    for topic_filter in ('sensors/room1/temperature', 'sensors/+/temperature', 'sensors/#', 'sensors/room1/#',
+                         '+/+', '#'):
+        trie.add(topic_filter, topic_filter, topic_filter)
+    return trie
+
+
+def test_exact_and_wildcard_matches(trie):
+    assert matches(trie, 'sensors/room1/temperature') == sorted(
+        ['sensors/room1/temperature', 'sensors/+/temperature', 'sensors/#', 'sensors/room1/#', '#'])
+
+
+def test_plus_matches_exactly_one_level(trie):
+    assert matches(trie, 'sensors/room2/temperature') == sorted(['sensors/+/temperature', 'sensors/#', '#'])
+    assert matches(trie, 'sensors/room2') == sorted(['sensors/#', '+/+', '#'])
+    assert 'sensors/+/temperature' not in matches(trie, 'sensors/room2/temperature/raw')
+
+
+def test_hash_matches_its_parent_level(trie):
+    assert matches(trie, 'sensors') == sorted(['sensors/#', '#'])
+    assert matches(trie, 'sensors/room1') == sorted(['sensors/#', 'sensors/room1/#', '+/+', '#'])
+
+
+def test_unrelated_topic_only_matches_root_hash(trie):
+    assert matches(trie, 'alerts/room1/temperature') == ['#']
+
+
+def test_several_subscriptions_on_one_filter():
+    trie = TopicTrie()
+    trie.add('sensor/data', 'Sensor A', 'a')
+    trie.add('sensor/data', 'Sensor B', 'b')
+    trie.remove('sensor/data', 'Sensor A')
+    assert trie.match('sensor/data') == ['b']
+
+
+def test_remove_prunes_empty_branches(trie):
+    for topic_filter in ('sensors/room1/temperature', 'sensors/+/temperature', 'sensors/#', 'sensors/room1/#'):
+        trie.remove(topic_filter, topic_filter)
+    assert 'sensors' not in trie.root
+    assert matches(trie, 'sensors/room1/temperature') == ['#']
+    trie.remove('sensors/room1/temperature', 'sensors/room1/temperature')  # Already removed
+    trie.remove('unknown/filter', 'unknown/filter')
+
+
+def test_connection_add_and_remove_are_repeatable():
+    connection = BrokerConnection('localhost', 1883, None, None, lambda subscription, msg: None)
+    subscription = {'sensor_name': 'Sensor A', 'topic': 'sensor/a'}
+    assert connection.add(subscription) is True
+    assert connection.add(subscription) is False
+    assert connection.filters == {'sensor/a': 1}
+    assert connection.remove(subscription) == (True, True)
+    assert connection.remove(subscription) == (False, True)
+    assert connection.trie.match('sensor/a') == []
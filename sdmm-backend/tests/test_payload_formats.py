@@ -0,0 +1,117 @@
+# tests/test_payload_formats.py
+
+import os
+import struct
+import uuid
+from datetime import datetime
+
+import pytest
+
+from payload_formats import (COMBINED, FLAG_DELTA, FRAME_HEADER, FRAME_MAGIC, FRAME_VERSION, PayloadFormatError,
+                             PayloadRegistry)
+
+PAYLOAD_FORMATS_PATH = os.path.join(os.path.dirname(__file__), '..', 'payload_formats.yaml')
+
+# Layouts of mqtt-sensors/mqtt_publisher.py
+RECORD_FORMAT = '!16sQiII'
+DELTA_FORMAT = '!ihhh'
+
+DEVICE_ID = uuid.UUID('6f1c2a3e-4b5d-4e6f-8a7b-9c0d1e2f3a4b')
+SENSOR_TYPES = ['Temperature', 'Humidity', 'CO2 Concentration']
+SAMPLES = [  # (timestamp, temperature in hundredths, humidity, co2_concentration)
+    (1700000000, 2150, 45, 410),
+    (1700000001, 2149, 46, 402),
+    (1700000002, -120, 44, 415),
+    (1700000004, -95, 44, 398),
+]
+
+
+@pytest.fixture
+def registry():
+    registry = PayloadRegistry()
+    registry.load(PAYLOAD_FORMATS_PATH)
+    return registry
+
+
+def record(sample):
+    return struct.pack(RECORD_FORMAT, DEVICE_ID.bytes, *sample)
+
+
+def frame(samples, delta=False, format_version=1, frame_version=FRAME_VERSION):
+    if delta:
+        body = record(samples[0]) + b''.join(
+            struct.pack(DELTA_FORMAT, *(value - previous_value for value, previous_value in zip(sample, previous)))
+            for previous, sample in zip(samples, samples[1:]))
+    else:
+        body = b''.join(record(sample) for sample in samples)
+    header = FRAME_HEADER.pack(FRAME_MAGIC, frame_version, FLAG_DELTA if delta else 0, format_version, len(samples))
+    return header + body
+
+
+def expected_readings(samples):
+    return [(str(DEVICE_ID), datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+             {'Temperature': temperature / 100, 'Humidity': humidity, 'CO2 Concentration': co2_concentration})
+            for timestamp, temperature, humidity, co2_concentration in samples]
+
+
+def subscription(**fields):
+    return dict({'sensor_types': SENSOR_TYPES}, **fields)
+
+
+def test_single_record_round_trip(registry):
+    assert registry.readings(record(SAMPLES[0]), subscription()) == expected_readings(SAMPLES[:1])
+
+
+def test_packed_records_round_trip(registry):
+    payload = b''.join(record(sample) for sample in SAMPLES)
+    assert registry.readings(payload, subscription()) == expected_readings(SAMPLES)
+
+
+def test_versioned_record_round_trip(registry):
+    payload = bytes([1]) + record(SAMPLES[0])
+    assert registry.for_payload(payload, subscription()).name == 'combined_v1'
+    assert registry.readings(payload, subscription()) == expected_readings(SAMPLES[:1])
+
+
+def test_subscription_format_overrides_detection(registry):
+    payload = bytes([1]) + record(SAMPLES[0])
+    assert registry.readings(payload, subscription(metadata=[{'payload_format': 'combined_v1'}])) == \
+        expected_readings(SAMPLES[:1])
+    with pytest.raises(PayloadFormatError):
+        registry.readings(payload, subscription(metadata=[{'payload_format': 'unknown'}]))
+
+
+def test_only_subscribed_types_are_returned(registry):
+    readings = registry.readings(record(SAMPLES[0]), subscription(sensor_types=['Humidity']))
+    assert readings[0][2] == {'Humidity': 45}
+
+
+@pytest.mark.parametrize('delta', [False, True])
+def test_frame_round_trip(registry, delta):
+    assert registry.readings(frame(SAMPLES, delta), subscription()) == expected_readings(SAMPLES)
+
+
+def test_delta_frame_of_one_record(registry):
+    assert registry.readings(frame(SAMPLES[:1], delta=True), subscription()) == expected_readings(SAMPLES[:1])
+
+
+@pytest.mark.parametrize('delta', [False, True])
+def test_frame_with_wrong_length(registry, delta):
+    body = frame(SAMPLES, delta)[FRAME_HEADER.size:]
+    with pytest.raises(PayloadFormatError):
+        registry.by_version[1].decode_frame(body[:-1], len(SAMPLES), FLAG_DELTA if delta else 0)
+
+
+@pytest.mark.parametrize('fields', [{'format_version': 7}, {'frame_version': FRAME_VERSION + 1}])
+def test_unknown_frame_is_not_decoded_as_frame(registry, fields):
+    assert registry.decode_frame(frame(SAMPLES, **fields)) is None
+
+
+def test_unrecognised_payload(registry):
+    with pytest.raises(PayloadFormatError):
+        registry.readings(record(SAMPLES[0])[:-1], subscription())
+
+
+def test_combined_delta_layout_matches_publisher():
+    assert COMBINED.delta_dtype.itemsize == struct.calcsize(DELTA_FORMAT)
+    assert COMBINED.record.format == RECORD_FORMAT.replace('!', '>')
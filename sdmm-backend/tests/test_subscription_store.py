@@ -0,0 +1,115 @@
+# tests/test_subscription_store.py
+
+import pytest
+import yaml
+from flask import Flask
+
+from app.models import db, Subscription
+from app.subscription_store import (SubscriptionConflict, SubscriptionNotFound, SubscriptionStore,
+                                    SubscriptionStoreError, SubscriptionStoreUnavailable, subscription_set_problems)
+
+
+def subscription(sensor_name, topic=None, **fields):
+    return dict({'sensor_name': sensor_name, 'broker_address': 'localhost', 'broker_port': 1883,
+                 'topic': topic or f'sensor/{sensor_name}', 'sensor_types': ['Temperature']}, **fields)
+
+
+def write_file(path, subscriptions):
+    path.write_text(yaml.safe_dump({'subscriptions': subscriptions}))
+
+
+@pytest.fixture
+def app():
+    # Only the Subscriptions table, which has no MySQL-only column types
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        Subscription.__table__.create(db.engine)
+        yield app
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / 'subscriptions.yaml'
+
+
+@pytest.fixture
+def store(app, path):
+    store = SubscriptionStore(str(path))
+    store.request_export = lambda: None  # Exported explicitly by the tests
+    return store
+
+
+def test_imports_file_on_first_load(store, path):
+    write_file(path, [subscription('a'), subscription('b')])
+    subscriptions, version = store.list()
+    assert [item['sensor_name'] for item in subscriptions] == ['a', 'b']
+    assert version == 1
+    assert Subscription.query.filter_by(is_deleted=False).count() == 2
+
+
+def test_create_update_delete(store):
+    # Version 1 is the import of the missing file as an empty set
+    assert store.create(subscription('a')) == 2
+    assert store.update('a', {'topic': 'sensor/moved'}) == 3
+    assert store.get('a')['topic'] == 'sensor/moved'
+    assert store.delete('a') == 4
+    with pytest.raises(SubscriptionNotFound):
+        store.get('a')
+    assert store.list() == ([], 4)
+
+
+def test_conflicts(store):
+    store.create(subscription('a'))
+    store.create(subscription('b'))
+    with pytest.raises(SubscriptionConflict):
+        store.create(subscription('a', topic='sensor/other'))
+    with pytest.raises(SubscriptionConflict):
+        store.create(subscription('c', topic='sensor/a'))
+    with pytest.raises(SubscriptionConflict):
+        store.update('b', {'sensor_name': 'a'})
+    with pytest.raises(SubscriptionStoreError):
+        store.create({'sensor_name': 'c'})
+
+
+def test_reload_from_database(app, store):
+    store.create(subscription('a'))
+    reloaded = SubscriptionStore(store.path)
+    assert reloaded.list() == ([subscription('a', username=None, password=None, metadata=None)], 2)
+
+
+def test_failed_import_refuses_writes_and_export(store, path):
+    write_file(path, [subscription('a'), {'sensor_name': 'b'}])
+    content = path.read_text()
+    with pytest.raises(SubscriptionStoreUnavailable, match=r'Entry 2 \(b\) is missing'):
+        store.list()
+    with pytest.raises(SubscriptionStoreUnavailable):
+        store.create(subscription('c'))
+    store.export()
+    assert path.read_text() == content
+
+
+def test_upload_recovers_from_failed_import(store, path):
+    path.write_text('subscriptions: [')
+    with pytest.raises(SubscriptionStoreUnavailable):
+        store.list()
+    store.replace_all([subscription('a')])
+    assert [item['sensor_name'] for item in store.list()[0]] == ['a']
+    store.export()
+    assert yaml.safe_load(path.read_text())['subscriptions'][0]['sensor_name'] == 'a'
+
+
+def test_replace_all_reports_every_problem(store):
+    with pytest.raises(SubscriptionConflict) as conflict:
+        store.replace_all([subscription('a'), subscription('a', topic='sensor/other'), subscription('b', 'sensor/a')])
+    assert str(conflict.value).count('Entry') == 2
+    with pytest.raises(SubscriptionStoreError) as error:
+        store.replace_all([subscription('a'), 'invalid', {'sensor_name': 'c'}])
+    assert not isinstance(error.value, SubscriptionConflict)
+
+
+def test_subscription_set_problems():
+    assert subscription_set_problems([subscription('a'), subscription('b')]) == ([], True)
+    problems, conflicts_only = subscription_set_problems([subscription('a'), subscription('a', 'sensor/b')])
+    assert problems == ['Entry 2 (a) uses a sensor name that is used more than once'] and conflicts_only
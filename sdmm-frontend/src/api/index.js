@@ -26,11 +26,12 @@ export default {
   updateSensorThresholds(sensorId, thresholds) {
     return apiClient.put(`/sensor_board/${sensorId}/thresholds`, { thresholds });
   },
-  queryHistoricalData(sensorId, startTime, endTime) {
+  queryHistoricalData(sensorId, startTime, endTime, maxPoints) {
     return apiClient.get(`/sensor_board/${sensorId}/history`, {
       params: {
         start_time: startTime,
         end_time: endTime,
+        max_points: maxPoints,
       },
     });
   },
@@ -78,5 +79,20 @@ export default {
 
   getSensor(sensorId) {
     return apiClient.get(`/sensors/${sensorId}`);
+  },
+  getSensorTypes() {
+    return apiClient.get(`/types`);
+  },
+
+  // Server-sent events pushed by the backend: 'readings', 'status' and 'alerts'
+  openLiveFeed(topics, sensorIds = [], maxRate = null) {
+    const params = new URLSearchParams({ topics: topics.join(',') });
+    if (sensorIds.length) {
+      params.set('sensor_id', sensorIds.join(','));
+    }
+    if (maxRate) {
+      params.set('max_rate', maxRate);
+    }
+    return new EventSource(`${import.meta.env.VITE_API_BASE_URL}/live?${params}`);
   }
 }
\ No newline at end of file
@@ -6,7 +6,7 @@ import api from '@/api';
 
 export function useSensorPieChart(autoRefresh) {
     const chart = ref(null);
-    const refreshInterval = ref(null);
+    const liveFeed = ref(null);
 
     const fetchData = () => {
         api.getSensorStatusSummary().then((response) => {
@@ -17,7 +17,9 @@ export function useSensorPieChart(autoRefresh) {
 
     const updateChart = (data) => {
         if (chart.value) {
-            chart.value.destroy();
+            chart.value.data.datasets[0].data = data;
+            chart.value.update();
+            return;
         }
         const ctx = document.getElementById('sensorPieChart').getContext('2d');
         chart.value = new Chart(ctx, {
@@ -39,26 +41,63 @@ export function useSensorPieChart(autoRefresh) {
         });
     };
 
+    // While the live feed is open the counts come from its status events: the snapshot sent on connect has
+    // the current status of every sensor, later events move one sensor. Redraws are batched per frame so
+    // that the snapshot costs one redraw, not one per sensor.
+    let statuses = {};
+    let redrawPending = false;
+
+    const onStatus = (event) => {
+        const status = JSON.parse(event.data);
+        statuses[status.sensor_id] = status.status;
+        if (!redrawPending) {
+            redrawPending = true;
+            requestAnimationFrame(() => {
+                redrawPending = false;
+                const counts = { normal: 0, warning: 0, offline: 0, disabled: 0 };
+                Object.values(statuses).forEach((value) => {
+                    if (value in counts) {
+                        counts[value] += 1;
+                    }
+                });
+                updateChart([counts.normal, counts.warning, counts.offline, counts.disabled]);
+            });
+        }
+    };
+
+    const openLiveFeed = () => {
+        liveFeed.value = api.openLiveFeed(['status']);
+        // Every (re)connect starts with a full snapshot
+        liveFeed.value.addEventListener('open', () => {
+            statuses = {};
+        });
+        liveFeed.value.addEventListener('status', onStatus);
+    };
+
+    const closeLiveFeed = () => {
+        if (liveFeed.value) {
+            liveFeed.value.close();
+            liveFeed.value = null;
+        }
+    };
+
     const toggleAutoRefresh = () => {
         if (autoRefresh.value) {
-            refreshInterval.value = setInterval(fetchData, 3000);
+            openLiveFeed();
         } else {
-            clearInterval(refreshInterval.value);
-            refreshInterval.value = null;
+            closeLiveFeed();
         }
     };
 
     onMounted(() => {
         fetchData();
         if (autoRefresh.value) {
-            refreshInterval.value = setInterval(fetchData, 3000);
+            openLiveFeed();
         }
     });
 
     onBeforeUnmount(() => {
-        if (refreshInterval.value) {
-            clearInterval(refreshInterval.value);
-        }
+        closeLiveFeed();
         if (chart.value) {
             chart.value.destroy();
         }